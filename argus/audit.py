@@ -0,0 +1,261 @@
+"""
+Audit log of changes to groups and their ledgers.
+
+Creating, editing or deleting a group, party, category or transaction adds
+an AuditEntry holding each changed field's value before and after, as
+zlib-compressed JSON. Shares are replaced wholesale whenever a transaction
+changes, so they are logged per transaction instead, as one entry mapping
+each party to its share before and after.
+
+During a request (add ``argus.audit.AuditMiddleware`` to
+MIDDLEWARE_CLASSES), entries are batched by the database transaction
+their changes are made in, since a request needn't be one transaction.
+Entries recorded in an ``argus.sharding.atomic`` block are written with
+one bulk_create as the outermost such block ends, inside its transaction,
+so they commit or roll back along with their changes; a block that
+raises drops its entries. Entries for changes that were committed as they
+were made are buffered and written once the view has returned, or has
+raised, since those changes stay either way. Entries recorded inside some
+other transaction, such as ATOMIC_REQUESTS', are written straight away,
+as they are outside requests. Entries are never changed afterwards and
+are only deleted along with their group.
+
+"""
+from contextlib import contextmanager
+import json
+import socket
+import threading
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+ACTION_CHOICES = (
+    (CREATE, 'Created'),
+    (UPDATE, 'Changed'),
+    (DELETE, 'Deleted'),
+)
+
+# The actor of changes made by group members, who share a password and so
+# can't be told apart. Not a valid username, so it can't be mistaken for one.
+MEMBER = '#member'
+
+# Left out of diffs: versions change on every save, and password hashes
+# shouldn't be copied around.
+EXCLUDED_FIELDS = ('version', 'password')
+
+_local = threading.local()
+
+
+def snapshot(instance):
+    # Deferred fields are left out rather than loaded.
+    values = instance.__dict__
+    return dict((field.attname, values[field.attname])
+                for field in instance._meta.concrete_fields
+                if field.attname in values and
+                field.attname not in EXCLUDED_FIELDS)
+
+
+def diff(before, after):
+    """
+    Returns {name: [before, after]} for the values that differ between two
+    dicts; missing values count as None.
+
+    """
+    changes = {}
+    for name in set(before) | set(after):
+        old, new = before.get(name), after.get(name)
+        if old != new:
+            changes[name] = [old, new]
+    return changes
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Such as Category.DEFAULT_NAME, which new groups are created with.
+        if isinstance(o, Promise):
+            return force_text(o)
+        return super(_Encoder, self).default(o)
+
+
+def encode(changes):
+    return zlib.compress(json.dumps(changes, cls=_Encoder,
+                                    separators=(',', ':'),
+                                    sort_keys=True).encode('utf-8'))
+
+
+def decode(payload):
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def share_amounts(transaction):
+    """Returns the transaction's shares as {party id: amount}."""
+    # Keyed by strings, as they will be once stored as JSON.
+    return dict((str(party_id), amount) for party_id, amount in
+                transaction.shares.values_list('party', 'amount'))
+
+
+def record_shares(group_id, transaction, before):
+    """
+    Logs how the transaction's shares differ from ``before``, as returned
+    by ``share_amounts`` before they were changed.
+
+    """
+    after = share_amounts(transaction)
+    changes = diff(before, after)
+    if not changes:
+        return
+    if not before:
+        action = CREATE
+    elif not after:
+        action = DELETE
+    else:
+        action = UPDATE
+    record(group_id, 'share', transaction.pk, action, changes,
+           transaction._state.db)
+
+
+def get_actor():
+    return getattr(_local, 'actor', '')
+
+
+def _write(using, entries):
+    from argus.models import AuditEntry
+    if entries:
+        AuditEntry.objects.using(using).bulk_create(entries)
+
+
+def record(group_id, model, object_id, action, changes, using):
+    """
+    Logs a change, or holds it back to be written in a batch if a request
+    is being handled; see the module docstring.
+
+    """
+    from argus.models import AuditEntry
+    entry = AuditEntry(group_id=group_id, model=model, object_id=object_id,
+                       action=action, actor=get_actor(),
+                       payload=encode(changes))
+    buffer = getattr(_local, 'buffer', None)
+    blocks = getattr(_local, 'blocks', {}).get(using)
+    if blocks:
+        blocks[-1].append(entry)
+    elif buffer is None or connections[using].in_atomic_block:
+        _write(using, [entry])
+    else:
+        buffer.setdefault(using, []).append(entry)
+
+
+@contextmanager
+def transaction_entries(using):
+    """
+    Collects the entries recorded in a transaction block on ``using`` and
+    writes them at the end of the outermost one, before it commits.
+    Entries of a block that raises are dropped, as its changes are rolled
+    back. Used by argus.sharding.atomic, inside Django's atomic.
+
+    """
+    if getattr(_local, 'buffer', None) is None:
+        yield
+        return
+    blocks = _local.blocks.setdefault(using, [])
+    blocks.append([])
+    try:
+        yield
+    finally:
+        entries = blocks.pop()
+    if blocks:
+        blocks[-1].extend(entries)
+    else:
+        _write(using, entries)
+
+
+def forget_group(group_id):
+    """Drops held back entries of a group that has been deleted."""
+    lists = list((getattr(_local, 'buffer', None) or {}).values())
+    for blocks in getattr(_local, 'blocks', {}).values():
+        lists.extend(blocks)
+    for entries in lists:
+        entries[:] = [entry for entry in entries
+                      if entry.group_id != group_id]
+
+
+def flush():
+    """Writes the buffered entries of committed changes."""
+    buffer = getattr(_local, 'buffer', None) or {}
+    for using, entries in buffer.items():
+        _write(using, entries)
+    buffer.clear()
+
+
+def start(actor=''):
+    _local.buffer = {}
+    _local.blocks = {}
+    _local.actor = actor
+
+
+def stop():
+    _local.buffer = None
+    _local.blocks = {}
+    _local.actor = ''
+
+
+@contextmanager
+def buffered(actor=''):
+    """
+    Batches entries as during a request until the block ends. Wrap it
+    around any transaction blocks, not inside them.
+
+    """
+    start(actor)
+    try:
+        yield
+    finally:
+        try:
+            flush()
+        finally:
+            stop()
+
+
+def request_actor(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return user.get_username()
+    # The log is shown to every member, so their addresses are left out.
+    return MEMBER
+
+
+def is_address(actor):
+    """True for actors recorded as IP addresses by earlier versions."""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, actor)
+        except (socket.error, ValueError):
+            continue
+        return True
+    return False
+
+
+class AuditMiddleware(object):
+    def process_request(self, request):
+        start(request_actor(request))
+
+    def process_response(self, request, response):
+        try:
+            flush()
+        finally:
+            stop()
+        return response
+
+    def process_exception(self, request, exception):
+        # The request's committed changes stay, so their entries do too.
+        try:
+            flush()
+        finally:
+            stop()
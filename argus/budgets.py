@@ -0,0 +1,171 @@
+"""
+Query budget regression checks.
+
+Every named URL in ``argus.urls`` is rendered against synthetic groups of
+several sizes. A URL passes if its query count is the same at every size
+(no N+1 queries) and does not exceed the count recorded in the snapshot
+file. A URL whose growth with data size is known and intended can be
+marked ``size_dependent`` in the snapshot by hand; updating the snapshot
+keeps such marks but never adds them, so new N+1 queries fail the check.
+
+Each page is measured with the cache cleared first, so the budgets are
+those of a cold cache.
+
+"""
+import json
+import os
+import random
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+
+from argus.models import Transaction
+from argus.synthetic import GroupGenerator
+from argus.tokens import token_generators
+from argus.urls import urlpatterns
+
+
+PASSWORD = 'budget'
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(__file__),
+                                'query_budgets.json')
+# (members, transactions) per group; the snapshot was recorded at these.
+# At least 10 transactions, so that the transaction log is full at every
+# size.
+DEFAULT_SIZES = ((3, 10), (6, 50), (12, 200))
+
+# URLs that change the client's state are measured last.
+LAST = ('argus_group_logout',)
+
+
+def seed_group(members, transactions, seed=0):
+    group = GroupGenerator(members=members, transactions=transactions,
+                           rng=random.Random(seed)).generate()
+    group.email = group.confirmed_email = 'budget@example.com'
+    group.set_password(PASSWORD)
+    group.save(update_fields=['email', 'confirmed_email', 'password'])
+    return group
+
+
+def url_kwargs(group):
+    """
+    Returns a dict mapping each named argus URL to the kwargs needed to
+    reverse it for ``group``.
+
+    """
+    party = group.parties.members().order_by('pk')[0]
+    transaction = Transaction.objects.filter(paid_by__group=group
+                                             ).order_by('pk')[0]
+    reset_token = token_generators['password_reset'].make_token(group)
+    confirm_token = token_generators['email_confirm'].make_token(group)
+    kwargs = {}
+    for pattern in urlpatterns:
+        name = getattr(pattern, 'name', None)
+        if name is None:
+            continue
+        params = set(pattern.regex.groupindex)
+        values = {}
+        if 'group_slug' in params:
+            values['group_slug'] = group.slug
+        if 'slug' in params:
+            values['slug'] = group.slug
+        if 'pk' in params:
+            if name.startswith('argus_party'):
+                values['pk'] = party.pk
+            elif name.startswith('argus_category'):
+                values['pk'] = group.default_category_id
+            else:
+                values['pk'] = transaction.pk
+        if 'token' in params:
+            if name == 'argus_group_email_confirm':
+                values['token'] = confirm_token
+            else:
+                values['token'] = reset_token
+        if params - set(values):
+            # Needs data (such as a processed receipt) that synthetic
+            # groups don't have.
+            continue
+        kwargs[name] = values
+    return kwargs
+
+
+def measure(group, host='localhost'):
+    """
+    Logs in to ``group`` and GETs every named URL, returning a dict mapping
+    URL names to (status code, query count).
+
+    """
+    client = Client(HTTP_HOST=host)
+    client.post(reverse('argus_group_login', kwargs={'slug': group.slug}),
+                {'password': PASSWORD})
+    results = {}
+    names = sorted(url_kwargs(group).items(),
+                   key=lambda item: (item[0] in LAST, item[0]))
+    for name, kwargs in names:
+        url = reverse(name, kwargs=kwargs)
+        # Every page is measured with nothing cached, so that fragments
+        # cached by an earlier page can't hide its queries.
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        results[name] = (response.status_code, len(captured))
+    return results
+
+
+def compare(snapshot, measurements):
+    """
+    Compares per-size measurements (a list of ``measure`` results, smallest
+    group first) against a snapshot. Returns a list of failure messages.
+
+    """
+    failures = []
+    for name in sorted(measurements[0]):
+        statuses = [m[name][0] for m in measurements]
+        counts = [m[name][1] for m in measurements]
+        expected = snapshot.get(name)
+        if any(status >= 500 for status in statuses):
+            failures.append(u"{}: server error ({})".format(name, statuses))
+            continue
+        if expected is None:
+            failures.append(u"{}: no budget in snapshot".format(name))
+            continue
+        if len(set(counts)) > 1 and not expected.get('size_dependent'):
+            failures.append(u"{}: query count grows with data size "
+                            u"({})".format(name, counts))
+        if max(counts) > expected['queries']:
+            failures.append(u"{}: {} queries, budget is {}".format(
+                name, max(counts), expected['queries']))
+    return failures
+
+
+def make_snapshot(measurements, previous=None):
+    """
+    Returns a snapshot of the measurements, keeping the ``size_dependent``
+    marks of ``previous``.
+
+    """
+    previous = previous or {}
+    snapshot = {}
+    for name in measurements[0]:
+        counts = [m[name][1] for m in measurements]
+        snapshot[name] = {
+            'queries': max(counts),
+            'size_dependent': previous.get(name, {}).get('size_dependent',
+                                                         False),
+        }
+    return snapshot
+
+
+def load_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_snapshot(path, snapshot):
+    with open(path, 'w') as f:
+        json.dump(snapshot, f, indent=2, separators=(',', ': '),
+                  sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,110 @@
+"""
+Bulk changes to many transactions of one group.
+
+Each operation issues one UPDATE or DELETE per table per batch of ids,
+rather than saving transactions one at a time, and so sends no model
+signals: the group summary, search index, audit log and change counter
+are updated here directly. Callers check that the transactions belong to the group
+and run these inside a database transaction, wrapped in deferred_changes().
+
+"""
+from django.db.models import F, Sum
+
+from argus import audit, search
+from argus.models import (GroupSummary, Party, Receipt, Share, Transaction,
+                          record_change)
+from argus.sharding import current_alias, get_connection
+
+
+# Keeps IN lists under SQLite's default limit of 999 parameters.
+BATCH_SIZE = 500
+
+
+def _batches(pks):
+    pks = list(pks)
+    for i in range(0, len(pks), BATCH_SIZE):
+        yield pks[i:i + BATCH_SIZE]
+
+
+def _audit(group, model, pk, action, changes):
+    audit.record(group.pk, model, pk, action, changes, current_alias())
+
+
+def recategorize(group, pks, category):
+    updated = 0
+    for batch in _batches(pks):
+        old = list(Transaction.objects.filter(pk__in=batch).exclude(
+            category=category).values_list('pk', 'category'))
+        updated += Transaction.objects.filter(pk__in=batch).update(
+            category=category, version=F('version') + 1)
+        for pk, category_id in old:
+            _audit(group, 'transaction', pk, audit.UPDATE,
+                   {'category_id': [category_id, category.pk]})
+    record_change(group.pk)
+    return updated
+
+
+def reassign_payer(group, pks, paid_by):
+    """
+    Makes ``paid_by`` the payer of the transactions. Simple payments to an
+    expense source are owed by whoever paid them, so their one share moves
+    to the new payer as well.
+
+    """
+    updated = 0
+    for batch in _batches(pks):
+        old = list(Transaction.objects.filter(pk__in=batch).exclude(
+            paid_by=paid_by).values_list('pk', 'paid_by'))
+        shares = Share.objects.filter(transaction__in=batch,
+                                      transaction__split=Transaction.SIMPLE)
+        moved = list(shares.exclude(party=paid_by).values_list(
+            'transaction', 'party', 'amount'))
+        shares.update(party=paid_by)
+        updated += Transaction.objects.filter(pk__in=batch).update(
+            paid_by=paid_by, version=F('version') + 1)
+        for pk, party_id in old:
+            _audit(group, 'transaction', pk, audit.UPDATE,
+                   {'paid_by_id': [party_id, paid_by.pk]})
+        for pk, party_id, amount in moved:
+            _audit(group, 'share', pk, audit.UPDATE,
+                   {str(party_id): [amount, None],
+                    str(paid_by.pk): [None, amount]})
+    record_change(group.pk)
+    return updated
+
+
+def delete(group, pks, log_changes=True):
+    """
+    Deletes the transactions with their shares, receipts and index
+    entries. Receipt files are left in storage, since other receipts may
+    share them. Unless ``log_changes`` is false, the deletions are added
+    to the audit log.
+
+    """
+    deleted = 0
+    spent = 0
+    for batch in _batches(pks):
+        spent += Transaction.objects.filter(pk__in=batch).exclude(
+            split=Transaction.SIMPLE, paid_to__party_type=Party.MEMBER
+        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        rows = []
+        if log_changes:
+            rows = list(Transaction.objects.filter(pk__in=batch).values())
+        search.unindex_transactions(batch)
+        Share.objects.filter(transaction__in=batch).delete()
+        Receipt.objects.filter(transaction__in=batch).delete()
+        # Deleting through the ORM would load each transaction to send
+        # signals.
+        cursor = get_connection().cursor()
+        cursor.execute("DELETE FROM {} WHERE id IN ({})".format(
+            Transaction._meta.db_table, ", ".join(["%s"] * len(batch))),
+            batch)
+        deleted += cursor.rowcount
+        for row in rows:
+            before = dict((name, value) for name, value in row.items()
+                          if name not in audit.EXCLUDED_FIELDS)
+            _audit(group, 'transaction', row['id'], audit.DELETE,
+                   audit.diff(before, {}))
+    GroupSummary.objects.record(group.pk, -deleted, -spent, create=False)
+    record_change(group.pk)
+    return deleted
@@ -0,0 +1,120 @@
+"""
+Ledger compaction.
+
+Transactions paid before a cutoff are moved, with their shares, into the
+archive tables. Their effect on each party's balance is folded into
+``Party.opening_balance`` and their amounts into ``Category.archived_total``,
+so balances and category totals are unchanged while the active tables stay
+small. Each batch is archived in its own database transaction, so an
+interrupted run can simply be repeated.
+
+Transactions with receipts are left in the active ledger, since receipts
+belong to live transactions.
+
+"""
+from django.db.models import F, Q, Sum
+
+from argus import search
+from argus.models import (ArchivedShare, ArchivedTransaction, Category,
+                          Group, GroupSnapshot, Party, Share, Transaction,
+                          record_change)
+from argus.sharding import atomic, get_connection
+
+
+# Keeps IN lists under SQLite's default limit of 999 parameters.
+DEFAULT_BATCH_SIZE = 500
+
+TRANSACTION_COLUMNS = ('id', 'paid_by_id', 'paid_to_id', 'memo', 'amount',
+                       'paid_at', 'category_id', 'notes', 'split')
+SHARE_COLUMNS = ('id', 'transaction_id', 'party_id', 'amount', 'numerator',
+                 'denominator')
+
+
+def archivable(group, cutoff):
+    return Transaction.objects.filter(paid_by__group=group,
+                                      paid_at__lt=cutoff,
+                                      receipts__isnull=True)
+
+
+def compact_group(group, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Archives the group's transactions paid before ``cutoff``. Returns the
+    number of transactions archived.
+
+    """
+    pks = archivable(group, cutoff).order_by('pk').values_list('pk',
+                                                               flat=True)
+    if not pks.exists():
+        return 0
+    # Recorded first so that the archive is reachable even if the run is
+    # interrupted.
+    Group.objects.filter(pk=group.pk).filter(
+        Q(archived_before__isnull=True) | Q(archived_before__lt=cutoff)
+    ).update(archived_before=cutoff)
+    archived = 0
+    while True:
+        with atomic():
+            batch = list(pks[:batch_size])
+            if not batch:
+                break
+            archive_transactions(batch)
+        archived += len(batch)
+        GroupSnapshot.invalidate(group.pk)
+        record_change(group.pk)
+    return archived
+
+
+def _in(pks):
+    return ", ".join(["%s"] * len(pks))
+
+
+def _totals(queryset, field):
+    return [(key, total) for key, total in
+            queryset.values_list(field).annotate(Sum('amount'))
+            if key is not None and total]
+
+
+def archive_transactions(pks):
+    """
+    Moves the given transactions and their shares to the archive tables.
+    Must be called inside a database transaction.
+
+    """
+    transactions = Transaction.objects.filter(pk__in=pks)
+    shares = Share.objects.filter(transaction__in=pks)
+    balances = {}
+    for party_id, total in _totals(transactions, 'paid_by'):
+        balances[party_id] = balances.get(party_id, 0) - total
+    for party_id, total in _totals(transactions, 'paid_to'):
+        balances[party_id] = balances.get(party_id, 0) + total
+    for party_id, total in _totals(shares, 'party'):
+        balances[party_id] = balances.get(party_id, 0) + total
+    category_totals = _totals(transactions, 'category')
+
+    cursor = get_connection().cursor()
+    for archive, source, columns, key in (
+            (ArchivedTransaction, Transaction, TRANSACTION_COLUMNS, 'id'),
+            (ArchivedShare, Share, SHARE_COLUMNS, 'transaction_id')):
+        columns = ", ".join(columns)
+        cursor.execute(
+            "INSERT INTO {archive} ({columns}) SELECT {columns} "
+            "FROM {source} WHERE {key} IN ({pks})".format(
+                archive=archive._meta.db_table, source=source._meta.db_table,
+                columns=columns, key=key, pks=_in(pks)), pks)
+
+    search.unindex_transactions(pks)
+    # Neither model has delete signals or reverse relations, so these are
+    # single DELETE statements.
+    shares.delete()
+    # Deleting transactions through the ORM would load each one to send
+    # signals; the index has already been cleaned up.
+    cursor.execute("DELETE FROM {} WHERE id IN ({})".format(
+        Transaction._meta.db_table, _in(pks)), pks)
+
+    for party_id, amount in balances.items():
+        if amount:
+            Party.objects.filter(pk=party_id).update(
+                opening_balance=F('opening_balance') + amount)
+    for category_id, amount in category_totals:
+        Category.objects.filter(pk=category_id).update(
+            archived_total=F('archived_total') + amount)
@@ -0,0 +1,56 @@
+"""
+Runs a page's independent reads at the same time.
+
+Django can't run a view's queries asynchronously, so they are run on a
+shared pool of threads instead, each with its own database connection.
+Set ``ARGUS_CONCURRENT_READS = True`` to have group, party and category
+pages use it; ``ARGUS_READ_POOL_SIZE`` (default 4) sizes the pool. Pool
+threads follow the usual CONN_MAX_AGE rules, so set it to keep their
+connections open between requests.
+
+"""
+from multiprocessing.pool import ThreadPool
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from argus.replicas import get_read_alias, reading_from
+from argus.sharding import get_current_shard, pinned
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, 'ARGUS_READ_POOL_SIZE', 4))
+    return _pool
+
+
+def run_concurrently(reads):
+    """
+    Takes a dict mapping names to functions, calls them on the pool and
+    returns a dict of their results. Inside a database transaction they
+    are called one after another instead, since other connections couldn't
+    see its writes.
+
+    """
+    names = sorted(reads)
+    if len(names) < 2 or any(connection.in_atomic_block
+                             for connection in connections.all()):
+        return dict((name, reads[name]()) for name in names)
+    alias = get_read_alias()
+    shard = get_current_shard()
+
+    def call(name):
+        try:
+            with pinned(shard), reading_from(alias):
+                return reads[name]()
+        finally:
+            close_old_connections()
+
+    return dict(zip(names, get_pool().map(call, names)))
@@ -1,17 +1,67 @@
+import copy
+import uuid
+
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import send_mail
 from django.forms.models import BaseModelFormSet, modelformset_factory
 from django.template import loader
-from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
 import floppyforms as forms
 
-from argus.models import (Group, Transaction, Party, Share, Category,
-                          URL_SAFE_CHARS)
+from argus import audit, bulk, receipts, webhooks
+from argus.models import (Group, GroupShard, Transaction, Party, Share,
+                          Category, Receipt, WebhookSubscription,
+                          deferred_changes)
+from argus.sharding import (atomic, choose_shard, pinned,
+                            sharding_enabled)
+from argus.throttle import login_throttle
 from argus.tokens import token_generators
 
 
+class VersionedFormMixin(object):
+    """
+    Round-trips the instance's version through a hidden field so that
+    saving can detect edits made since the form was rendered.
+
+    """
+    version_conflict_message = _("Someone else changed this while you were "
+                                 "editing it. Review their changes and save "
+                                 "again to overwrite them.")
+    deleted_message = _("Someone else deleted this while you were editing "
+                        "it.")
+
+    def __init__(self, *args, **kwargs):
+        super(VersionedFormMixin, self).__init__(*args, **kwargs)
+        self.fields['version'] = forms.IntegerField(widget=forms.HiddenInput,
+                                                    required=False,
+                                                    initial=self.instance.version)
+
+    def claim_version(self):
+        version = self.cleaned_data.get('version')
+        if version is None:
+            version = self.instance.version
+        self.instance.claim_version(version)
+
+    def version_conflict(self):
+        """
+        Flags a conflict on a bound form, and points its hidden version at
+        the current one so that resubmitting deliberately overwrites. If
+        the instance has been deleted meanwhile, says so instead.
+
+        """
+        model = type(self.instance)
+        current = list(model._default_manager.filter(
+            pk=self.instance.pk).values_list('version', flat=True))
+        if not current:
+            self.add_error(None, self.deleted_message)
+            return
+        data = self.data.copy()
+        data[self.add_prefix('version')] = current[0]
+        self.data = data
+        self.add_error(None, self.version_conflict_message)
+
+
 class PartyForm(forms.ModelForm):
     class Meta:
         widgets = {
@@ -30,23 +80,39 @@ class BaseGroupCreateFormSet(BaseModelFormSet):
                                         "two members to get started.")
 
     def save(self):
-        while True:
-            slug = get_random_string(length=6, allowed_chars=URL_SAFE_CHARS)
-            if not Group.objects.filter(slug=slug).exists():
-                group = Group.objects.create(slug=slug)
-                category = Category.objects.create(name=Category.DEFAULT_NAME,
-                                                   group=group)
-                group.default_category = category
-                group.save()
-                break
-        for form in self.forms:
-            form.instance.group = group
-            form.instance.party_type = Party.MEMBER
-            if form.instance.name:
-                form.save()
-        return group
+        if not sharding_enabled():
+            return self._create_group()
+        # The shard map hands out the slug and id, so that both are unique
+        # across shards.
+        entry = GroupShard.objects.create_with_random_slug(
+            shard=choose_shard())
+        try:
+            with pinned(entry.shard):
+                return self._create_group(id=entry.pk, slug=entry.slug)
+        except Exception:
+            entry.delete()
+            raise
     save.alters_data = True
 
+    def _create_group(self, **kwargs):
+        with atomic():
+            if kwargs:
+                group = Group.objects.create(**kwargs)
+            else:
+                group = Group.objects.create_with_random_slug()
+            category = Category.objects.create(name=Category.DEFAULT_NAME,
+                                               group=group)
+            group.default_category = category
+            group.save(update_fields=['default_category'])
+            members = []
+            for form in self.forms:
+                form.instance.group = group
+                form.instance.party_type = Party.MEMBER
+                if form.instance.name:
+                    members.append(form.instance)
+            Party.objects.bulk_create(members)
+        return group
+
 
 GroupCreateFormSet = modelformset_factory(
     Party,
@@ -64,7 +130,7 @@ class GroupSlugInput(forms.SlugInput):
         return context
 
 
-class GroupForm(forms.ModelForm):
+class GroupForm(VersionedFormMixin, forms.ModelForm):
     subject_template_name = "argus/mail/group_email_confirm_subject.txt"
     body_template_name = "argus/mail/group_email_confirm_body.txt"
     html_email_template_name = None
@@ -88,8 +154,19 @@ class GroupForm(forms.ModelForm):
         self.fields['default_category'].empty_label = None
         self.fields['default_category'].required = True
 
+    def clean_slug(self):
+        slug = self.cleaned_data['slug']
+        # The unique constraint only covers this group's shard.
+        if (sharding_enabled() and GroupShard.objects.filter(slug=slug)
+                .exclude(pk=self.instance.pk).exists()):
+            raise forms.ValidationError(_("A group with this slug already "
+                                          "exists."))
+        return slug
+
     def save(self, *args, **kwargs):
-        instance = super(GroupForm, self).save(*args, **kwargs)
+        with deferred_changes(), atomic():
+            self.claim_version()
+            instance = super(GroupForm, self).save(*args, **kwargs)
         if 'email' in self.changed_data:
             # Send confirmation link.
             context = {
@@ -117,6 +194,10 @@ class GroupForm(forms.ModelForm):
         return instance
 
 
+THROTTLED_MESSAGE = _("Too many password attempts. Please wait a few "
+                      "minutes and try again.")
+
+
 class GroupAuthenticationForm(forms.Form):
     password = forms.CharField(label=_("Password"), widget=forms.PasswordInput)
 
@@ -128,6 +209,9 @@ class GroupAuthenticationForm(forms.Form):
     def clean(self):
         password = self.cleaned_data.get('password')
         if password:
+            if not login_throttle.allow(self._group, self.request):
+                raise forms.ValidationError(THROTTLED_MESSAGE,
+                                            code='throttled')
             if self._group.check_password(password):
                 self.group = self._group
             else:
@@ -140,6 +224,7 @@ class GroupChangePasswordForm(forms.ModelForm):
         'password_mismatch': _("The two password fields didn't match."),
         'password_incorrect': _("Your old password was entered incorrectly. "
                                 "Please enter it again."),
+        'throttled': THROTTLED_MESSAGE,
     }
     old_password = forms.CharField(label=_("Old password"),
                                    widget=forms.PasswordInput)
@@ -153,6 +238,7 @@ class GroupChangePasswordForm(forms.ModelForm):
         fields = ()
 
     def __init__(self, *args, **kwargs):
+        self.request = kwargs.pop('request', None)
         super(GroupChangePasswordForm, self).__init__(*args, **kwargs)
         if not self.instance.password:
             del self.fields['old_password']
@@ -162,6 +248,11 @@ class GroupChangePasswordForm(forms.ModelForm):
         Validates that the old_password field is correct (if present).
         """
         old_password = self.cleaned_data["old_password"]
+        if not login_throttle.allow(self.instance, self.request):
+            raise forms.ValidationError(
+                self.error_messages['throttled'],
+                code='throttled',
+            )
         if not self.instance.check_password(old_password):
             raise forms.ValidationError(
                 self.error_messages['password_incorrect'],
@@ -183,7 +274,7 @@ class GroupChangePasswordForm(forms.ModelForm):
     def save(self, commit=True):
         self.instance.set_password(self.cleaned_data['new_password1'])
         if commit:
-            self.instance.save()
+            self.instance.save(update_fields=['password'])
         return self.instance
 
 
@@ -203,8 +294,49 @@ class GroupRelatedForm(forms.ModelForm):
         self.instance.group = self.group
 
 
-class TransactionForm(forms.ModelForm):
+class WebhookForm(GroupRelatedForm):
+    class Meta:
+        model = WebhookSubscription
+        fields = ('url',)
+        widgets = {
+            'url': forms.URLInput,
+        }
+
+    def clean_url(self):
+        url = self.cleaned_data['url']
+        try:
+            webhooks.check_url(url)
+        except ValueError:
+            raise forms.ValidationError(_("Enter an http or https URL."))
+        except webhooks.UnsafeAddress:
+            raise forms.ValidationError(_("Webhooks can't be sent to "
+                                          "private or local addresses."))
+        except IOError:
+            raise forms.ValidationError(_("This host could not be found."))
+        return url
+
+
+def _set_choices(field, objects):
+    choices = [(obj.pk, field.label_from_instance(obj)) for obj in objects]
+    if getattr(field, 'empty_label', None) is not None:
+        choices.insert(0, (u"", field.empty_label))
+    field.choices = choices
+
+
+# Copied for each member's share field, which is cheaper than building
+# (and validating the arguments of) a new field every time.
+MEMBER_FIELD = forms.DecimalField(decimal_places=2, min_value=0, initial=0)
+MEMBER_FIELD.widget.attrs['step'] = 0.01
+
+
+class TransactionForm(VersionedFormMixin, forms.ModelForm):
     sharers = forms.ModelMultipleChoiceField(Party)
+    # Not used by the form itself; the view checks it before validation so
+    # that retried submissions are answered without saving twice.
+    idempotency_key = forms.CharField(widget=forms.HiddenInput,
+                                      required=False,
+                                      initial=lambda: uuid.uuid4().hex)
+    receipt = forms.ImageField(required=False)
 
     class Meta:
         model = Transaction
@@ -223,22 +355,29 @@ class TransactionForm(forms.ModelForm):
     def __init__(self, group, *args, **kwargs):
         super(TransactionForm, self).__init__(*args, **kwargs)
         self.group = group
+        snapshot = group.get_snapshot()
 
+        # Querysets are only evaluated to validate submitted values;
+        # choices are rendered from the cached snapshot.
         self.fields['category'].queryset = group.categories.all()
         self.fields['category'].initial = group.default_category_id
+        _set_choices(self.fields['category'], snapshot.categories)
 
-        self.members = group.parties.filter(party_type=Party.MEMBER)
-        self.fields['paid_by'].queryset = self.members
+        self.members = snapshot.members
+        members = group.parties.filter(party_type=Party.MEMBER)
+        self.fields['paid_by'].queryset = members
         self.fields['paid_by'].empty_label = None
+        _set_choices(self.fields['paid_by'], self.members)
         self.fields['paid_to'].queryset = group.parties.all()
-        self.fields['sharers'].queryset = self.members
+        _set_choices(self.fields['paid_to'], snapshot.parties)
+        self.fields['sharers'].queryset = members
+        _set_choices(self.fields['sharers'], self.members)
         self.initial['sharers'] = self.members
 
         for member in self.members:
-            field = forms.DecimalField(decimal_places=2, min_value=0,
-                                       initial=0, label=member.name)
+            field = copy.deepcopy(MEMBER_FIELD)
+            field.label = member.name
             field.member = member
-            field.widget.attrs['step'] = 0.01
             self.fields['member{}'.format(member.pk)] = field
 
         if self.instance.pk and self.instance.is_manual():
@@ -251,6 +390,14 @@ class TransactionForm(forms.ModelForm):
         for member in self.members:
             yield self['member{}'.format(member.pk)]
 
+    def clean_receipt(self):
+        receipt = self.cleaned_data.get('receipt')
+        # ImageField accepts anything Pillow can open, whatever it's named.
+        if receipt and receipts.detect_format(receipt) is None:
+            raise forms.ValidationError(_("Upload a JPEG, PNG or GIF "
+                                          "image."))
+        return receipt
+
     def clean(self):
         cleaned_data = super(TransactionForm, self).clean()
         split = cleaned_data['split']
@@ -284,7 +431,18 @@ class TransactionForm(forms.ModelForm):
         return cleaned_data
 
     def save(self):
+        with deferred_changes(), atomic():
+            return self._save()
+    save.alters_data = True
+
+    def _save(self):
         created = not self.instance.pk
+        shares_before = {}
+        if not created:
+            # Taken before touching shares, so that concurrent edits can't
+            # interleave their share deletes and inserts.
+            self.claim_version()
+            shares_before = audit.share_amounts(self.instance)
         instance = super(TransactionForm, self).save()
         if not created:
             instance.shares.all().delete()
@@ -305,4 +463,101 @@ class TransactionForm(forms.ModelForm):
                                  for member in self.members
                                  if cd['member{}'.format(member.pk)]]
             Share.objects.create_split(instance, member_numerators)
+        audit.record_shares(self.group.pk, instance, shares_before)
+        if self.cleaned_data.get('receipt'):
+            Receipt.objects.create_from_upload(instance,
+                                               self.cleaned_data['receipt'])
         return instance
+
+
+class IdListField(forms.Field):
+    widget = forms.MultipleHiddenInput
+    default_error_messages = {
+        'invalid': _("Enter a list of ids."),
+    }
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        try:
+            return sorted(set(int(v) for v in value))
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid'],
+                                        code='invalid')
+
+
+class TransactionBulkForm(forms.Form):
+    RECATEGORIZE = 'recategorize'
+    REASSIGN = 'reassign'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = (
+        (RECATEGORIZE, _('Change category')),
+        (REASSIGN, _('Change who paid')),
+        (DELETE, _('Delete')),
+    )
+
+    transactions = IdListField(error_messages={
+        'required': _("Select at least one transaction."),
+    })
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    category = forms.ModelChoiceField(Category, required=False)
+    paid_by = forms.ModelChoiceField(Party, required=False)
+
+    def __init__(self, group, *args, **kwargs):
+        super(TransactionBulkForm, self).__init__(*args, **kwargs)
+        self.group = group
+        self.fields['category'].queryset = group.categories.all()
+        self.fields['paid_by'].queryset = group.parties.filter(
+            party_type=Party.MEMBER)
+
+    def clean(self):
+        cleaned_data = super(TransactionBulkForm, self).clean()
+        action = cleaned_data.get('action')
+        pks = cleaned_data.get('transactions')
+        if not action or not pks:
+            return cleaned_data
+        if action == self.RECATEGORIZE and not cleaned_data.get('category'):
+            raise forms.ValidationError("Choose a category.")
+        if action == self.REASSIGN and not cleaned_data.get('paid_by'):
+            raise forms.ValidationError("Choose who paid.")
+        # Only the selected rows are read, a batch of ids at a time.
+        transactions = Transaction.objects.filter(paid_by__group=self.group)
+        paid_to = {}
+        for i in range(0, len(pks), bulk.BATCH_SIZE):
+            paid_to.update(transactions.filter(
+                pk__in=pks[i:i + bulk.BATCH_SIZE]
+            ).values_list('pk', 'paid_to'))
+        if any(pk not in paid_to for pk in pks):
+            raise forms.ValidationError("Some of these transactions don't "
+                                        "exist or belong to another group.")
+        if action == self.REASSIGN:
+            payer = cleaned_data['paid_by'].pk
+            if any(paid_to[pk] == payer for pk in pks):
+                raise forms.ValidationError("A party cannot pay "
+                                            "themselves.")
+        return cleaned_data
+
+    def save(self):
+        """Applies the action, returning the number of transactions."""
+        cd = self.cleaned_data
+        with deferred_changes(), atomic():
+            if cd['action'] == self.RECATEGORIZE:
+                return bulk.recategorize(self.group, cd['transactions'],
+                                         cd['category'])
+            if cd['action'] == self.REASSIGN:
+                return bulk.reassign_payer(self.group, cd['transactions'],
+                                           cd['paid_by'])
+            return bulk.delete(self.group, cd['transactions'])
+    save.alters_data = True
+
+
+class TransactionSearchForm(forms.Form):
+    q = forms.CharField(max_length=200)
+    party = forms.IntegerField(required=False)
+    category = forms.IntegerField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=200)
@@ -0,0 +1,233 @@
+"""
+Opt-in per-view performance instrumentation.
+
+Add ``argus.instrumentation.InstrumentationMiddleware`` to
+MIDDLEWARE_CLASSES and set ``ARGUS_INSTRUMENTATION = True`` to record query
+count, SQL time, template render time and overall latency for every view.
+Views using InstrumentedViewMixin can be given a query budget through
+``ARGUS_QUERY_BUDGETS``, e.g. ``{'GroupDetailView': 20}``; requests going
+over budget are logged and counted.
+
+"""
+from bisect import bisect_left
+import logging
+import threading
+from time import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+MS_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram. Bucket ``i`` counts values ``<= bounds[i]``;
+    the last bucket counts everything larger.
+
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        labels = [str(bound) for bound in self.bounds] + ['inf']
+        return {
+            'count': self.count,
+            'mean': self.total / float(self.count) if self.count else 0,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class ViewStats(object):
+    def __init__(self):
+        self.queries = Histogram(QUERY_BOUNDS)
+        self.sql_ms = Histogram(MS_BOUNDS)
+        self.render_ms = Histogram(MS_BOUNDS)
+        self.total_ms = Histogram(MS_BOUNDS)
+        self.over_budget = 0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries.as_dict(),
+            'sql_ms': self.sql_ms.as_dict(),
+            'render_ms': self.render_ms.as_dict(),
+            'total_ms': self.total_ms.as_dict(),
+            'over_budget': self.over_budget,
+        }
+
+
+class StatsRegistry(object):
+    """In-process aggregate of request timings, keyed by view name."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, timing):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.queries.add(timing.queries)
+            stats.sql_ms.add(timing.sql_ms)
+            stats.render_ms.add(timing.render_ms)
+            stats.total_ms.add(timing.total_ms)
+            if timing.over_budget:
+                stats.over_budget += 1
+
+    def as_dict(self):
+        with self._lock:
+            return dict((view, stats.as_dict())
+                        for view, stats in self._views.items())
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+registry = StatsRegistry()
+
+
+class QueryCounter(object):
+    """Database execute wrapper that counts and times queries."""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time() - start
+
+
+class RequestTiming(object):
+    def __init__(self):
+        self.start = time()
+        self.view = None
+        self.query_budget = None
+        self.render_start = None
+        self.render_ms = 0.0
+        self.counter = QueryCounter()
+        self._wrappers = []
+        self._logged = {}
+
+    def start_queries(self):
+        for connection in connections.all():
+            if hasattr(connection, 'execute_wrapper'):
+                wrapper = connection.execute_wrapper(self.counter)
+                wrapper.__enter__()
+                self._wrappers.append(wrapper)
+            else:
+                # Older Django: fall back to the debug cursor's query log,
+                # which is reset at the start of every request anyway.
+                self._logged[connection.alias] = (connection.use_debug_cursor,
+                                                  len(connection.queries))
+                connection.use_debug_cursor = True
+
+    def stop_queries(self):
+        for wrapper in self._wrappers:
+            wrapper.__exit__(None, None, None)
+        for alias, (use_debug_cursor, start) in self._logged.items():
+            connection = connections[alias]
+            queries = connection.queries[start:]
+            self.counter.count += len(queries)
+            self.counter.duration += sum(float(q['time']) for q in queries)
+            connection.use_debug_cursor = use_debug_cursor
+        self._wrappers = []
+        self._logged = {}
+
+    def finish(self):
+        self.stop_queries()
+        if self.render_start is not None:
+            self.render_ms = (time() - self.render_start) * 1000
+        self.total_ms = (time() - self.start) * 1000
+        self.queries = self.counter.count
+        self.sql_ms = self.counter.duration * 1000
+        self.over_budget = (self.query_budget is not None and
+                            self.queries > self.query_budget)
+
+    def server_timing(self):
+        return ', '.join((
+            'db;dur={:.1f};desc="{} queries"'.format(self.sql_ms,
+                                                     self.queries),
+            'render;dur={:.1f}'.format(self.render_ms),
+            'total;dur={:.1f}'.format(self.total_ms),
+        ))
+
+
+def get_query_budget(view_name, default=None):
+    budgets = getattr(settings, 'ARGUS_QUERY_BUDGETS', {})
+    return budgets.get(view_name, default)
+
+
+class InstrumentationMiddleware(object):
+    def __init__(self):
+        if not getattr(settings, 'ARGUS_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        request._argus_timing = RequestTiming()
+        request._argus_timing.start_queries()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = getattr(request, '_argus_timing', None)
+        if timing is not None and timing.view is None:
+            timing.view = getattr(view_func, '__name__', repr(view_func))
+            timing.query_budget = get_query_budget(timing.view)
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_argus_timing', None)
+        if timing is not None:
+            timing.render_start = time()
+        return response
+
+    def process_response(self, request, response):
+        timing = getattr(request, '_argus_timing', None)
+        if timing is None:
+            return response
+        del request._argus_timing
+        timing.finish()
+        if timing.view is not None:
+            registry.record(timing.view, timing)
+            if timing.over_budget:
+                logger.warning("%s ran %d queries (budget %d): %s",
+                               timing.view, timing.queries,
+                               timing.query_budget, request.path)
+        response['Server-Timing'] = timing.server_timing()
+        return response
+
+
+class InstrumentedViewMixin(object):
+    """
+    Names the view's stats after its class and applies its query budget;
+    ``ARGUS_QUERY_BUDGETS`` overrides the ``query_budget`` attribute.
+
+    """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        timing = getattr(request, '_argus_timing', None)
+        if timing is not None:
+            timing.view = type(self).__name__
+            timing.query_budget = get_query_budget(timing.view,
+                                                   self.query_budget)
+        return super(InstrumentedViewMixin, self).dispatch(request, *args,
+                                                           **kwargs)
@@ -0,0 +1,273 @@
+"""
+Ledger integrity checks.
+
+The ledger is checked a range of ids at a time, with a few grouped
+queries per range, so memory use doesn't grow with its size and ranges
+can be checked in parallel (see the ``check_ledger`` command).
+
+Ranges of transaction ids are checked for:
+
+- shares that don't add up to the transaction amount (payments between
+  members have no shares, and payments to expense sources one share);
+- shares of a transaction with different denominators, numerators that
+  don't add up to the denominator, or empty shares;
+- parties, payees and categories from outside the payer's group.
+
+Ranges of group ids are checked for summaries, opening balances and
+archived category totals that differ from totals recomputed from active
+and archived transactions.
+
+Each problem is a dict ready to be reported as JSON. With ``fix``, the
+problems that have only one possible repair are repaired: share amounts
+are recomputed from their fractions, and maintained totals are replaced
+with recomputed ones. The rest need a person to look at them. Totals
+shouldn't be fixed while the ledger is being compacted, since they are
+recomputed outside of the compaction's database transactions.
+
+"""
+from decimal import Decimal
+
+from django.db import close_old_connections
+from django.db.models import F, Max, Min, Sum
+
+from argus import audit
+from argus.models import (ArchivedShare, ArchivedTransaction, Category,
+                          Group, GroupSnapshot, GroupSummary, Party, Share,
+                          Transaction, record_change)
+from argus.sharding import atomic
+
+
+TRANSACTION_CHUNK_SIZE = 10000
+# Keeps IN lists under SQLite's default limit of 999 parameters.
+GROUP_CHUNK_SIZE = 500
+
+SHARE_SUM = 'share_sum'
+FRACTIONS = 'fractions'
+SHARE_GROUP = 'share_group'
+PAYEE_GROUP = 'payee_group'
+CATEGORY_GROUP = 'category_group'
+SUMMARY = 'summary'
+OPENING_BALANCE = 'opening_balance'
+ARCHIVED_TOTAL = 'archived_total'
+
+CENTS = Decimal('0.01')
+
+
+def _cents(value):
+    # Sums may come back as floats on SQLite.
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def _problem(check, group_id, fixed=False, **kwargs):
+    kwargs.update({'check': check, 'group': group_id, 'fixed': fixed})
+    return kwargs
+
+
+def id_ranges(model, chunk_size):
+    """Yields (start, end) ranges covering the model's ids."""
+    bounds = model.objects.aggregate(Min('pk'), Max('pk'))
+    if bounds['pk__min'] is None:
+        return
+    for start in range(bounds['pk__min'], bounds['pk__max'] + 1,
+                       chunk_size):
+        yield start, start + chunk_size
+
+
+def _expects_shares(split, paid_to_type):
+    return not (split == Transaction.SIMPLE and paid_to_type == Party.MEMBER)
+
+
+def check_transactions(start, end, fix=False):
+    """Checks transactions with ids from ``start`` up to ``end``."""
+    problems = []
+    transactions = Transaction.objects.filter(pk__gte=start, pk__lt=end)
+    shares = Share.objects.filter(transaction__gte=start,
+                                  transaction__lt=end)
+
+    # Aggregates are named and read by name: on Python 2, values_list()
+    # returns several annotations in dict order, not the order given.
+    bad_fractions = set()
+    for row in shares.values(
+            'transaction', 'transaction__paid_by__group').annotate(
+                numerators=Sum('numerator'), smallest=Min('numerator'),
+                low=Min('denominator'), high=Max('denominator')):
+        pk, low, high = row['transaction'], row['low'], row['high']
+        if low != high or row['numerators'] != low or not row['smallest']:
+            bad_fractions.add(pk)
+            problems.append(_problem(
+                FRACTIONS, row['transaction__paid_by__group'],
+                transaction=pk, denominators=sorted(set((low, high))),
+                numerators=row['numerators']))
+
+    for row in transactions.values(
+            'pk', 'paid_by__group', 'amount', 'split',
+            'paid_to__party_type').annotate(total=Sum('shares__amount')):
+        pk, group_id, split = row['pk'], row['paid_by__group'], row['split']
+        total = row['total']
+        expected = (_cents(row['amount'])
+                    if _expects_shares(split, row['paid_to__party_type'])
+                    else _cents(0))
+        if _cents(total) == expected:
+            continue
+        # Simple payments' shares don't depend on their fractions.
+        fixed = fix and (split == Transaction.SIMPLE or
+                         pk not in bad_fractions) and fix_shares(pk, group_id)
+        problems.append(_problem(
+            SHARE_SUM, group_id, fixed, transaction=pk,
+            expected=str(expected), actual=str(_cents(total))))
+
+    for pk, transaction_id, group_id, party_id in shares.exclude(
+            party__group=F('transaction__paid_by__group')).values_list(
+                'pk', 'transaction', 'transaction__paid_by__group', 'party'):
+        problems.append(_problem(SHARE_GROUP, group_id, share=pk,
+                                 transaction=transaction_id, party=party_id))
+    for pk, group_id, party_id in transactions.filter(
+            paid_to__isnull=False).exclude(
+                paid_to__group=F('paid_by__group')).values_list(
+                    'pk', 'paid_by__group', 'paid_to'):
+        problems.append(_problem(PAYEE_GROUP, group_id, transaction=pk,
+                                 party=party_id))
+    for pk, group_id, category_id in transactions.exclude(
+            category__group=F('paid_by__group')).values_list(
+                'pk', 'paid_by__group', 'category'):
+        problems.append(_problem(CATEGORY_GROUP, group_id, transaction=pk,
+                                 category=category_id))
+    return problems
+
+
+def fix_shares(pk, group_id):
+    """
+    Recomputes the transaction's share amounts from their fractions, with
+    the rounding difference going to the largest share. Returns whether
+    the shares could be fixed.
+
+    """
+    with audit.buffered('check_ledger'), atomic():
+        try:
+            transaction = Transaction.objects.select_for_update().get(pk=pk)
+        except Transaction.DoesNotExist:
+            return False
+        shares = list(transaction.shares.order_by('pk'))
+        before = audit.share_amounts(transaction)
+        paid_to = transaction.paid_to
+        if transaction.split == Transaction.SIMPLE:
+            transaction.shares.all().delete()
+            if paid_to is None or not paid_to.is_member():
+                Share.objects.create(transaction=transaction,
+                                     party_id=transaction.paid_by_id,
+                                     numerator=1, denominator=1,
+                                     amount=transaction.amount)
+        else:
+            denominators = set(share.denominator for share in shares)
+            if (len(denominators) != 1 or
+                    sum(share.numerator for share in shares) !=
+                    shares[0].denominator):
+                return False
+            amounts = [(share.numerator * transaction.amount /
+                        share.denominator).quantize(CENTS)
+                       for share in shares]
+            largest = amounts.index(max(amounts))
+            amounts[largest] += transaction.amount - sum(amounts)
+            for share, amount in zip(shares, amounts):
+                if share.amount != amount:
+                    Share.objects.filter(pk=share.pk).update(amount=amount)
+        audit.record_shares(group_id, transaction, before)
+    record_change(group_id)
+    return True
+
+
+def _totals(queryset, field):
+    return dict(queryset.values_list(field).annotate(Sum('amount')))
+
+
+def check_groups(start, end, fix=False):
+    """
+    Checks the maintained totals of groups with ids from ``start`` up to
+    ``end``.
+
+    """
+    problems = []
+    group_ids = list(Group.objects.filter(
+        pk__gte=start, pk__lt=end).values_list('pk', flat=True))
+    if not group_ids:
+        return problems
+
+    expected = GroupSummary.objects.compute(group_ids)
+    actual = dict((summary[0], summary[1:]) for summary in
+                  GroupSummary.objects.filter(group__in=group_ids
+                                              ).values_list(
+                      'group', 'transaction_count', 'total_spent'))
+    wrong = []
+    for group_id, (count, spent, last) in sorted(expected.items()):
+        summary = actual.get(group_id)
+        if summary is not None and (summary[0], _cents(summary[1])) == (
+                count, _cents(spent)):
+            continue
+        wrong.append(group_id)
+        problems.append(_problem(
+            SUMMARY, group_id, fix, expected=[count, str(_cents(spent))],
+            actual=summary and [summary[0], str(_cents(summary[1]))]))
+    if fix and wrong:
+        GroupSummary.objects.reconcile(wrong)
+
+    # Archived transactions are folded into these; see argus.compaction.
+    archived = ArchivedTransaction.objects.filter(
+        paid_by__group__in=group_ids)
+    paid = _totals(archived, 'paid_by')
+    received = _totals(archived.filter(paid_to__isnull=False), 'paid_to')
+    shares = _totals(ArchivedShare.objects.filter(
+        party__group__in=group_ids), 'party')
+    categories = _totals(archived, 'category')
+
+    changed = set()
+    for pk, group_id, opening_balance in Party.objects.filter(
+            group__in=group_ids).values_list('pk', 'group',
+                                             'opening_balance'):
+        balance = _cents(shares.get(pk, 0) - paid.get(pk, 0) +
+                         received.get(pk, 0))
+        if _cents(opening_balance) == balance:
+            continue
+        if fix:
+            Party.objects.filter(pk=pk).update(opening_balance=balance)
+            changed.add(group_id)
+        problems.append(_problem(OPENING_BALANCE, group_id, fix, party=pk,
+                                 expected=str(balance),
+                                 actual=str(_cents(opening_balance))))
+    for pk, group_id, archived_total in Category.objects.filter(
+            group__in=group_ids).values_list('pk', 'group',
+                                             'archived_total'):
+        total = _cents(categories.get(pk, 0))
+        if _cents(archived_total) == total:
+            continue
+        if fix:
+            Category.objects.filter(pk=pk).update(archived_total=total)
+            changed.add(group_id)
+        problems.append(_problem(ARCHIVED_TOTAL, group_id, fix, category=pk,
+                                 expected=str(total),
+                                 actual=str(_cents(archived_total))))
+    for group_id in changed:
+        GroupSnapshot.invalidate(group_id)
+        record_change(group_id)
+    return problems
+
+
+CHECKS = {
+    'transactions': check_transactions,
+    'groups': check_groups,
+}
+
+
+def check_range(job):
+    """
+    Takes a ``(kind, start, end, fix)`` tuple, where kind is
+    'transactions' or 'groups', and returns ``(job, problems, error)``;
+    for use in a process pool.
+
+    """
+    kind, start, end, fix = job
+    try:
+        return job, CHECKS[kind](start, end, fix), None
+    except Exception as e:
+        return job, [], repr(e)
+    finally:
+        close_old_connections()
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+import threading
+from time import time
+
+
+class LRUCache(object):
+    """
+    Small thread-safe per-process cache which evicts the least recently
+    used entry once full, and expires entries ``ttl`` seconds after they
+    were set.
+
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time():
+                return default
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value):
+        expires = time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,149 @@
+from datetime import datetime
+import json
+from optparse import make_option
+import platform
+import random
+try:
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from SocketServer import ThreadingMixIn
+import threading
+from time import time
+try:
+    from urllib.request import urlopen
+except ImportError:  # Python 2
+    from urllib2 import urlopen
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+
+from argus.models import record_change
+from argus.synthetic import GroupGenerator
+
+
+class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Compares throughput of the group, party and category pages "
+            "with and without ARGUS_CONCURRENT_READS, served by a local "
+            "threaded server to concurrent clients. The synthetic group is "
+            "deleted afterwards.")
+    option_list = BaseCommand.option_list + (
+        make_option('--clients', type='int', default=8),
+        make_option('--requests', type='int', default=200,
+                    help="Requests per page and mode."),
+        make_option('--members', type='int', default=10),
+        make_option('--transactions', type='int', default=1000),
+        make_option('--seed', type='int', default=0),
+        make_option('--warm', action='store_true', default=False,
+                    help="Let pages be served from the fragment cache "
+                         "instead of invalidating it before each request."),
+        make_option('--output', default=None,
+                    help="Write results to this file instead of stdout."),
+    )
+
+    def handle(self, *args, **options):
+        if connection.in_atomic_block:
+            raise CommandError("The server can't see data from an open "
+                               "transaction.")
+        group = GroupGenerator(members=options['members'],
+                               transactions=options['transactions'],
+                               rng=random.Random(options['seed'])).generate()
+        server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                             server_class=ThreadedWSGIServer,
+                             handler_class=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        base = 'http://127.0.0.1:{}'.format(server.server_port)
+        try:
+            member = group.parties.members().order_by('pk')[0]
+            pages = {
+                'group': group.get_absolute_url(),
+                'party': member.get_absolute_url(),
+                'category': group.default_category.get_absolute_url(),
+            }
+            results = {}
+            for mode in ('sync', 'concurrent'):
+                with override_settings(
+                        ARGUS_CONCURRENT_READS=(mode == 'concurrent')):
+                    for page, path in sorted(pages.items()):
+                        results['{}.{}'.format(page, mode)] = self.load(
+                            base + path, group.pk, options)
+        finally:
+            server.shutdown()
+            server.server_close()
+            group.delete()
+
+        report = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': dict((key, options[key]) for key in
+                               ('clients', 'requests', 'members',
+                                'transactions', 'seed', 'warm')),
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def load(self, url, group_id, options):
+        lock = threading.Lock()
+        latencies = []
+        errors = []
+        remaining = [options['requests']]
+
+        def client():
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+                if not options['warm']:
+                    record_change(group_id)
+                start = time()
+                try:
+                    urlopen(url).read()
+                except Exception as e:
+                    with lock:
+                        errors.append(repr(e))
+                    continue
+                with lock:
+                    latencies.append((time() - start) * 1000)
+
+        threads = [threading.Thread(target=client)
+                   for i in range(options['clients'])]
+        start = time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time() - start
+        if not latencies:
+            raise CommandError("Every request to {} failed: {}".format(
+                url, errors[:5]))
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'requests_per_s': round(len(latencies) / elapsed, 2),
+            'median_ms': round(latencies[len(latencies) // 2], 3),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)], 3),
+            'max_ms': round(latencies[-1], 3),
+        }
@@ -0,0 +1,111 @@
+from datetime import datetime
+import json
+from optparse import make_option
+import platform
+import threading
+from time import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from argus.forms import GroupCreateFormSet
+from argus.models import Group, Party
+
+
+class Command(BaseCommand):
+    help = ("Measures group creation throughput with concurrent signups, "
+            "each thread using its own database connection. Created groups "
+            "are deleted afterwards unless --keep is given.")
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', type='int', default=8),
+        make_option('--signups', type='int', default=200,
+                    help="Total number of groups to create."),
+        make_option('--members', type='int', default=4),
+        make_option('--keep', action='store_true', default=False),
+        make_option('--output', default=None,
+                    help="Write results to this file instead of stdout."),
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and options['threads'] > 1:
+            self.stderr.write("SQLite serializes writes; concurrent results "
+                              "will mostly measure lock waits.")
+        members = options['members']
+        data = {
+            'form-TOTAL_FORMS': members,
+            'form-INITIAL_FORMS': 0,
+            'form-MIN_NUM_FORMS': 0,
+            'form-MAX_NUM_FORMS': 1000,
+        }
+        for i in range(members):
+            data['form-{}-name'.format(i)] = u"Member {}".format(i)
+
+        lock = threading.Lock()
+        created = []
+        errors = []
+        latencies = []
+        remaining = [options['signups']]
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not remaining[0]:
+                            return
+                        remaining[0] -= 1
+                    start = time()
+                    formset = GroupCreateFormSet(data,
+                                                 queryset=Party.objects.none())
+                    try:
+                        if not formset.is_valid():
+                            raise ValueError(formset.errors)
+                        group = formset.save()
+                    except Exception as e:
+                        with lock:
+                            errors.append(repr(e))
+                        continue
+                    with lock:
+                        latencies.append((time() - start) * 1000)
+                        created.append(group.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(options['threads'])]
+        start = time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time() - start
+
+        if not options['keep']:
+            Group.objects.filter(pk__in=created).delete()
+
+        if not latencies:
+            raise CommandError("No groups were created: {}".format(errors[:5]))
+        latencies.sort()
+        report = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': dict((key, options[key]) for key in
+                               ('threads', 'signups', 'members')),
+            'results': {
+                'created': len(created),
+                'errors': len(errors),
+                'elapsed_s': round(elapsed, 3),
+                'signups_per_s': round(len(created) / elapsed, 2),
+                'median_ms': round(latencies[len(latencies) // 2], 3),
+                'p95_ms': round(latencies[int(len(latencies) * 0.95)], 3),
+                'max_ms': round(latencies[-1], 3),
+            },
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,81 @@
+import json
+from multiprocessing import Pool
+from optparse import make_option
+import sys
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from argus.integrity import (GROUP_CHUNK_SIZE, TRANSACTION_CHUNK_SIZE,
+                             check_range, id_ranges)
+from argus.models import Group, Transaction
+
+
+class Command(BaseCommand):
+    help = ("Checks that shares add up to their transactions, that their "
+            "fractions are consistent, that nothing refers to another "
+            "group, and that maintained totals match the ledger, using a "
+            "pool of worker processes. Problems are written as JSON lines, "
+            "followed by a summary line; the command fails if any are "
+            "left unfixed.")
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+                    help="Worker processes (default: one per CPU)."),
+        make_option('--chunk-size', type='int',
+                    default=TRANSACTION_CHUNK_SIZE,
+                    help="Transaction ids per worker job."),
+        make_option('--group-chunk-size', type='int',
+                    default=GROUP_CHUNK_SIZE,
+                    help="Group ids per worker job."),
+        make_option('--fix', action='store_true', default=False,
+                    help="Repair problems that have only one possible "
+                         "repair. Don't use while compacting the ledger."),
+        make_option('--output', default=None,
+                    help="File to write the report to (default: stdout)."),
+    )
+
+    def handle(self, *args, **options):
+        jobs = self.jobs(options)
+        # Workers are forked; don't let them inherit an open connection.
+        connection.close()
+        pool = Pool(options['processes'])
+        output = (open(options['output'], 'w') if options['output']
+                  else sys.stdout)
+        started = time()
+        counts = {}
+        unfixed = failed = 0
+        try:
+            for job, problems, error in pool.imap_unordered(check_range,
+                                                            jobs):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write("{} {}-{}: {}".format(
+                        job[0].capitalize(), job[1], job[2] - 1, error))
+                for problem in problems:
+                    counts[problem['check']] = counts.get(
+                        problem['check'], 0) + 1
+                    unfixed += not problem['fixed']
+                    output.write(json.dumps(problem, sort_keys=True) + "\n")
+            output.write(json.dumps({
+                'summary': counts,
+                'unfixed': unfixed,
+                'failed_jobs': failed,
+                'seconds': round(time() - started, 1),
+            }, sort_keys=True) + "\n")
+        finally:
+            pool.close()
+            pool.join()
+            if output is not sys.stdout:
+                output.close()
+        if unfixed or failed:
+            raise CommandError("{} problems left unfixed; {} ranges couldn't "
+                               "be checked.".format(unfixed, failed))
+
+    def jobs(self, options):
+        """Yields worker jobs, first over transactions, then groups."""
+        fix = options['fix']
+        for start, end in id_ranges(Transaction, options['chunk_size']):
+            yield ('transactions', start, end, fix)
+        for start, end in id_ranges(Group, options['group_chunk_size']):
+            yield ('groups', start, end, fix)
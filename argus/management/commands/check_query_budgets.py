@@ -0,0 +1,72 @@
+from optparse import make_option
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic, set_rollback
+from django.test.utils import override_settings
+
+from argus import budgets
+
+
+class Command(BaseCommand):
+    help = ("Renders every argus URL against groups of several sizes and "
+            "fails if query counts grow with data size or exceed the "
+            "snapshot. All data is rolled back.")
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes', default=','.join(
+                        '{}x{}'.format(*size) for size in
+                        budgets.DEFAULT_SIZES),
+                    help="Comma-separated MEMBERSxTRANSACTIONS group sizes. "
+                         "Use at least 10 transactions so that the "
+                         "transaction log is full at every size."),
+        make_option('--snapshot', default=None,
+                    help="Budget snapshot file to check against."),
+        make_option('--update', action='store_true', default=False,
+                    help="Rewrite the snapshot from this run."),
+        make_option('--host', default='localhost',
+                    help="Host header to use; must be in ALLOWED_HOSTS."),
+    )
+
+    def handle(self, *args, **options):
+        path = (options['snapshot'] or
+                getattr(settings, 'ARGUS_QUERY_BUDGET_SNAPSHOT',
+                        budgets.DEFAULT_SNAPSHOT))
+        try:
+            sizes = [tuple(int(n) for n in size.split('x'))
+                     for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("Sizes must look like 3x10,6x50.")
+
+        backend = 'django.core.mail.backends.locmem.EmailBackend'
+        with override_settings(EMAIL_BACKEND=backend), atomic():
+            measurements = [budgets.measure(budgets.seed_group(*size),
+                                            host=options['host'])
+                            for size in sizes]
+            set_rollback(True)
+
+        previous = (budgets.load_snapshot(path) if os.path.exists(path)
+                    else None)
+        if options['update']:
+            snapshot = budgets.make_snapshot(measurements, previous)
+            # Only growth can fail against a fresh snapshot.
+            failures = budgets.compare(snapshot, measurements)
+            if failures:
+                raise CommandError(
+                    "Not updating the snapshot; mark these URLs "
+                    "size_dependent by hand if their growth is "
+                    "intended:\n" + "\n".join(failures))
+            budgets.save_snapshot(path, snapshot)
+            self.stdout.write("Wrote {}".format(path))
+            return
+
+        if previous is None:
+            raise CommandError("No snapshot at {}; run with --update to "
+                               "create one.".format(path))
+        failures = budgets.compare(previous, measurements)
+        if failures:
+            raise CommandError("Query budgets exceeded:\n" +
+                               "\n".join(failures))
+        if int(options['verbosity']) > 0:
+            self.stdout.write("All {} URLs within budget.".format(
+                len(measurements[0])))
@@ -0,0 +1,45 @@
+from datetime import datetime
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import get_current_timezone, make_aware
+
+from argus.compaction import DEFAULT_BATCH_SIZE, compact_group
+from argus.models import Group
+
+
+class Command(BaseCommand):
+    help = ("Moves transactions paid before a date into the archive, "
+            "folding them into opening balances. Safe to rerun if "
+            "interrupted.")
+    option_list = BaseCommand.option_list + (
+        make_option('--before', default=None,
+                    help="Archive transactions paid before this date "
+                         "(YYYY-MM-DD)."),
+        make_option('--group', default=None,
+                    help="Only compact the group with this slug."),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        if not options['before']:
+            raise CommandError("--before is required.")
+        try:
+            cutoff = datetime.strptime(options['before'], '%Y-%m-%d')
+        except ValueError:
+            raise CommandError("--before must be a date (YYYY-MM-DD).")
+        if settings.USE_TZ:
+            cutoff = make_aware(cutoff, get_current_timezone())
+
+        groups = Group.objects.order_by('pk')
+        if options['group']:
+            groups = groups.filter(slug=options['group'])
+            if not groups:
+                raise CommandError("No group with slug {}".format(
+                    options['group']))
+        for group in groups.iterator():
+            archived = compact_group(group, cutoff, options['batch_size'])
+            if archived and int(options['verbosity']) > 0:
+                self.stdout.write("{}: archived {} transactions.".format(
+                    group.slug, archived))
@@ -0,0 +1,44 @@
+from optparse import make_option
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from argus.webhooks import ConnectionPool, deliver, due
+
+
+class Command(BaseCommand):
+    help = ("Delivers pending webhook notifications, one per subscription "
+            "for each burst of changes, retrying failures with backoff. "
+            "Run one instance per deployment.")
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=100),
+        make_option('--loop', action='store_true', default=False,
+                    help="Keep polling for new notifications."),
+        make_option('--interval', type='float', default=1,
+                    help="Seconds between polls with --loop."),
+    )
+
+    def handle(self, *args, **options):
+        pool = ConnectionPool()
+        try:
+            while True:
+                sent = self.deliver_batch(pool, options)
+                if not sent:
+                    if not options['loop']:
+                        break
+                    sleep(options['interval'])
+        finally:
+            pool.close()
+
+    def deliver_batch(self, pool, options):
+        verbose = int(options['verbosity']) > 0
+        subscriptions = list(due()[:options['batch_size']])
+        for subscription in subscriptions:
+            delivered = deliver(subscription, pool)
+            if delivered is False:
+                self.stderr.write("Webhook {} failed.".format(
+                    subscription.pk))
+            elif delivered and verbose:
+                self.stdout.write("Notified {} of changes to {}.".format(
+                    subscription.url, subscription.group.slug))
+        return len(subscriptions)
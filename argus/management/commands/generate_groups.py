@@ -0,0 +1,47 @@
+from optparse import make_option
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from argus.synthetic import GroupGenerator, parse_split_mix
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic groups for benchmarking."
+    option_list = BaseCommand.option_list + (
+        make_option('--groups', type='int', default=1,
+                    help="Number of groups to generate."),
+        make_option('--members', type='int', default=5,
+                    help="Members per group."),
+        make_option('--sinks', type='int', default=3,
+                    help="Expense sources per group."),
+        make_option('--categories', type='int', default=4,
+                    help="Categories per group."),
+        make_option('--transactions', type='int', default=100,
+                    help="Transactions per group."),
+        make_option('--split-mix', default=None,
+                    help="Relative split weights, e.g. "
+                         "'simple=1,even=5,percent=1,amount=1,shares=1'."),
+        make_option('--history-days', type='int', default=365,
+                    help="Spread transactions over this many past days."),
+        make_option('--seed', type='int', default=None,
+                    help="Random seed, for reproducible ledgers."),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            split_mix = (parse_split_mix(options['split_mix'])
+                         if options['split_mix'] else None)
+            generator = GroupGenerator(members=options['members'],
+                                       sinks=options['sinks'],
+                                       categories=options['categories'],
+                                       transactions=options['transactions'],
+                                       split_mix=split_mix,
+                                       history_days=options['history_days'],
+                                       rng=random.Random(options['seed']))
+        except ValueError as e:
+            raise CommandError(e)
+        for i in range(options['groups']):
+            group = generator.generate()
+            if int(options['verbosity']) > 0:
+                self.stdout.write(group.get_absolute_url())
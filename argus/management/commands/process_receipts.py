@@ -0,0 +1,66 @@
+from multiprocessing import Pool
+from optparse import make_option
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from argus.models import Party, Receipt, record_change
+from argus.receipts import render_variants
+
+
+class Command(BaseCommand):
+    help = ("Renders thumbnails and previews for pending receipts using a "
+            "pool of worker processes. Run one instance per deployment.")
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+                    help="Worker processes (default: one per CPU)."),
+        make_option('--batch-size', type='int', default=100),
+        make_option('--loop', action='store_true', default=False,
+                    help="Keep polling for new receipts."),
+        make_option('--interval', type='float', default=5,
+                    help="Seconds between polls with --loop."),
+    )
+
+    def handle(self, *args, **options):
+        # Workers are forked; don't let them inherit an open connection.
+        connection.close()
+        pool = Pool(options['processes'])
+        try:
+            while True:
+                processed = self.process_batch(pool, options['batch_size'])
+                if processed and int(options['verbosity']) > 0:
+                    self.stdout.write("Processed {} receipts.".format(
+                        processed))
+                if not processed:
+                    if not options['loop']:
+                        break
+                    sleep(options['interval'])
+        finally:
+            pool.close()
+            pool.join()
+
+    def process_batch(self, pool, batch_size):
+        jobs = list(Receipt.objects.filter(status=Receipt.PENDING
+                                           ).order_by('pk'
+                                           ).values_list('pk', 'image',
+                                                         'sha1'
+                                           )[:batch_size])
+        if not jobs:
+            return 0
+        for pk, variants, error in pool.imap_unordered(render_variants, jobs):
+            if error is not None:
+                self.stderr.write("Receipt {}: {}".format(pk, error))
+                Receipt.objects.filter(pk=pk).update(status=Receipt.FAILED)
+            else:
+                Receipt.objects.filter(pk=pk).update(
+                    status=Receipt.READY,
+                    thumbnail=variants['thumbnail'],
+                    preview=variants['preview'])
+        # Cached transaction logs don't show the new thumbnails yet.
+        group_ids = Party.objects.filter(
+            transactions_paid__receipts__pk__in=[job[0] for job in jobs]
+        ).values_list('group', flat=True).distinct()
+        for group_id in group_ids:
+            record_change(group_id)
+        return len(jobs)
@@ -0,0 +1,59 @@
+from optparse import make_option
+from time import sleep
+
+from django.core.management.base import BaseCommand, CommandError
+
+from argus.models import Group, Party
+from argus.purge import (DEFAULT_BATCH_SIZE, purge_group, purge_party,
+                         request_group_purge)
+
+
+class Command(BaseCommand):
+    help = ("Deletes groups and parties flagged for purging, in batches. "
+            "Interrupted purges continue on the next run. Run one instance "
+            "per deployment.")
+    option_list = BaseCommand.option_list + (
+        make_option('--group', default=None,
+                    help="Flag the group with this slug for purging first."),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE),
+        make_option('--loop', action='store_true', default=False,
+                    help="Keep polling for new purge requests."),
+        make_option('--interval', type='float', default=30,
+                    help="Seconds between polls with --loop."),
+    )
+
+    def handle(self, *args, **options):
+        if options['group']:
+            try:
+                group = Group.objects.get(slug=options['group'])
+            except Group.DoesNotExist:
+                raise CommandError("No group with slug {}".format(
+                    options['group']))
+            request_group_purge(group)
+        while True:
+            purged = self.purge_pending(options)
+            if not purged:
+                if not options['loop']:
+                    break
+                sleep(options['interval'])
+
+    def purge_pending(self, options):
+        verbose = int(options['verbosity']) > 0
+        groups = Group.objects.filter(purge_requested__isnull=False
+                                      ).order_by('purge_requested')
+        parties = Party.objects.filter(purge_requested__isnull=False,
+                                       group__purge_requested__isnull=True
+                                       ).order_by('purge_requested')
+        purged = 0
+        for group in groups:
+            purge_group(group, options['batch_size'])
+            purged += 1
+            if verbose:
+                self.stdout.write("Purged group {}.".format(group.slug))
+        for party in parties:
+            purge_party(party, options['batch_size'])
+            purged += 1
+            if verbose:
+                self.stdout.write("Purged party {} of group {}.".format(
+                    party.pk, party.group_id))
+        return purged
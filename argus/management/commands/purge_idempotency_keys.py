@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+
+from argus.models import IdempotencyKey
+
+
+class Command(NoArgsCommand):
+    help = "Deletes expired transaction idempotency keys."
+
+    def handle_noargs(self, **options):
+        count = IdempotencyKey.objects.purge_expired()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Purged {} expired idempotency keys.".format(count))
@@ -0,0 +1,60 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from argus.models import GroupShard
+from argus.rebalance import (DEFAULT_BATCH_SIZE, MoveError, move_group,
+                             register_groups)
+from argus.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = ("Moves a group to another shard, or with --register adds "
+            "groups created before sharding to the shard map.")
+    option_list = BaseCommand.option_list + (
+        make_option('--register', action='store_true', default=False,
+                    help="Add every shard's unmapped groups to the shard "
+                         "map."),
+        make_option('--group', default=None,
+                    help="Slug of the group to move."),
+        make_option('--to', default=None,
+                    help="Alias of the shard to move the group to."),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE),
+        make_option('--settle', type='float', default=5,
+                    help="Seconds to let the group's requests in progress "
+                         "finish before copying."),
+    )
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        if not shards:
+            raise CommandError("ARGUS_SHARDS is not set.")
+        verbose = int(options['verbosity']) > 0
+        if options['register']:
+            for alias in shards:
+                added = register_groups(alias)
+                if verbose:
+                    self.stdout.write("Registered {} groups on {}.".format(
+                        added, alias))
+            # New ids must follow the registered ones.
+            connection = connections[DEFAULT_DB_ALIAS]
+            cursor = connection.cursor()
+            for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                         [GroupShard]):
+                cursor.execute(sql)
+            return
+        if not options['group'] or not options['to']:
+            raise CommandError("Pass --group and --to, or --register.")
+        if options['to'] not in shards:
+            raise CommandError("{} is not in ARGUS_SHARDS.".format(
+                options['to']))
+        try:
+            move_group(options['group'], options['to'],
+                       options['batch_size'], options['settle'])
+        except MoveError as e:
+            raise CommandError(str(e))
+        if verbose:
+            self.stdout.write("Moved {} to {}.".format(options['group'],
+                                                      options['to']))
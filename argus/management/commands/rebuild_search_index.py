@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from argus.models import Group
+from argus import search
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the transaction search index, e.g. after bulk "
+            "imports, which don't trigger indexing.")
+    option_list = BaseCommand.option_list + (
+        make_option('--group', default=None,
+                    help="Only reindex the group with this slug."),
+    )
+
+    def handle(self, *args, **options):
+        group_id = None
+        if options['group']:
+            try:
+                group_id = Group.objects.get(slug=options['group']).pk
+            except Group.DoesNotExist:
+                raise CommandError("No group with slug {}".format(
+                    options['group']))
+        search.rebuild_index(group_id)
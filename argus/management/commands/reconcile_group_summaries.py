@@ -0,0 +1,28 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from argus.models import Group, GroupSummary
+
+
+class Command(BaseCommand):
+    help = ("Recomputes group summary counters from the ledger, e.g. after "
+            "bulk imports, which don't update them.")
+    option_list = BaseCommand.option_list + (
+        make_option('--group', default=None,
+                    help="Only reconcile the group with this slug."),
+        make_option('--batch-size', type='int', default=500),
+    )
+
+    def handle(self, *args, **options):
+        group_ids = None
+        if options['group']:
+            try:
+                group_ids = [Group.objects.get(slug=options['group']).pk]
+            except Group.DoesNotExist:
+                raise CommandError("No group with slug {}".format(
+                    options['group']))
+        fixed = GroupSummary.objects.reconcile(group_ids,
+                                               options['batch_size'])
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Fixed {} group summaries.".format(fixed))
@@ -0,0 +1,180 @@
+from datetime import datetime
+import json
+from optparse import make_option
+import os
+import platform
+import random
+import subprocess
+from time import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+
+from argus.models import Party, Share, Transaction, record_change
+from argus.synthetic import GroupGenerator
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(timings, queries):
+    timings = sorted(timings)
+    count = len(timings)
+    middle = count // 2
+    if count % 2:
+        median = timings[middle]
+    else:
+        median = (timings[middle - 1] + timings[middle]) / 2
+    return {
+        'iterations': count,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(median, 3),
+        'mean_ms': round(sum(timings) / count, 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': queries,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Times argus views and model paths against a synthetic group "
+            "and writes the results as JSON. All data is rolled back.")
+    option_list = BaseCommand.option_list + (
+        make_option('--members', type='int', default=10),
+        make_option('--transactions', type='int', default=1000),
+        make_option('--history-days', type='int', default=365),
+        make_option('--iterations', type='int', default=20),
+        make_option('--seed', type='int', default=0),
+        make_option('--host', default='localhost',
+                    help="Host header to use; must be in ALLOWED_HOSTS."),
+        make_option('--output', default=None,
+                    help="Write results to this file instead of stdout."),
+    )
+
+    def handle(self, *args, **options):
+        with atomic():
+            results = self.run(options)
+            set_rollback(True)
+        report = {
+            'revision': _git_revision(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': dict((key, options[key]) for key in
+                               ('members', 'transactions', 'history_days',
+                                'iterations', 'seed')),
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        generator = GroupGenerator(members=options['members'],
+                                   transactions=options['transactions'],
+                                   history_days=options['history_days'],
+                                   rng=random.Random(options['seed']))
+        group = generator.generate()
+        member = group.parties.members().order_by('pk')[0]
+        category = group.default_category
+        transaction = Transaction.objects.filter(
+            paid_by__group=group, split=Transaction.EVEN).order_by('pk')[0]
+        members = list(group.parties.members())
+        client = Client(HTTP_HOST=options['host'])
+        iterations = options['iterations']
+
+        def get(url):
+            def view():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError("GET {} returned {}".format(
+                        url, response.status_code))
+            return view
+
+        def cold(func):
+            # Forces fragment cache misses, for comparison with the warm runs.
+            def view():
+                record_change(group.pk)
+                func()
+            return view
+
+        update_url = reverse('argus_transaction_update',
+                             kwargs={'group_slug': group.slug,
+                                     'pk': transaction.pk})
+
+        def post_update():
+            current = Transaction.objects.get(pk=transaction.pk)
+            data = {
+                'paid_by': current.paid_by_id,
+                'paid_to': current.paid_to_id or '',
+                'memo': current.memo,
+                'amount': current.amount,
+                'paid_at': current.paid_at.strftime(
+                    '%Y-%m-%d %H:%M:%S'),
+                'category': current.category_id,
+                'notes': current.notes,
+                'split': Transaction.EVEN,
+                'sharers': [m.pk for m in members],
+                'version': current.version,
+            }
+            for m in members:
+                data['member{}'.format(m.pk)] = 0
+            response = client.post(update_url, data)
+            if response.status_code != 302:
+                raise CommandError("POST {} returned {}".format(
+                    update_url, response.status_code))
+
+        def party_balance():
+            party = Party.objects.get(pk=member.pk)
+            party.balance
+
+        def create_split():
+            with atomic():
+                Share.objects.create_split(transaction,
+                                           [(m, 1) for m in members])
+                set_rollback(True)
+
+        benchmarks = (
+            ('GroupDetailView', get(group.get_absolute_url())),
+            ('GroupDetailView.cold',
+             cold(get(group.get_absolute_url()))),
+            ('PartyDetailView', get(member.get_absolute_url())),
+            ('PartyDetailView.cold', cold(get(member.get_absolute_url()))),
+            ('CategoryDetailView', get(category.get_absolute_url())),
+            ('CategoryDetailView.cold',
+             cold(get(category.get_absolute_url()))),
+            ('TransactionUpdateView.get', get(update_url)),
+            ('TransactionUpdateView.post', post_update),
+            ('Party.balance', party_balance),
+            ('Share.create_split', create_split),
+        )
+        results = {}
+        for name, func in benchmarks:
+            # Warm up caches and count queries outside the timed runs.
+            with CaptureQueriesContext(connection) as captured:
+                func()
+            timings = []
+            for i in range(iterations):
+                start = time()
+                func()
+                timings.append((time() - start) * 1000)
+            results[name] = _summarize(timings, len(captured))
+            if int(options['verbosity']) > 1:
+                self.stderr.write("{}: {median_ms} ms".format(
+                    name, **results[name]))
+        return results
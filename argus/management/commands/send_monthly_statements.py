@@ -0,0 +1,84 @@
+from datetime import datetime
+from multiprocessing import Pool
+from optparse import make_option
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from argus.monthly import (CHUNK_SIZE, get_site, pending_group_ids,
+                           previous_month, send_chunk, unsent_group_ids)
+
+
+class Command(BaseCommand):
+    help = ("Emails each group with a confirmed email its statement for a "
+            "month (by default the last one), using a pool of worker "
+            "processes. Groups already sent the month's statement are "
+            "skipped, so an interrupted run can be repeated. Run one "
+            "instance per deployment.")
+    option_list = BaseCommand.option_list + (
+        make_option('--month', default=None,
+                    help="Month to send, as YYYY-MM."),
+        make_option('--processes', type='int', default=None,
+                    help="Worker processes (default: one per CPU)."),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+                    help="Groups per worker job."),
+        make_option('--domain', default=None,
+                    help="Domain for links (default: the current Site)."),
+        make_option('--protocol', default='https'),
+        make_option('--resend-unsent', action='store_true', default=False,
+                    help="Retry groups claimed by a run that crashed before "
+                         "sending their statements. Some of them may get "
+                         "the statement twice."),
+    )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--month must look like 2015-01.")
+        else:
+            month = previous_month()
+        site = get_site(options['domain'])
+        chunk_size = options['chunk_size']
+
+        if options['resend_unsent']:
+            unsent = unsent_group_ids(month)
+            jobs = [(unsent[i:i + chunk_size], month, site,
+                     options['protocol'], False)
+                    for i in range(0, len(unsent), chunk_size)]
+        else:
+            jobs = self.pending_jobs(month, site, options)
+
+        # Workers are forked; don't let them inherit an open connection.
+        connection.close()
+        pool = Pool(options['processes'])
+        started = time()
+        sent = failed = 0
+        try:
+            for group_ids, count, error in pool.imap_unordered(send_chunk,
+                                                               jobs):
+                sent += count
+                if error is not None:
+                    failed += len(group_ids)
+                    self.stderr.write("Groups {}-{}: {}".format(
+                        group_ids[0], group_ids[-1], error))
+        finally:
+            pool.close()
+            pool.join()
+        if int(options['verbosity']) > 0:
+            self.stdout.write(
+                "Sent {} statements for {:%B %Y} in {:.0f}s; {} failed."
+                .format(sent, month, time() - started, failed))
+
+    def pending_jobs(self, month, site, options):
+        """Yields jobs for chunks of groups not yet claimed."""
+        after = 0
+        while True:
+            group_ids = pending_group_ids(month, after,
+                                          options['chunk_size'])
+            if not group_ids:
+                return
+            after = group_ids[-1]
+            yield (group_ids, month, site, options['protocol'], True)
@@ -0,0 +1,60 @@
+import json
+from optparse import make_option
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.management.base import BaseCommand
+
+from argus.webhooks import check_signature
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Runs a local stand-in for a webhook receiver, which prints "
+            "each delivery and whether its signature is valid. Subscribe "
+            "http://localhost:<port>/ to try webhooks out.")
+    option_list = BaseCommand.option_list + (
+        make_option('--port', type='int', default=8001),
+        make_option('--secret', default=None,
+                    help="The subscription's secret, to check signatures."),
+        make_option('--fail', type='int', default=0,
+                    help="Answer this many deliveries with HTTP 500 first, "
+                         "to try out retries."),
+    )
+
+    def handle(self, *args, **options):
+        failures = [options['fail']]
+
+        def app(environ, start_response):
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(length)
+            if options['secret'] is None:
+                verified = "unchecked"
+            elif check_signature(options['secret'],
+                                 environ.get('HTTP_X_ARGUS_TIMESTAMP', ''),
+                                 body,
+                                 environ.get('HTTP_X_ARGUS_SIGNATURE', '')):
+                verified = "valid"
+            else:
+                verified = "INVALID"
+            if failures[0] > 0:
+                failures[0] -= 1
+                status = '500 Internal Server Error'
+            else:
+                status = '204 No Content'
+            self.stdout.write("{} (signature {}): {}".format(
+                status, verified, json.loads(body.decode('utf-8'))))
+            start_response(status, [])
+            return []
+
+        server = make_server('localhost', options['port'], app,
+                             handler_class=QuietHandler)
+        self.stdout.write("Listening on http://localhost:{}/".format(
+            options['port']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
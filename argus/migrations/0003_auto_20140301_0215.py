@@ -12,16 +12,17 @@ def noop(apps, schema_editor):
 def create_default_category(apps, schema_editor):
     Group = apps.get_model("argus", "Group")
     Category = apps.get_model("argus", "Category")
+    db = schema_editor.connection.alias
 
-    for group in Group.objects.all():
-        Category.objects.get_or_create(name=DEFAULT_NAME,
+    for group in Group.objects.using(db):
+        Category.objects.using(db).get_or_create(name=DEFAULT_NAME,
                                        group=group)
 
 
 def add_default_category(apps, schema_editor):
     Group = apps.get_model("argus", "Group")
 
-    for group in Group.objects.all():
+    for group in Group.objects.using(schema_editor.connection.alias):
         category = group.category_set.get(name=DEFAULT_NAME)
         group.default_category = category
         group.save()
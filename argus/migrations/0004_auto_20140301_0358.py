@@ -9,10 +9,11 @@ def noop(apps, schema_editor):
 def assign_default_category(apps, schema_editor):
     Group = apps.get_model("argus", "Group")
     Transaction = apps.get_model("argus", "Transaction")
+    db = schema_editor.connection.alias
 
-    for group in Group.objects.all():
-        qs = Transaction.objects.filter(paid_by__group=group,
-                                        category__isnull=True)
+    for group in Group.objects.using(db):
+        qs = Transaction.objects.using(db).filter(paid_by__group=group,
+                                                  category__isnull=True)
         qs.update(category=group.default_category)
 
 
@@ -4,7 +4,7 @@ from django.db import models, migrations
 
 def percent_to_numdenom(apps, schema_editor):
     Share = apps.get_model("argus", "Share")
-    for share in Share.objects.all():
+    for share in Share.objects.using(schema_editor.connection.alias):
         share.denominator = 10000
         share.numerator = share.portion * 10000
         share.fraction_is_manual = share.portion_is_manual
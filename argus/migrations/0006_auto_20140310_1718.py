@@ -4,11 +4,12 @@ from django.db import models, migrations
 
 def copy_manualness(apps, schema_editor):
     Transaction = apps.get_model("argus", "Transaction")
-    fractions = Transaction.objects.filter(split='manual',
-                                           share__fraction_is_manual=True)
+    transactions = Transaction.objects.using(schema_editor.connection.alias)
+    fractions = transactions.filter(split='manual',
+                                    share__fraction_is_manual=True)
     fractions.update(split='percent')
-    amounts = Transaction.objects.filter(split='manual',
-                                         share__amount_is_manual=True)
+    amounts = transactions.filter(split='manual',
+                                  share__amount_is_manual=True)
     amounts.update(split='amount')
 
 
@@ -0,0 +1,31 @@
+# encoding: utf8
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0006_auto_20140310_1718'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group', models.ForeignKey(to='argus.Group', to_field=u'id')),
+                ('key', models.CharField(max_length=64)),
+                ('location', models.CharField(max_length=255, blank=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='idempotencykey',
+            unique_together=set([('group', 'key')]),
+        ),
+    ]
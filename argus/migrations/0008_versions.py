@@ -0,0 +1,24 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# encoding: utf8
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0008_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Receipt',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('transaction', models.ForeignKey(to='argus.Transaction', to_field=u'id')),
+                ('sha1', models.CharField(max_length=40, db_index=True)),
+                ('image', models.FileField(max_length=255, upload_to='argus/receipts')),
+                ('thumbnail', models.FileField(max_length=255, upload_to='argus/receipts/thumbnails', blank=True)),
+                ('preview', models.FileField(max_length=255, upload_to='argus/receipts/previews', blank=True)),
+                ('status', models.CharField(default='pending', max_length=7, db_index=True, choices=[('pending', u'Pending'), ('ready', u'Ready'), ('failed', u'Failed')])),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# encoding: utf8
+from django.db import models, migrations, OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE argus_transaction_fts USING fts5("
+            "memo, notes, group_id UNINDEXED, tokenize='unicode61')")
+    except OperationalError:
+        # SQLite was built without FTS5; argus.search falls back to the
+        # SearchToken table.
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS argus_transaction_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0009_receipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group', models.ForeignKey(to='argus.Group', to_field=u'id')),
+                ('transaction', models.ForeignKey(to='argus.Transaction', to_field=u'id')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchtoken',
+            index_together=set([('group', 'token')]),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,61 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0010_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='archived_before',
+            field=models.DateTimeField(null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='party',
+            name='opening_balance',
+            field=models.DecimalField(default=0, editable=False, max_digits=11, decimal_places=2),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='archived_total',
+            field=models.DecimalField(default=0, editable=False, max_digits=11, decimal_places=2),
+            preserve_default=True,
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('paid_by', models.ForeignKey(related_name='+', to='argus.Party', to_field=u'id')),
+                ('paid_to', models.ForeignKey(related_name='+', to_field=u'id', blank=True, to='argus.Party', null=True)),
+                ('memo', models.CharField(max_length=64)),
+                ('amount', models.DecimalField(max_digits=11, decimal_places=2)),
+                ('paid_at', models.DateTimeField()),
+                ('category', models.ForeignKey(related_name='+', to='argus.Category', to_field=u'id')),
+                ('notes', models.TextField(blank=True)),
+                ('split', models.CharField(max_length=7, choices=[('simple', u'Simple payment'), ('even', u'Even split'), ('percent', u'Manual percentages'), ('amount', u'Manual amounts'), ('shares', u'Manual shares')])),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ArchivedShare',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('transaction', models.ForeignKey(related_name='shares', to='argus.ArchivedTransaction', to_field=u'id')),
+                ('party', models.ForeignKey(related_name='+', to='argus.Party', to_field=u'id')),
+                ('amount', models.DecimalField(max_digits=11, decimal_places=2)),
+                ('numerator', models.PositiveIntegerField()),
+                ('denominator', models.PositiveIntegerField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+def create_summaries(apps, schema_editor):
+    Group = apps.get_model('argus', 'Group')
+    GroupSummary = apps.get_model('argus', 'GroupSummary')
+    db = schema_editor.connection.alias
+    stats = dict((pk, [0, 0, None]) for pk in
+                 Group.objects.using(db).values_list('pk', flat=True))
+    for name in ('Transaction', 'ArchivedTransaction'):
+        rows = apps.get_model('argus', name).objects.using(db)
+        for row in rows.values('paid_by__group').annotate(
+                count=models.Count('pk'), last=models.Max('paid_at')):
+            group_stats = stats[row['paid_by__group']]
+            group_stats[0] += row['count']
+            group_stats[2] = max(group_stats[2] or row['last'], row['last'])
+        for group_id, spent in rows.exclude(
+                split='simple', paid_to__party_type='member'
+                ).values_list('paid_by__group').annotate(
+                    models.Sum('amount')):
+            stats[group_id][1] += spent
+    GroupSummary.objects.using(db).bulk_create([
+        GroupSummary(group_id=group_id, transaction_count=count,
+                     total_spent=spent, last_activity=last)
+        for group_id, (count, spent, last) in stats.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0011_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupSummary',
+            fields=[
+                ('group', models.OneToOneField(related_name='summary', primary_key=True, serialize=False, to='argus.Group', to_field=u'id')),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(default=0, max_digits=13, decimal_places=2)),
+                ('last_activity', models.DateTimeField(db_index=True, null=True, blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'group summaries',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(create_summaries, lambda apps, schema_editor: None),
+    ]
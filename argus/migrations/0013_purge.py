@@ -0,0 +1,24 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0012_groupsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='purge_requested',
+            field=models.DateTimeField(db_index=True, null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='party',
+            name='purge_requested',
+            field=models.DateTimeField(db_index=True, null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+    ]
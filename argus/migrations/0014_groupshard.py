@@ -0,0 +1,24 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0013_purge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupShard',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('slug', models.CharField(unique=True, max_length=50)),
+                ('shard', models.CharField(max_length=64)),
+                ('moving', models.BooleanField(default=False)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
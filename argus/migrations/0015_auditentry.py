@@ -0,0 +1,33 @@
+# encoding: utf8
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0014_groupshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group', models.ForeignKey(related_name='audit_entries', to='argus.Group', to_field=u'id')),
+                ('model', models.CharField(max_length=11)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.CharField(max_length=6, choices=[('create', 'Created'), ('update', 'Changed'), ('delete', 'Deleted')])),
+                ('actor', models.CharField(max_length=64, blank=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payload', models.BinaryField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='auditentry',
+            index_together=set([('group', 'id')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# encoding: utf8
+from django.db import models, migrations
+import django.utils.timezone
+import argus.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0015_auditentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookSubscription',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group', models.ForeignKey(related_name='webhooks', to='argus.Group', to_field=u'id')),
+                ('url', models.URLField(max_length=255)),
+                ('secret', models.CharField(default=argus.models._webhook_secret, max_length=32, editable=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pending_since', models.DateTimeField(db_index=True, null=True, editable=False, blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0, editable=False)),
+                ('retry_at', models.DateTimeField(null=True, editable=False, blank=True)),
+                ('last_delivered', models.DateTimeField(null=True, editable=False, blank=True)),
+                ('last_error', models.CharField(max_length=255, editable=False, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
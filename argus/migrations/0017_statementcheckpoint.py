@@ -0,0 +1,30 @@
+# encoding: utf8
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0016_webhooksubscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementCheckpoint',
+            fields=[
+                (u'id', models.AutoField(verbose_name=u'ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group', models.ForeignKey(related_name='+', to='argus.Group', to_field=u'id')),
+                ('month', models.DateField()),
+                ('claimed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent', models.DateTimeField(null=True, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='statementcheckpoint',
+            unique_together=set([('month', 'group')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# encoding: utf8
+from django.db import models, migrations
+
+from argus import audit
+
+
+def hide_addresses(apps, schema_editor):
+    AuditEntry = apps.get_model('argus', 'AuditEntry')
+    entries = AuditEntry.objects.using(schema_editor.connection.alias)
+    actors = entries.exclude(actor='').values_list('actor', flat=True)
+    addresses = [actor for actor in actors.distinct()
+                 if audit.is_address(actor)]
+    for i in range(0, len(addresses), 500):
+        entries.filter(actor__in=addresses[i:i + 500]).update(
+            actor=audit.MEMBER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0017_statementcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(hide_addresses, lambda apps, schema_editor: None),
+    ]
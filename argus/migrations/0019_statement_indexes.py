@@ -0,0 +1,16 @@
+# encoding: utf8
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('argus', '0018_audit_actors'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='transaction',
+            index_together=set([('paid_by', 'paid_at'), ('paid_to', 'paid_at')]),
+        ),
+    ]
@@ -1,23 +1,96 @@
 # encoding: utf-8
 
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
+import hashlib
 import random
+import threading
+from time import time
 
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.urlresolvers import reverse
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, IntegrityError
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.utils.crypto import get_random_string, salted_hmac
 from django.utils.encoding import smart_text
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 
+from argus import audit
+from argus.lru import LRUCache
+from argus.replicas import note_group_write
+from argus.sharding import atomic, invalidate_group_shard, sharding_enabled
+from argus.webhooks import invalidate_webhooks, note_ledger_change
+
 
 URL_SAFE_CHARS = ('abcdefghijklmnopqrstuvwxyz'
                   'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
                   '0123456789-_~.')
 
 
-class Group(models.Model):
+class VersionConflict(Exception):
+    pass
+
+
+class VersionedModel(models.Model):
+    """
+    Adds a version counter which every edit bumps with a conditional
+    UPDATE, so that two people editing the same row at once get a
+    conflict instead of silently overwriting each other.
+
+    """
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def claim_version(self, version):
+        """
+        Bumps the stored version if it still equals ``version``, raising
+        VersionConflict otherwise. Must be called inside a transaction: the
+        UPDATE holds the row lock until commit, which serializes concurrent
+        editors of this row (and only this row).
+
+        """
+        manager = type(self)._default_manager
+        updated = manager.filter(pk=self.pk, version=version
+                                 ).update(version=models.F('version') + 1)
+        if not updated:
+            raise VersionConflict(u"{} was changed by someone else."
+                                  .format(smart_text(self)))
+        self.version = version + 1
+
+
+class GroupManager(models.Manager):
+    SLUG_LENGTH = 6
+    SLUG_ATTEMPTS = 10
+
+    def create_with_random_slug(self, **kwargs):
+        """
+        Creates a group with a random slug. Collisions are left to the
+        unique constraint and retried, rather than checked for first,
+        which would race with concurrent signups.
+
+        """
+        for attempt in range(self.SLUG_ATTEMPTS):
+            kwargs['slug'] = get_random_string(length=self.SLUG_LENGTH,
+                                               allowed_chars=URL_SAFE_CHARS)
+            try:
+                with atomic(using=self.db):
+                    return self.create(**kwargs)
+            except IntegrityError:
+                continue
+        raise IntegrityError("Could not allocate a unique group slug.")
+
+
+class Group(VersionedModel):
     SESSION_KEY = '_argus_group_id'
     SLUG_REGEX = "[\w_~\.-]+"
 
@@ -34,9 +107,22 @@ class Group(models.Model):
     currency = models.CharField(max_length=3, default='USD')
     default_category = models.OneToOneField('Category', blank=True, null=True,
                                             related_name='default_for')
+    # Transactions paid before this have been moved to the archive.
+    archived_before = models.DateTimeField(blank=True, null=True,
+                                           editable=False)
+    # Set when the group is to be deleted by the purge worker.
+    purge_requested = models.DateTimeField(blank=True, null=True,
+                                           editable=False, db_index=True)
 
     created = models.DateTimeField(default=now)
 
+    objects = GroupManager()
+
+    def __init__(self, *args, **kwargs):
+        super(Group, self).__init__(*args, **kwargs)
+        # Remembered so that renaming can invalidate the old slug's route.
+        self._loaded_slug = self.slug
+
     def __unicode__(self):
         return smart_text(self.name or self.slug)
 
@@ -47,6 +133,24 @@ class Group(models.Model):
     def set_password(self, raw_password):
         self.password = make_password(raw_password)
 
+    def get_snapshot(self):
+        """
+        Returns this group's parties and categories, cached until one of
+        them (or the group) is saved or deleted.
+
+        """
+        key = GroupSnapshot.cache_key(self.pk)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = GroupSnapshot(list(self.parties.order_by('pk')),
+                                     list(self.categories.order_by('pk')))
+            cache.set(key, snapshot)
+        return snapshot
+
+    @property
+    def change_version(self):
+        return get_change_version(self.pk)
+
     def check_password(self, raw_password):
         """
         Returns a boolean of whether the raw_password was correct. Handles
@@ -59,6 +163,83 @@ class Group(models.Model):
         return check_password(raw_password, self.password, setter)
 
 
+class GroupSnapshot(object):
+    """
+    Picklable view of a group's parties and categories, enough to build
+    transaction forms without querying.
+
+    """
+    def __init__(self, parties, categories):
+        self.parties = parties
+        self.categories = categories
+        self.members = [party for party in parties if party.is_member()]
+
+    @staticmethod
+    def cache_key(group_id):
+        return 'argus:group-snapshot:{}'.format(group_id)
+
+    @classmethod
+    def invalidate(cls, group_id):
+        cache.delete(cls.cache_key(group_id))
+
+
+GroupRoute = namedtuple('GroupRoute', ('group_id', 'slug', 'has_password',
+                                       'password_fingerprint', 'currency',
+                                       'default_category_id'))
+
+
+def password_fingerprint(password):
+    """
+    Returns a short digest of a password hash, which changes whenever the
+    password is set, or '' for no password.
+
+    """
+    if not password:
+        return ''
+    return salted_hmac('argus.models.password_fingerprint',
+                       password).hexdigest()[:16]
+
+# Routes are shared between processes through the cache; the local copy
+# only lives for a few seconds since other processes can't invalidate it.
+_local_routes = LRUCache(
+    maxsize=getattr(settings, 'ARGUS_GROUP_ROUTE_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'ARGUS_GROUP_ROUTE_CACHE_TTL', 5))
+
+
+def _route_cache_key(slug):
+    return 'argus:group-route:v2:{}'.format(slug)
+
+
+def get_group_route(slug):
+    """
+    Returns a GroupRoute with what's needed to authorize a request for the
+    group with the given slug, or None if there is no such group.
+
+    """
+    route = _local_routes.get(slug)
+    if route is None:
+        route = cache.get(_route_cache_key(slug))
+        if route is None:
+            values = Group.objects.filter(
+                slug=slug, purge_requested__isnull=True).values_list(
+                'pk', 'password', 'currency', 'default_category')
+            if not values:
+                return None
+            pk, password, currency, default_category_id = values[0]
+            route = GroupRoute(pk, slug, bool(password),
+                               password_fingerprint(password), currency,
+                               default_category_id)
+            cache.set(_route_cache_key(slug), route)
+        _local_routes.set(slug, route)
+    return route
+
+
+def invalidate_group_route(*slugs):
+    for slug in slugs:
+        _local_routes.delete(slug)
+        cache.delete(_route_cache_key(slug))
+
+
 class PartyManager(models.Manager):
     use_for_related_fields = True
 
@@ -81,6 +262,12 @@ class Party(models.Model):
     group = models.ForeignKey(Group, related_name='parties')
     party_type = models.CharField(max_length=11, choices=TYPE_CHOICES,
                                   default=SINK)
+    # Balance carried over from archived transactions.
+    opening_balance = models.DecimalField(max_digits=11, decimal_places=2,
+                                          default=0, editable=False)
+    # Set when the party is to be deleted by the purge worker.
+    purge_requested = models.DateTimeField(blank=True, null=True,
+                                           editable=False, db_index=True)
 
     objects = PartyManager()
 
@@ -100,7 +287,7 @@ class Party(models.Model):
             paid = -1 * (self.transactions_paid.aggregate(models.Sum('amount'))['amount__sum'] or 0)
             received = self.transactions_received.aggregate(models.Sum('amount'))['amount__sum'] or 0
             shares = self.shares.aggregate(models.Sum('amount'))['amount__sum'] or 0
-            self._balance = sum((shares, paid, received))
+            self._balance = sum((self.opening_balance, shares, paid, received))
         return self._balance
 
     def is_member(self):
@@ -111,6 +298,9 @@ class Category(models.Model):
     DEFAULT_NAME = _("Uncategorized")
     name = models.CharField(max_length=64)
     group = models.ForeignKey(Group, related_name='categories')
+    # Total of archived transactions in this category.
+    archived_total = models.DecimalField(max_digits=11, decimal_places=2,
+                                         default=0, editable=False)
 
     class Meta:
         verbose_name_plural = 'categories'
@@ -154,11 +344,12 @@ class TransactionManager(models.Manager):
 
         Share.objects.create_split(transaction,
                                    [(member, 1) for member in members])
+        audit.record_shares(paid_by.group_id, transaction, {})
 
         return transaction
 
 
-class Transaction(models.Model):
+class Transaction(VersionedModel):
     """
     Represents an transaction paid by one member which should be shared
     among some or all members.
@@ -197,15 +388,42 @@ class Transaction(models.Model):
 
     objects = TransactionManager()
 
+    class Meta:
+        # For paging through a party's statement; see argus.statements.
+        index_together = (('paid_by', 'paid_at'), ('paid_to', 'paid_at'))
+
     def __unicode__(self):
         return u"{} ({})".format(smart_text(self.memo), self.amount)
 
     def is_manual(self):
         return self.split in (self.PERCENT, self.AMOUNT, self.SHARES)
 
+    @property
+    def spent(self):
+        """
+        The amount this transaction adds to the group's spending: all of
+        it, unless it's a payment between members, which only settles a
+        debt.
+
+        """
+        if (self.split == self.SIMPLE and self.paid_to_id is not None and
+                self.paid_to.is_member()):
+            return 0
+        return self.amount
+
 
 class ShareManager(models.Manager):
     def create_split(self, transaction, member_numerators):
+        return self.bulk_create(self.build_split(transaction,
+                                                 member_numerators))
+
+    def build_split(self, transaction, member_numerators):
+        """
+        Returns unsaved shares dividing ``transaction.amount`` among the
+        given (member, numerator) pairs, with rounding error assigned to a
+        random share so that the amounts add up exactly.
+
+        """
         members, numerators = zip(*member_numerators)
         denominator = sum(numerators)
         shares = []
@@ -224,7 +442,7 @@ class ShareManager(models.Manager):
             share = random.choice(shares)
             share.amount = transaction.amount - (amount_sum - share.amount)
 
-        return Share.objects.bulk_create(shares)
+        return shares
 
 
 class Share(models.Model):
@@ -249,3 +467,592 @@ class Share(models.Model):
     def percentage(self):
         fraction = Decimal(self.numerator) / Decimal(self.denominator)
         return (fraction * 100).quantize(Decimal('.01'))
+
+
+class ArchivedTransaction(models.Model):
+    """
+    A transaction moved out of the active ledger by argus.compaction. Keeps
+    its original id.
+
+    """
+    id = models.IntegerField(primary_key=True)
+    paid_by = models.ForeignKey(Party, related_name='+')
+    paid_to = models.ForeignKey(Party, related_name='+', blank=True,
+                                null=True)
+    memo = models.CharField(max_length=64)
+    amount = models.DecimalField(max_digits=11, decimal_places=2)
+    paid_at = models.DateTimeField()
+    category = models.ForeignKey(Category, related_name='+')
+    notes = models.TextField(blank=True)
+    split = models.CharField(max_length=7,
+                             choices=Transaction.SPLIT_CHOICES)
+
+    def __unicode__(self):
+        return u"{} ({})".format(smart_text(self.memo), self.amount)
+
+
+class ArchivedShare(models.Model):
+    id = models.IntegerField(primary_key=True)
+    transaction = models.ForeignKey(ArchivedTransaction,
+                                    related_name='shares')
+    party = models.ForeignKey(Party, related_name='+')
+    amount = models.DecimalField(max_digits=11, decimal_places=2)
+    numerator = models.PositiveIntegerField()
+    denominator = models.PositiveIntegerField()
+
+
+class ReceiptManager(models.Manager):
+    def create_from_upload(self, transaction, uploaded):
+        """
+        Stores an uploaded receipt image under its content hash, so that
+        identical uploads share one file (and one set of thumbnails). The
+        extension comes from the image's format, never from its name;
+        raises ValueError for formats that aren't allowed (see
+        argus.receipts).
+
+        """
+        from argus.receipts import IMAGE_FORMATS, detect_format
+
+        image_format = detect_format(uploaded)
+        if image_format is None:
+            raise ValueError("Receipts must be JPEG, PNG or GIF images.")
+        sha1 = hashlib.sha1()
+        for chunk in uploaded.chunks():
+            sha1.update(chunk)
+        digest = sha1.hexdigest()
+        extension = IMAGE_FORMATS[image_format][0]
+        name = 'argus/receipts/{}/{}{}'.format(digest[:2], digest, extension)
+        if not default_storage.exists(name):
+            uploaded.seek(0)
+            name = default_storage.save(name, uploaded)
+        receipt = Receipt(transaction=transaction, sha1=digest, image=name)
+        processed = self.filter(sha1=digest, status=Receipt.READY).first()
+        if processed is not None:
+            receipt.thumbnail = processed.thumbnail.name
+            receipt.preview = processed.preview.name
+            receipt.status = Receipt.READY
+        receipt.save()
+        return receipt
+
+
+class Receipt(models.Model):
+    """
+    An image attached to a transaction. Thumbnails and previews are made
+    by the process_receipts command, never during a request.
+
+    """
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (READY, _('Ready')),
+        (FAILED, _('Failed')),
+    )
+    VARIANTS = ('image', 'thumbnail', 'preview')
+
+    transaction = models.ForeignKey(Transaction, related_name='receipts')
+    sha1 = models.CharField(max_length=40, db_index=True)
+    image = models.FileField(upload_to='argus/receipts', max_length=255)
+    thumbnail = models.FileField(upload_to='argus/receipts/thumbnails',
+                                 max_length=255, blank=True)
+    preview = models.FileField(upload_to='argus/receipts/previews',
+                               max_length=255, blank=True)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES,
+                              default=PENDING, db_index=True)
+    created = models.DateTimeField(default=now)
+
+    objects = ReceiptManager()
+
+    def __unicode__(self):
+        return smart_text(self.image.name)
+
+
+class IdempotencyKeyManager(models.Manager):
+    def live(self):
+        return self.filter(expires__gt=now())
+
+    def expired(self):
+        return self.filter(expires__lte=now())
+
+    def claim(self, group, key):
+        """
+        Claims ``key`` for ``group``. Returns a tuple of the key record and
+        a boolean which is False if the key had already been claimed by an
+        earlier (or concurrent) request.
+
+        """
+        self.expired().filter(group=group, key=key).delete()
+        ttl = getattr(settings, 'ARGUS_IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+        try:
+            with atomic():
+                return self.create(group=group, key=key,
+                                   expires=now() + timedelta(seconds=ttl)), True
+        except IntegrityError:
+            # Rely on the unique constraint rather than a racy exists()
+            # check; a concurrent claim blocks until the winner commits.
+            return self.get(group=group, key=key), False
+
+    def purge_expired(self):
+        expired = self.expired()
+        count = expired.count()
+        expired.delete()
+        return count
+
+
+class IdempotencyKey(models.Model):
+    """
+    Records the outcome of a transaction form submission so that a retried
+    request carrying the same key gets the original response back instead
+    of creating a duplicate transaction.
+
+    """
+    KEY_LENGTH = 64
+
+    group = models.ForeignKey(Group, related_name='idempotency_keys')
+    key = models.CharField(max_length=KEY_LENGTH)
+    location = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(default=now)
+    expires = models.DateTimeField(db_index=True)
+
+    objects = IdempotencyKeyManager()
+
+    class Meta:
+        unique_together = ('group', 'key')
+
+    def __unicode__(self):
+        return smart_text(self.key)
+
+
+class SearchToken(models.Model):
+    """
+    Inverted index of transaction memos and notes, used for search when
+    the database doesn't have SQLite's FTS5. See argus.search.
+
+    """
+    group = models.ForeignKey(Group, related_name='+')
+    transaction = models.ForeignKey(Transaction, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        index_together = (('group', 'token'),)
+
+
+class GroupShard(models.Model):
+    """
+    Maps a group to the database it lives in, when groups are sharded
+    (see argus.sharding). Always stored in the default database. Rows are
+    created first, so their ids become the group ids and their unique
+    slugs reserve the group slugs across all shards.
+
+    """
+    slug = models.CharField(max_length=50, unique=True)
+    shard = models.CharField(max_length=64)
+    # Requests for the group are turned away while it's copied to another
+    # shard.
+    moving = models.BooleanField(default=False)
+
+    # Allocates random slugs the same way groups do.
+    objects = GroupManager()
+
+    def __unicode__(self):
+        return u"{} ({})".format(self.slug, self.shard)
+
+
+class AuditEntry(models.Model):
+    """
+    One logged change; see argus.audit. ``payload`` maps each changed
+    field, or for shares each party id, to its [before, after] values.
+
+    """
+    group = models.ForeignKey(Group, related_name='audit_entries')
+    model = models.CharField(max_length=11)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=6, choices=audit.ACTION_CHOICES)
+    # Who made the change; see argus.audit.request_actor.
+    actor = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(default=now)
+    payload = models.BinaryField()
+
+    class Meta:
+        # For paging through a group's history newest first.
+        index_together = (('group', 'id'),)
+
+    @property
+    def changes(self):
+        return sorted(audit.decode(self.payload).items())
+
+    def get_actor_display(self):
+        if self.actor == audit.MEMBER:
+            return _("A member")
+        return self.actor
+
+
+def _webhook_secret():
+    return get_random_string(length=32)
+
+
+class WebhookSubscription(models.Model):
+    """A URL notified of changes to the group; see argus.webhooks."""
+    group = models.ForeignKey(Group, related_name='webhooks')
+    url = models.URLField(max_length=255)
+    secret = models.CharField(max_length=32, default=_webhook_secret,
+                              editable=False)
+    created = models.DateTimeField(default=now)
+    # Set by the first change since the last delivery.
+    pending_since = models.DateTimeField(blank=True, null=True,
+                                         editable=False, db_index=True)
+    attempts = models.PositiveIntegerField(default=0, editable=False)
+    retry_at = models.DateTimeField(blank=True, null=True, editable=False)
+    last_delivered = models.DateTimeField(blank=True, null=True,
+                                          editable=False)
+    last_error = models.CharField(max_length=255, blank=True,
+                                  editable=False)
+
+    def __unicode__(self):
+        return smart_text(self.url)
+
+
+class StatementCheckpoint(models.Model):
+    """
+    Records that a group's monthly statement was claimed for sending, and
+    when it was sent; see argus.monthly.
+
+    """
+    group = models.ForeignKey(Group, related_name='+')
+    # First day of the month the statement covers.
+    month = models.DateField()
+    claimed = models.DateTimeField(default=now)
+    sent = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = (('month', 'group'),)
+
+
+class GroupSummaryManager(models.Manager):
+    def record(self, group_id, transactions=0, spent=0, create=True):
+        """
+        Adjusts the group's counters in place and marks it active. A
+        missing summary is rebuilt from the ledger if ``create`` is true.
+
+        """
+        updated = self.filter(group=group_id).update(
+            transaction_count=models.F('transaction_count') + transactions,
+            total_spent=models.F('total_spent') + spent,
+            last_activity=now())
+        if not updated and create:
+            self.reconcile([group_id])
+            self.filter(group=group_id).update(last_activity=now())
+
+    def reconcile(self, group_ids=None, batch_size=500):
+        """
+        Recomputes the summaries of the given groups (or of all groups)
+        from active and archived transactions, creating missing ones. Last
+        activity is never moved back. Returns the number of summaries that
+        were wrong or missing.
+
+        """
+        if group_ids is None:
+            group_ids = Group.objects.order_by('pk').values_list('pk',
+                                                                 flat=True)
+        group_ids = list(group_ids)
+        fixed = 0
+        for i in range(0, len(group_ids), batch_size):
+            fixed += self._reconcile(group_ids[i:i + batch_size])
+        return fixed
+
+    def compute(self, group_ids):
+        """
+        Returns {group id: [transaction count, total spent, last paid_at]}
+        for the given groups, computed from active and archived
+        transactions.
+
+        """
+        stats = dict((group_id, [0, Decimal('0.00'), None])
+                     for group_id in group_ids)
+        for model in (Transaction, ArchivedTransaction):
+            rows = model.objects.filter(paid_by__group__in=group_ids)
+            # Annotation columns don't come back in argument order, so
+            # they are read by name.
+            for row in rows.values('paid_by__group').annotate(
+                    count=models.Count('pk'), last=models.Max('paid_at')):
+                group_stats = stats[row['paid_by__group']]
+                group_stats[0] += row['count']
+                group_stats[2] = max(group_stats[2] or row['last'],
+                                     row['last'])
+            for group_id, spent in rows.exclude(
+                    split=Transaction.SIMPLE,
+                    paid_to__party_type=Party.MEMBER
+                    ).values_list('paid_by__group').annotate(
+                        models.Sum('amount')):
+                stats[group_id][1] += spent
+        return stats
+
+    def _reconcile(self, group_ids):
+        stats = self.compute(group_ids)
+        existing = dict((summary.group_id, summary) for summary in
+                        self.filter(group__in=group_ids))
+        fixed = 0
+        for group_id, (count, spent, last) in stats.items():
+            summary = existing.get(group_id)
+            if summary is not None:
+                if summary.last_activity is not None:
+                    last = max(summary.last_activity, last or
+                               summary.last_activity)
+                if (summary.transaction_count, summary.total_spent,
+                        summary.last_activity) == (count, spent, last):
+                    continue
+            values = {
+                'transaction_count': count,
+                'total_spent': spent,
+                'last_activity': last,
+            }
+            fixed += 1
+            if summary is None:
+                try:
+                    with atomic():
+                        self.create(group_id=group_id, **values)
+                    continue
+                except IntegrityError:
+                    # Created concurrently, or the group is gone.
+                    pass
+            self.filter(group=group_id).update(**values)
+        return fixed
+
+
+class GroupSummary(models.Model):
+    """
+    Activity counters for a group, kept up to date as transactions are
+    written so that they can be listed without aggregating the ledger.
+    Archived transactions stay counted. Bulk inserts and raw deletes
+    bypass the counters; ``reconcile_group_summaries`` repairs them.
+
+    """
+    group = models.OneToOneField(Group, primary_key=True,
+                                 related_name='summary')
+    transaction_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=13, decimal_places=2,
+                                      default=0)
+    last_activity = models.DateTimeField(blank=True, null=True,
+                                         db_index=True)
+
+    objects = GroupSummaryManager()
+
+    class Meta:
+        verbose_name_plural = 'group summaries'
+
+
+def get_change_version(group_id):
+    """
+    Returns a counter which changes whenever anything in the group is
+    written; cached fragments of group pages are keyed on it.
+
+    """
+    key = 'argus:group-changes:{}'.format(group_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than zero, so that a counter lost to
+        # cache eviction can't repeat a version that old fragments were
+        # cached under.
+        cache.add(key, int(time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_changes():
+    """
+    Holds back record_change() until the block ends. Wrap database
+    transactions in it, so that the counter only moves once their writes
+    are visible: a page rendered in between would otherwise be cached
+    under the new version with the old data.
+
+    """
+    if getattr(_deferred, 'group_ids', None) is not None:
+        # Flushed by the outermost block.
+        yield
+        return
+    _deferred.group_ids = set()
+    try:
+        yield
+    finally:
+        group_ids, _deferred.group_ids = _deferred.group_ids, None
+        for group_id in group_ids:
+            record_change(group_id)
+
+
+def record_change(group_id):
+    pending = getattr(_deferred, 'group_ids', None)
+    if pending is not None:
+        pending.add(group_id)
+        return
+    key = 'argus:group-changes:{}'.format(group_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time() * 1000), None)
+    note_group_write(group_id)
+    note_ledger_change(group_id)
+
+
+def _group_changed(sender, instance, **kwargs):
+    if sender is Group:
+        invalidate_group_route(instance.slug, instance._loaded_slug)
+        if (sharding_enabled() and instance._loaded_slug and
+                instance.slug != instance._loaded_slug):
+            GroupShard.objects.filter(pk=instance.pk).update(
+                slug=instance.slug)
+            invalidate_group_shard(instance.slug, instance._loaded_slug)
+        instance._loaded_slug = instance.slug
+    group_id = instance.pk if sender is Group else instance.group_id
+    GroupSnapshot.invalidate(group_id)
+    record_change(group_id)
+
+
+def _transaction_group_id(instance):
+    try:
+        # paid_by is normally already loaded by whatever saved the
+        # transaction.
+        return instance.paid_by.group_id
+    except Party.DoesNotExist:
+        return None
+
+
+def _transaction_changed(sender, instance, **kwargs):
+    group_id = _transaction_group_id(instance)
+    if group_id is not None:
+        record_change(group_id)
+
+
+def _load_spent(sender, instance, raw=False, **kwargs):
+    # Needed to adjust total_spent by the difference when editing.
+    if instance.pk is None or raw:
+        instance._loaded_spent = None
+        return
+    old = Transaction.objects.filter(pk=instance.pk).values_list(
+        'amount', 'split', 'paid_to__party_type').first()
+    if old is None:
+        instance._loaded_spent = None
+    elif old[1] == Transaction.SIMPLE and old[2] == Party.MEMBER:
+        instance._loaded_spent = 0
+    else:
+        instance._loaded_spent = old[0]
+
+
+def _summarize_saved_transaction(sender, instance, created, raw=False,
+                                 **kwargs):
+    group_id = _transaction_group_id(instance)
+    if group_id is None or raw:
+        return
+    loaded = getattr(instance, '_loaded_spent', None)
+    if created or loaded is None:
+        GroupSummary.objects.record(group_id, 1, instance.spent)
+    else:
+        GroupSummary.objects.record(group_id, 0, instance.spent - loaded)
+    instance._loaded_spent = instance.spent
+
+
+def _summarize_deleted_transaction(sender, instance, **kwargs):
+    group_id = _transaction_group_id(instance)
+    if group_id is not None:
+        # Never recreated here: the group itself may be being deleted.
+        GroupSummary.objects.record(group_id, -1, -instance.spent,
+                                    create=False)
+
+
+def _create_group_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        GroupSummary.objects.create(group=instance)
+
+
+def _audit_group_id(sender, instance):
+    if sender is Group:
+        return instance.pk
+    if sender is Transaction:
+        return _transaction_group_id(instance)
+    return instance.group_id
+
+
+def _audit_loaded(sender, instance, **kwargs):
+    # Kept to diff against when the instance is saved.
+    instance._audit_state = (audit.snapshot(instance)
+                             if instance.pk is not None else None)
+
+
+def _audit_saved(sender, instance, created, raw=False, **kwargs):
+    group_id = _audit_group_id(sender, instance)
+    if raw or group_id is None:
+        return
+    state = audit.snapshot(instance)
+    before = {} if created else getattr(instance, '_audit_state', None) or {}
+    changes = audit.diff(before, state)
+    if changes:
+        audit.record(group_id, sender._meta.model_name, instance.pk,
+                     audit.CREATE if created else audit.UPDATE, changes,
+                     instance._state.db)
+    instance._audit_state = state
+
+
+def _audit_deleted(sender, instance, **kwargs):
+    if sender is Group:
+        # Its history goes with it.
+        audit.forget_group(instance.pk)
+        return
+    group_id = _audit_group_id(sender, instance)
+    if group_id is not None:
+        audit.record(group_id, sender._meta.model_name, instance.pk,
+                     audit.DELETE, audit.diff(audit.snapshot(instance), {}),
+                     instance._state.db)
+
+
+def _webhooks_changed(sender, instance, **kwargs):
+    invalidate_webhooks(instance.group_id)
+
+
+def _index_transaction(sender, instance, **kwargs):
+    from argus import search
+    try:
+        group_id = instance.paid_by.group_id
+    except Party.DoesNotExist:
+        return
+    search.index_transaction(instance, group_id)
+
+
+def _unindex_transaction(sender, instance, **kwargs):
+    from argus import search
+    search.unindex_transaction(instance.pk)
+
+
+post_save.connect(_group_changed, sender=Group)
+post_delete.connect(_group_changed, sender=Group)
+post_save.connect(_group_changed, sender=Party)
+post_delete.connect(_group_changed, sender=Party)
+post_save.connect(_group_changed, sender=Category)
+post_delete.connect(_group_changed, sender=Category)
+post_save.connect(_transaction_changed, sender=Transaction)
+post_delete.connect(_transaction_changed, sender=Transaction)
+post_save.connect(_index_transaction, sender=Transaction)
+pre_save.connect(_load_spent, sender=Transaction)
+post_save.connect(_summarize_saved_transaction, sender=Transaction)
+post_delete.connect(_summarize_deleted_transaction, sender=Transaction)
+post_save.connect(_create_group_summary, sender=Group)
+post_delete.connect(_unindex_transaction, sender=Transaction)
+post_save.connect(_webhooks_changed, sender=WebhookSubscription)
+post_delete.connect(_webhooks_changed, sender=WebhookSubscription)
+post_init.connect(_audit_loaded, sender=Group)
+post_save.connect(_audit_saved, sender=Group)
+post_delete.connect(_audit_deleted, sender=Group)
+post_init.connect(_audit_loaded, sender=Party)
+post_save.connect(_audit_saved, sender=Party)
+post_delete.connect(_audit_deleted, sender=Party)
+post_init.connect(_audit_loaded, sender=Category)
+post_save.connect(_audit_saved, sender=Category)
+post_delete.connect(_audit_deleted, sender=Category)
+post_init.connect(_audit_loaded, sender=Transaction)
+post_save.connect(_audit_saved, sender=Transaction)
+post_delete.connect(_audit_deleted, sender=Transaction)
@@ -0,0 +1,195 @@
+"""
+Monthly statements emailed to groups.
+
+Each group with a confirmed email is sent its members' balances at the end
+of the month and the month's activity. Parties have no email addresses of
+their own, so the statement goes to the group. Statements are computed for
+a chunk of groups at a time with grouped aggregate queries, so the number
+of queries doesn't grow with the number of groups or members.
+
+Sending is checkpointed with StatementCheckpoint rows: a chunk's groups are
+claimed before any mail is sent, and the claim is marked sent afterwards.
+A run that crashes leaves its claims behind, so running it again never
+resends; claims never marked sent can be retried explicitly.
+
+"""
+from collections import defaultdict
+from datetime import date, datetime, time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections
+from django.db.models import Count, Sum
+from django.utils.timezone import get_current_timezone, make_aware, now
+
+from argus.models import (Group, Party, Share, StatementCheckpoint,
+                          Transaction)
+from argus.utils import render_mail
+
+
+CHUNK_SIZE = 500
+
+SUBJECT_TEMPLATE_NAME = "argus/mail/monthly_statement_subject.txt"
+BODY_TEMPLATE_NAME = "argus/mail/monthly_statement_body.txt"
+HTML_EMAIL_TEMPLATE_NAME = None
+
+
+def previous_month(today=None):
+    today = today or date.today()
+    if today.month == 1:
+        return date(today.year - 1, 12, 1)
+    return date(today.year, today.month - 1, 1)
+
+
+def _month_start(month):
+    value = datetime.combine(month, time.min)
+    if settings.USE_TZ:
+        value = make_aware(value, get_current_timezone())
+    return value
+
+
+def month_bounds(month):
+    """Returns the start and end of the month starting on ``month``."""
+    if month.month == 12:
+        following = date(month.year + 1, 1, 1)
+    else:
+        following = date(month.year, month.month + 1, 1)
+    return _month_start(month), _month_start(following)
+
+
+def get_site(domain=None):
+    if domain is None and apps.is_installed('django.contrib.sites'):
+        from django.contrib.sites.models import Site
+        return Site.objects.get_current()
+    return {'domain': domain or 'localhost', 'name': domain or 'localhost'}
+
+
+class MonthlyStatement(object):
+    def __init__(self, group, month):
+        self.group = group
+        self.month = month
+        self.members = []
+        self.transaction_count = 0
+        self.spent = 0
+        # (category name, amount) pairs, largest first.
+        self.categories = []
+
+
+def _totals(queryset, field):
+    return dict(queryset.values_list(field).annotate(Sum('amount')))
+
+
+def build_statements(group_ids, month):
+    """
+    Returns MonthlyStatements for the given groups, with member balances
+    as of the end of the month.
+
+    """
+    start, end = month_bounds(month)
+    statements = dict(
+        (group.pk, MonthlyStatement(group, month)) for group in
+        Group.objects.filter(pk__in=group_ids))
+
+    transactions = Transaction.objects.filter(paid_by__group__in=group_ids,
+                                              paid_at__lt=end)
+    paid = _totals(transactions, 'paid_by')
+    received = _totals(transactions.filter(paid_to__isnull=False),
+                       'paid_to')
+    shares = _totals(Share.objects.filter(party__group__in=group_ids,
+                                          transaction__paid_at__lt=end),
+                     'party')
+    members = Party.objects.filter(
+        group__in=group_ids, party_type=Party.MEMBER
+    ).order_by('name', 'pk')
+    for member in members:
+        member._balance = sum((member.opening_balance,
+                               shares.get(member.pk, 0),
+                               -paid.get(member.pk, 0),
+                               received.get(member.pk, 0)))
+        statements[member.group_id].members.append(member)
+
+    in_month = transactions.filter(paid_at__gte=start)
+    for group_id, count in in_month.values_list(
+            'paid_by__group').annotate(Count('pk')):
+        statements[group_id].transaction_count = count
+    # Payments between members only settle debts; see Transaction.spent.
+    spending = in_month.exclude(split=Transaction.SIMPLE,
+                                paid_to__party_type=Party.MEMBER)
+    by_category = defaultdict(list)
+    for group_id, name, amount in spending.values_list(
+            'paid_by__group', 'category__name').annotate(Sum('amount')):
+        statements[group_id].spent += amount
+        by_category[group_id].append((name, amount))
+    for group_id, totals in by_category.items():
+        statements[group_id].categories = sorted(
+            totals, key=lambda total: -total[1])
+    return [statements[group_id] for group_id in group_ids
+            if group_id in statements]
+
+
+def render_statement(statement, site, protocol):
+    return render_mail(SUBJECT_TEMPLATE_NAME, BODY_TEMPLATE_NAME,
+                       HTML_EMAIL_TEMPLATE_NAME, {
+                           'statement': statement,
+                           'group': statement.group,
+                           'email': statement.group.confirmed_email,
+                           'site': site,
+                           'protocol': protocol,
+                       }, [statement.group.confirmed_email])
+
+
+def pending_group_ids(month, after=0, limit=CHUNK_SIZE):
+    """
+    Returns up to ``limit`` ids, above ``after``, of groups still to be
+    sent the month's statement.
+
+    """
+    return list(Group.objects.filter(
+        pk__gt=after, purge_requested__isnull=True
+    ).exclude(confirmed_email='').exclude(
+        pk__in=StatementCheckpoint.objects.filter(
+            month=month).values('group')
+    ).order_by('pk').values_list('pk', flat=True)[:limit])
+
+
+def unsent_group_ids(month):
+    return list(StatementCheckpoint.objects.filter(
+        month=month, sent__isnull=True).order_by('group').values_list(
+            'group', flat=True))
+
+
+def send_statements(group_ids, month, site, protocol, claim=True):
+    """
+    Claims, renders and sends the month's statements for the given groups
+    over one mail connection. Returns the number sent.
+
+    """
+    if claim:
+        StatementCheckpoint.objects.bulk_create([
+            StatementCheckpoint(group_id=group_id, month=month)
+            for group_id in group_ids])
+    statements = build_statements(group_ids, month)
+    messages = [render_statement(statement, site, protocol)
+                for statement in statements]
+    connection = get_connection()
+    sent = connection.send_messages(messages) or 0
+    StatementCheckpoint.objects.filter(
+        month=month, group__in=group_ids).update(sent=now())
+    return sent
+
+
+def send_chunk(job):
+    """
+    Takes a ``(group ids, month, site, protocol, claim)`` tuple and returns
+    ``(group ids, sent, error)``; for use in a process pool.
+
+    """
+    group_ids, month, site, protocol, claim = job
+    try:
+        return group_ids, send_statements(group_ids, month, site, protocol,
+                                          claim), None
+    except Exception as e:
+        return group_ids, 0, repr(e)
+    finally:
+        close_old_connections()
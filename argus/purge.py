@@ -0,0 +1,120 @@
+"""
+Deleting groups and parties in bounded batches.
+
+Django's cascading delete loads every related row into memory first,
+which for a large group can take minutes and hold locks throughout.
+Purges here delete a batch of rows at a time, each batch in its own
+database transaction, always picking up whatever is left; an interrupted
+purge just continues on the next run. Requests only flag a group or
+party with ``request_*_purge``; the ``purge`` command does the deleting.
+
+"""
+from django.utils.timezone import now
+
+from argus import bulk
+from argus.models import (ArchivedShare, ArchivedTransaction, AuditEntry,
+                          Category, Group, GroupShard, GroupSnapshot,
+                          GroupSummary, IdempotencyKey, Party, SearchToken,
+                          Share, StatementCheckpoint, Transaction,
+                          WebhookSubscription, invalidate_group_route,
+                          record_change)
+from argus.sharding import (atomic, current_alias, get_connection,
+                            invalidate_group_shard)
+from argus.webhooks import invalidate_webhooks
+
+
+DEFAULT_BATCH_SIZE = bulk.BATCH_SIZE
+
+
+def request_group_purge(group):
+    Group.objects.filter(pk=group.pk).update(purge_requested=now())
+    # Purged groups are gone as far as routing is concerned.
+    invalidate_group_route(group.slug)
+
+
+def request_party_purge(party):
+    Party.objects.filter(pk=party.pk).update(purge_requested=now())
+
+
+def _raw_delete(model, pks):
+    get_connection().cursor().execute("DELETE FROM {} WHERE id IN ({})".format(
+        model._meta.db_table, ", ".join(["%s"] * len(pks))), pks)
+
+
+def _drain(queryset, delete, batch_size):
+    """
+    Calls ``delete`` with batches of the ids in ``queryset`` until there
+    are none left. Returns the number of ids deleted.
+
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    deleted = 0
+    while True:
+        with atomic():
+            batch = list(pks[:batch_size])
+            if not batch:
+                return deleted
+            delete(batch)
+        deleted += len(batch)
+
+
+def _delete_archived(pks):
+    ArchivedShare.objects.filter(transaction__in=pks).delete()
+    _raw_delete(ArchivedTransaction, pks)
+
+
+def purge_group(group, batch_size=DEFAULT_BATCH_SIZE):
+    """Deletes the group and everything in it."""
+    # The group's history is deleted with it.
+    _drain(Transaction.objects.filter(paid_by__group=group),
+           lambda pks: bulk.delete(group, pks, log_changes=False),
+           batch_size)
+    _drain(ArchivedTransaction.objects.filter(paid_by__group=group),
+           _delete_archived, batch_size)
+    _drain(IdempotencyKey.objects.filter(group=group),
+           lambda pks: _raw_delete(IdempotencyKey, pks), batch_size)
+    _drain(SearchToken.objects.filter(group=group),
+           lambda pks: _raw_delete(SearchToken, pks), batch_size)
+    _drain(AuditEntry.objects.filter(group=group),
+           lambda pks: _raw_delete(AuditEntry, pks), batch_size)
+    _drain(WebhookSubscription.objects.filter(group=group),
+           lambda pks: _raw_delete(WebhookSubscription, pks), batch_size)
+    invalidate_webhooks(group.pk)
+    _drain(StatementCheckpoint.objects.filter(group=group),
+           lambda pks: _raw_delete(StatementCheckpoint, pks), batch_size)
+    with atomic():
+        Group.objects.filter(pk=group.pk).update(default_category=None)
+        GroupSummary.objects.filter(group=group).delete()
+    _drain(Category.objects.filter(group=group),
+           lambda pks: _raw_delete(Category, pks), batch_size)
+    _drain(Party.objects.filter(group=group),
+           lambda pks: _raw_delete(Party, pks), batch_size)
+    _raw_delete(Group, [group.pk])
+    # Not when purging the old copy of a group that has moved.
+    GroupShard.objects.filter(pk=group.pk, shard=current_alias()).delete()
+    invalidate_group_shard(group.slug)
+    invalidate_group_route(group.slug)
+    GroupSnapshot.invalidate(group.pk)
+    record_change(group.pk)
+
+
+def purge_party(party, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Deletes the party with every transaction it paid or received and its
+    shares of other transactions, as deleting it through the ORM would.
+
+    """
+    group = party.group
+    for field in ('paid_by', 'paid_to'):
+        _drain(Transaction.objects.filter(**{field: party}),
+               lambda pks: bulk.delete(group, pks), batch_size)
+    _drain(Share.objects.filter(party=party),
+           lambda pks: _raw_delete(Share, pks), batch_size)
+    for field in ('paid_by', 'paid_to'):
+        _drain(ArchivedTransaction.objects.filter(**{field: party}),
+               _delete_archived, batch_size)
+    _drain(ArchivedShare.objects.filter(party=party),
+           lambda pks: _raw_delete(ArchivedShare, pks), batch_size)
+    _raw_delete(Party, [party.pk])
+    GroupSnapshot.invalidate(group.pk)
+    record_change(group.pk)
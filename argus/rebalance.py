@@ -0,0 +1,225 @@
+"""
+Moving groups between shards.
+
+A group is copied to its new shard in batches while the shard map marks
+it as moving, which turns its requests away (see argus.sharding). Parties,
+categories, transactions, shares and receipts get new ids on the target,
+since ids are only unique within a shard; the group keeps its id, which
+comes from the shard map. Once everything is copied, the shard map points
+at the target and the old copy is purged. An interrupted move leaves the
+group moving on its old shard; moving it again starts over.
+
+Groups with archived transactions can't be moved, since archived rows keep
+their original ids. The audit log is copied last, in order, with the ids
+it refers to mapped to the new ones; rows deleted before the move have no
+new id, so their entries keep the old one.
+
+"""
+from time import sleep
+
+from argus import audit, search
+from argus.models import (ArchivedTransaction, AuditEntry, Category, Group,
+                          GroupShard, GroupSnapshot, GroupSummary, Party,
+                          Receipt, Share,
+                          StatementCheckpoint, Transaction,
+                          WebhookSubscription,
+                          invalidate_group_route, record_change)
+from argus.purge import purge_group
+from argus.sharding import atomic, invalidate_group_shard, pinned
+
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class MoveError(Exception):
+    pass
+
+
+def _insert(obj, using, keep_pk=False):
+    """
+    Inserts a copy of ``obj`` without sending signals and returns its id.
+    Unless ``keep_pk`` is true the database assigns a new one.
+
+    """
+    model = type(obj)
+    fields = [field for field in model._meta.local_concrete_fields
+              if keep_pk or not field.primary_key]
+    return model._base_manager._insert([obj], fields=fields,
+                                       return_id=not keep_pk, using=using)
+
+
+def _copy(objs, using, remap=()):
+    """
+    Copies ``objs`` with their foreign keys mapped through ``remap``, a
+    sequence of (attname, {old id: new id}) pairs. Returns a dict of old
+    ids to new ones.
+
+    """
+    ids = {}
+    for obj in objs:
+        for attname, mapping in remap:
+            value = getattr(obj, attname)
+            if value is not None:
+                setattr(obj, attname, mapping[value])
+        ids[obj.pk] = _insert(obj, using)
+    return ids
+
+
+# Audit payload fields holding ids, and the model whose ids they are.
+AUDIT_ID_FIELDS = {
+    'paid_by_id': 'party',
+    'paid_to_id': 'party',
+    'category_id': 'category',
+    'default_category_id': 'category',
+}
+
+
+def _remap_audit_entry(entry, ids):
+    """
+    Maps the ids an AuditEntry refers to through ``ids``, a dict of model
+    names to {old id: new id}. Ids that aren't there are kept.
+
+    """
+    def remap(model, value):
+        return ids.get(model, {}).get(value, value)
+
+    changes = audit.decode(entry.payload)
+    if entry.model == 'share':
+        # Logged per transaction and keyed by party id.
+        entry.object_id = remap('transaction', entry.object_id)
+        changes = dict((str(remap('party', int(party_id))), amounts)
+                       for party_id, amounts in changes.items())
+    else:
+        entry.object_id = remap(entry.model, entry.object_id)
+        for name, model in AUDIT_ID_FIELDS.items():
+            if name in changes:
+                changes[name] = [remap(model, value)
+                                 for value in changes[name]]
+    entry.payload = audit.encode(changes)
+
+
+def _set_moving(entry, moving, **kwargs):
+    GroupShard.objects.filter(pk=entry.pk).update(moving=moving, **kwargs)
+    invalidate_group_shard(entry.slug)
+
+
+def move_group(slug, target, batch_size=DEFAULT_BATCH_SIZE, settle=0):
+    """
+    Moves the group with the given slug to the ``target`` shard. ``settle``
+    is how many seconds to give requests already in progress to finish
+    before copying starts.
+
+    """
+    try:
+        entry = GroupShard.objects.get(slug=slug)
+    except GroupShard.DoesNotExist:
+        raise MoveError("No group with slug {}".format(slug))
+    source = entry.shard
+    if source == target:
+        return
+    group = Group.objects.using(source).get(pk=entry.pk)
+    if ArchivedTransaction.objects.using(source).filter(
+            paid_by__group=group).exists():
+        raise MoveError("Groups with archived transactions can't be moved.")
+
+    _set_moving(entry, True)
+    try:
+        sleep(settle)
+        # Left over from an interrupted move.
+        if Group.objects.using(target).filter(pk=group.pk).exists():
+            with pinned(target):
+                purge_group(Group.objects.get(pk=group.pk), batch_size)
+        _copy_group(group, source, target, batch_size)
+    except Exception:
+        _set_moving(entry, False)
+        raise
+
+    _set_moving(entry, False, shard=target)
+    invalidate_group_route(group.slug)
+    GroupSnapshot.invalidate(group.pk)
+    record_change(group.pk)
+    with pinned(source):
+        purge_group(group, batch_size)
+
+
+def _copy_group(group, source, target, batch_size):
+    default_category_id = group.default_category_id
+    group.default_category_id = None
+    with atomic(using=target):
+        _insert(group, target, keep_pk=True)
+        categories = _copy(Category.objects.using(source).filter(
+            group=group).order_by('pk'), target)
+        parties = _copy(Party.objects.using(source).filter(
+            group=group).order_by('pk'), target)
+        _copy(WebhookSubscription.objects.using(source).filter(
+            group=group).order_by('pk'), target)
+        _copy(StatementCheckpoint.objects.using(source).filter(
+            group=group).order_by('pk'), target)
+        if default_category_id is not None:
+            Group.objects.using(target).filter(pk=group.pk).update(
+                default_category=categories[default_category_id])
+
+    transactions = Transaction.objects.using(source).filter(
+        paid_by__group=group).order_by('pk')
+    transaction_ids = {}
+    last_pk = 0
+    while True:
+        batch = list(transactions.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        with atomic(using=target):
+            ids = _copy(batch, target, (('paid_by_id', parties),
+                                        ('paid_to_id', parties),
+                                        ('category_id', categories)))
+            _copy(Share.objects.using(source).filter(
+                transaction__in=list(ids)).order_by('pk'), target,
+                (('transaction_id', ids), ('party_id', parties)))
+            _copy(Receipt.objects.using(source).filter(
+                transaction__in=list(ids)).order_by('pk'), target,
+                (('transaction_id', ids),))
+        transaction_ids.update(ids)
+
+    ids = {
+        'party': parties,
+        'category': categories,
+        'transaction': transaction_ids,
+    }
+    entries = AuditEntry.objects.using(source).filter(
+        group=group).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(entries.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for entry in batch:
+            _remap_audit_entry(entry, ids)
+        # New ids, in the same order, since the log is paged by id.
+        with atomic(using=target):
+            for entry in batch:
+                _insert(entry, target)
+
+    with pinned(target):
+        GroupSummary.objects.reconcile([group.pk])
+        search.rebuild_index(group.pk)
+
+
+def register_groups(alias):
+    """
+    Adds the groups on the given shard that the shard map doesn't know
+    yet, keeping their ids. Returns the number of groups added.
+
+    """
+    known = dict(GroupShard.objects.values_list('pk', 'slug'))
+    added = 0
+    for pk, slug in Group.objects.using(alias).order_by('pk').values_list(
+            'pk', 'slug'):
+        if pk in known:
+            if known[pk] != slug:
+                raise MoveError("Group {} on {} has the id of group {}."
+                                .format(slug, alias, known[pk]))
+            continue
+        GroupShard.objects.create(pk=pk, slug=slug, shard=alias)
+        added += 1
+    return added
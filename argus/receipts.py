@@ -0,0 +1,107 @@
+"""
+Receipt uploads and thumbnail rendering. ``render_variants`` runs in the
+worker processes of the process_receipts command, so it only touches
+files, never the database.
+
+Uploads are only accepted as JPEG, PNG or GIF, as told by Pillow rather
+than by the uploaded name, and stored with the matching extension; that
+is also what receipts are served as.
+
+"""
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+
+# Pillow format name: (extension, content type).
+IMAGE_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'GIF': ('.gif', 'image/gif'),
+}
+CONTENT_TYPES = dict(IMAGE_FORMATS.values())
+
+
+def detect_format(uploaded):
+    """
+    Returns the Pillow format name of an uploaded image if it is one of
+    IMAGE_FORMATS, or None.
+
+    """
+    from PIL import Image
+
+    uploaded.seek(0)
+    try:
+        image_format = Image.open(uploaded).format
+    except Exception:
+        image_format = None
+    finally:
+        uploaded.seek(0)
+    return image_format if image_format in IMAGE_FORMATS else None
+
+
+def content_type(name):
+    """
+    Returns the content type to serve a stored receipt file as. Anything
+    other than the allowed image types (such as files stored under their
+    uploaded names by earlier versions) is served as a download.
+
+    """
+    return CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+def variant_sizes():
+    return (
+        ('preview', getattr(settings, 'ARGUS_RECEIPT_PREVIEW_SIZE',
+                            (1024, 1024))),
+        ('thumbnail', getattr(settings, 'ARGUS_RECEIPT_THUMBNAIL_SIZE',
+                              (160, 160))),
+    )
+
+
+def variant_name(sha1, variant):
+    return 'argus/receipts/{}s/{}/{}.jpg'.format(variant, sha1[:2], sha1)
+
+
+def render_variants(job):
+    """
+    Takes a ``(pk, image name, sha1)`` tuple and returns ``(pk, variants,
+    error)``, where variants maps variant names to storage names. Variants
+    already rendered for the same content are reused.
+
+    """
+    from PIL import Image
+
+    pk, image_name, sha1 = job
+    variants = {}
+    image = None
+    try:
+        for variant, size in variant_sizes():
+            name = variant_name(sha1, variant)
+            variants[variant] = name
+            path = default_storage.path(name)
+            if os.path.exists(path):
+                continue
+            if image is None:
+                image = Image.open(default_storage.path(image_name))
+                # Lets JPEG decoding skip straight to a reduced scale.
+                image.draft('RGB', size)
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+            # Sizes go from largest to smallest, so each variant can be
+            # shrunk from the previous one.
+            image.thumbnail(size, Image.ANTIALIAS)
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    if not os.path.isdir(directory):
+                        raise
+            temporary = '{}.{}.tmp'.format(path, os.getpid())
+            image.save(temporary, 'JPEG', quality=85)
+            os.rename(temporary, path)
+    except Exception as e:
+        return pk, None, repr(e)
+    return pk, variants, None
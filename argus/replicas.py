@@ -0,0 +1,148 @@
+"""
+Read-replica routing for argus read paths.
+
+List replica aliases from DATABASES in ``ARGUS_READ_REPLICAS`` and add
+``argus.replicas.ReplicaRouter`` to DATABASE_ROUTERS and
+``argus.replicas.ReplicaMiddleware`` to MIDDLEWARE_CLASSES (after the
+session middleware). Views using ReplicaReadMixin then read argus data
+from a random replica on GET, unless the session or the group wrote
+something in the last ``ARGUS_REPLICA_LAG`` seconds (default 5), in which
+case they read from the primary so that people see their own changes and
+cached fragments are never rendered from stale data. Writes always go to
+the primary.
+
+To try it locally, point a second SQLite database at a copy of the first.
+
+"""
+from contextlib import contextmanager
+import random
+import threading
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+
+SESSION_KEY = '_argus_last_write'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_local = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'ARGUS_READ_REPLICAS', ())
+
+
+def get_replica_lag():
+    return getattr(settings, 'ARGUS_REPLICA_LAG', 5)
+
+
+def _group_write_key(group_id):
+    return 'argus:group-written:{}'.format(group_id)
+
+
+def note_group_write(group_id):
+    if get_replicas():
+        cache.set(_group_write_key(group_id), True, get_replica_lag())
+
+
+def choose_replica(request, group_id=None):
+    """
+    Returns the alias of a replica that can serve this request's reads, or
+    None if it should read from the primary.
+
+    """
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    session = getattr(request, 'session', None)
+    written = session.get(SESSION_KEY) if session is not None else None
+    if written is not None and time() - written < get_replica_lag():
+        return None
+    if group_id is not None and cache.get(_group_write_key(group_id)):
+        return None
+    return random.choice(replicas)
+
+
+def get_read_alias():
+    """Returns the replica this thread is reading from, if any."""
+    return getattr(_local, 'alias', None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Sends argus reads in this thread to ``alias`` until exit."""
+    previous = getattr(_local, 'alias', None)
+    _local.alias = alias
+    try:
+        yield
+    finally:
+        _local.alias = previous
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        alias = get_read_alias()
+        if alias is not None and model._meta.app_label == 'argus':
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Otherwise objects read from a replica would be saved back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        aliases = set(get_replicas()) | set([DEFAULT_DB_ALIAS])
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, model):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware(object):
+    """Remembers when each session last wrote, for read-your-writes."""
+    def __init__(self):
+        if not get_replicas():
+            raise MiddlewareNotUsed
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if request.method not in SAFE_METHODS and session is not None:
+            session[SESSION_KEY] = time()
+        return response
+
+
+class ReplicaReadMixin(object):
+    """
+    Serves GET requests from a replica when choose_replica allows. Put it
+    after mixins that load the view's group, so that the group (and the
+    authorization checks before it) come from the primary.
+
+    """
+    def get_replica_group_id(self):
+        group = getattr(self, 'group', None)
+        return group.pk if group is not None else None
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = None
+        if request.method in ('GET', 'HEAD'):
+            alias = choose_replica(request, self.get_replica_group_id())
+        if alias is None:
+            return super(ReplicaReadMixin, self).dispatch(request, *args,
+                                                          **kwargs)
+        with reading_from(alias):
+            response = super(ReplicaReadMixin, self).dispatch(request, *args,
+                                                              **kwargs)
+            # Template responses are rendered after the view returns, and
+            # most of their queries run while rendering.
+            if (callable(getattr(response, 'render', None)) and
+                    not response.is_rendered):
+                response.render()
+        return response
@@ -0,0 +1,218 @@
+"""
+Search over transaction memos and notes.
+
+On SQLite builds with FTS5, transactions are indexed in the
+``argus_transaction_fts`` virtual table (created by migration 0010) and
+ranked with bm25. Elsewhere they are indexed as SearchToken rows and ranked
+by summed token weight. Either index is kept up to date when a transaction
+is saved; ``rebuild_search_index`` fills it for existing data. Every search
+term is matched as a prefix and all terms must match.
+
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import get_current_timezone, make_aware
+
+from argus.models import Party, SearchToken, Share, Transaction
+from argus.sharding import get_connection
+
+
+FTS_TABLE = 'argus_transaction_fts'
+MEMO_WEIGHT = 3
+NOTES_WEIGHT = 1
+
+# Underscores are left out of tokens so they can't act as LIKE wildcards.
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+TOKEN_LENGTH = SearchToken._meta.get_field('token').max_length
+
+_fts_enabled = {}
+
+
+def tokenize(text):
+    return [token[:TOKEN_LENGTH] for token in TOKEN_RE.findall(text.lower())]
+
+
+def fts_enabled():
+    connection = get_connection()
+    if connection.alias not in _fts_enabled:
+        _fts_enabled[connection.alias] = (
+            connection.vendor == 'sqlite' and
+            FTS_TABLE in connection.introspection.table_names())
+    return _fts_enabled[connection.alias]
+
+
+def index_transaction(transaction, group_id):
+    if fts_enabled():
+        cursor = get_connection().cursor()
+        cursor.execute("DELETE FROM {} WHERE rowid = %s".format(FTS_TABLE),
+                       [transaction.pk])
+        cursor.execute("INSERT INTO {} (rowid, memo, notes, group_id) "
+                       "VALUES (%s, %s, %s, %s)".format(FTS_TABLE),
+                       [transaction.pk, transaction.memo, transaction.notes,
+                        group_id])
+        return
+    SearchToken.objects.filter(transaction=transaction).delete()
+    SearchToken.objects.bulk_create(_build_tokens(transaction.pk, group_id,
+                                                  transaction.memo,
+                                                  transaction.notes))
+
+
+def unindex_transaction(pk):
+    # Token rows go with the transaction; only the FTS table needs help.
+    if fts_enabled():
+        get_connection().cursor().execute(
+            "DELETE FROM {} WHERE rowid = %s".format(FTS_TABLE), [pk])
+
+
+def unindex_transactions(pks):
+    """For callers deleting transactions without the ORM's cascade."""
+    if fts_enabled():
+        get_connection().cursor().execute(
+            "DELETE FROM {} WHERE rowid IN ({})".format(
+                FTS_TABLE, ", ".join(["%s"] * len(pks))), pks)
+    else:
+        SearchToken.objects.filter(transaction__in=pks).delete()
+
+
+def _build_tokens(transaction_id, group_id, memo, notes):
+    weights = Counter()
+    for token in tokenize(memo):
+        weights[token] += MEMO_WEIGHT
+    for token in tokenize(notes):
+        weights[token] += NOTES_WEIGHT
+    return [SearchToken(group_id=group_id, transaction_id=transaction_id,
+                        token=token, weight=weight)
+            for token, weight in weights.items()]
+
+
+def rebuild_index(group_id=None, batch_size=1000):
+    """Reindexes all transactions, or those of one group."""
+    transactions = Transaction.objects.all()
+    if group_id is not None:
+        transactions = transactions.filter(paid_by__group=group_id)
+    if fts_enabled():
+        cursor = get_connection().cursor()
+        if group_id is None:
+            cursor.execute("DELETE FROM {}".format(FTS_TABLE))
+            where, params = "", []
+        else:
+            cursor.execute("DELETE FROM {} WHERE group_id = %s".format(
+                FTS_TABLE), [group_id])
+            where, params = "WHERE p.group_id = %s", [group_id]
+        cursor.execute(
+            "INSERT INTO {fts} (rowid, memo, notes, group_id) "
+            "SELECT t.id, t.memo, t.notes, p.group_id "
+            "FROM {transaction} t JOIN {party} p ON p.id = t.paid_by_id "
+            "{where}".format(fts=FTS_TABLE,
+                             transaction=Transaction._meta.db_table,
+                             party=Party._meta.db_table,
+                             where=where), params)
+        return
+    tokens = SearchToken.objects.all()
+    if group_id is not None:
+        tokens = tokens.filter(group=group_id)
+    tokens.delete()
+    rows = transactions.order_by('pk').values_list('pk', 'paid_by__group',
+                                                   'memo', 'notes')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        SearchToken.objects.bulk_create(
+            [token for row in batch for token in _build_tokens(*row)])
+        last_pk = batch[-1][0]
+
+
+def _day_start(day):
+    value = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        value = make_aware(value, get_current_timezone())
+    return value
+
+
+def search(group_id, query, party=None, category=None, start=None,
+           end=None, limit=50):
+    """
+    Returns up to ``limit`` transactions of the group matching every term
+    in ``query``, best match first. ``party`` and ``category`` are ids;
+    ``start`` and ``end`` are inclusive dates.
+
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    if fts_enabled():
+        pks = _search_fts(group_id, terms, party, category, start, end, limit)
+    else:
+        pks = _search_tokens(group_id, terms, party, category, start, end,
+                             limit)
+    transactions = Transaction.objects.filter(pk__in=pks).select_related(
+        'paid_by', 'paid_to', 'category')
+    by_pk = dict((transaction.pk, transaction)
+                 for transaction in transactions)
+    return [by_pk[pk] for pk in pks if pk in by_pk]
+
+
+def _search_fts(group_id, terms, party, category, start, end, limit):
+    match = u' '.join(u'"{}"*'.format(term.replace('"', '""'))
+                      for term in terms)
+    where = ["{fts} MATCH %s", "{fts}.group_id = %s"]
+    params = [match, group_id]
+    if category is not None:
+        where.append("t.category_id = %s")
+        params.append(category)
+    if start is not None:
+        where.append("t.paid_at >= %s")
+        params.append(_day_start(start))
+    if end is not None:
+        where.append("t.paid_at < %s")
+        params.append(_day_start(end + timedelta(days=1)))
+    if party is not None:
+        where.append("(t.paid_by_id = %s OR t.paid_to_id = %s OR EXISTS "
+                     "(SELECT 1 FROM {share} s WHERE s.transaction_id = t.id "
+                     "AND s.party_id = %s))")
+        params.extend([party, party, party])
+    sql = ("SELECT t.id FROM {fts} JOIN {transaction} t "
+           "ON t.id = {fts}.rowid WHERE " + " AND ".join(where) +
+           " ORDER BY bm25({fts}, %s, %s) LIMIT %s")
+    params.extend([MEMO_WEIGHT, NOTES_WEIGHT, limit])
+    cursor = get_connection().cursor()
+    cursor.execute(sql.format(fts=FTS_TABLE,
+                              transaction=Transaction._meta.db_table,
+                              share=Share._meta.db_table), params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _search_tokens(group_id, terms, party, category, start, end, limit):
+    transactions = Transaction.objects.all()
+    for term in terms:
+        matches = SearchToken.objects.filter(group=group_id,
+                                             token__startswith=term)
+        transactions = transactions.filter(
+            pk__in=matches.values('transaction'))
+    if category is not None:
+        transactions = transactions.filter(category=category)
+    if start is not None:
+        transactions = transactions.filter(paid_at__gte=_day_start(start))
+    if end is not None:
+        transactions = transactions.filter(
+            paid_at__lt=_day_start(end + timedelta(days=1)))
+    if party is not None:
+        transactions = transactions.filter(
+            Q(paid_by=party) | Q(paid_to=party) |
+            Q(pk__in=Share.objects.filter(party=party).values('transaction')))
+    rank = ("SELECT SUM(st.weight) FROM {token} st "
+            "WHERE st.transaction_id = {transaction}.id AND ({terms})").format(
+        token=SearchToken._meta.db_table,
+        transaction=Transaction._meta.db_table,
+        terms=" OR ".join(["st.token LIKE %s"] * len(terms)))
+    transactions = transactions.extra(
+        select={'rank': rank},
+        select_params=[term + '%' for term in terms],
+        order_by=['-rank', '-paid_at'])
+    return [pk for pk, rank in transactions.values_list('pk', 'rank')[:limit]]
@@ -0,0 +1,172 @@
+"""
+Horizontal sharding of groups across databases.
+
+Everything in a group lives in the same database, its shard. List the
+shard aliases from DATABASES in ``ARGUS_SHARDS`` and add
+``argus.sharding.ShardRouter`` (first) to DATABASE_ROUTERS and
+``argus.sharding.ShardMiddleware`` to MIDDLEWARE_CLASSES. The shard map,
+GroupShard, lives in the default database and also hands out group ids
+and slugs, so that both stay unique across shards. Each request for a
+group is pinned to the group's shard by the middleware.
+
+Management commands work on the default database unless the
+``ARGUS_SHARD`` environment variable names another shard. Read replicas
+are only used for unpinned reads.
+
+"""
+from contextlib import contextmanager
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse
+
+
+_local = threading.local()
+
+
+def get_shards():
+    return getattr(settings, 'ARGUS_SHARDS', ())
+
+
+def sharding_enabled():
+    return bool(get_shards())
+
+
+def choose_shard():
+    """Returns the shard new groups should be created on."""
+    return random.choice(get_shards())
+
+
+def get_current_shard():
+    """
+    Returns the alias of the shard this thread is pinned to, or None to
+    use the default database.
+
+    """
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = os.environ.get('ARGUS_SHARD') or None
+    return shard
+
+
+def current_alias():
+    return get_current_shard() or DEFAULT_DB_ALIAS
+
+
+def get_connection():
+    """The connection raw SQL against argus tables should use."""
+    return connections[current_alias()]
+
+
+@contextmanager
+def atomic(using=None, savepoint=True):
+    """
+    Like Django's atomic, but on the current shard by default, and writing
+    the audit entries of the block's changes before it commits.
+
+    """
+    from argus import audit
+    using = using or current_alias()
+    with transaction.atomic(using, savepoint):
+        with audit.transaction_entries(using):
+            yield
+
+
+def pin(alias):
+    _local.shard = alias
+
+
+@contextmanager
+def pinned(alias):
+    previous = getattr(_local, 'shard', None)
+    _local.shard = alias
+    try:
+        yield
+    finally:
+        _local.shard = previous
+
+
+def _shard_cache_key(slug):
+    return 'argus:group-shard:{}'.format(slug)
+
+
+def get_group_shard(slug):
+    """
+    Returns (shard alias, moving) for the group with the given slug, or
+    None if the shard map doesn't know it.
+
+    """
+    from argus.models import GroupShard
+    entry = cache.get(_shard_cache_key(slug))
+    if entry is None:
+        values = GroupShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            slug=slug).values_list('shard', 'moving')
+        if not values:
+            return None
+        entry = tuple(values[0])
+        cache.set(_shard_cache_key(slug), entry)
+    return entry
+
+
+def invalidate_group_shard(*slugs):
+    cache.delete_many([_shard_cache_key(slug) for slug in slugs])
+
+
+def _is_shard_map(model):
+    return model._meta.app_label == 'argus' and model.__name__ == 'GroupShard'
+
+
+class ShardRouter(object):
+    def db_for_read(self, model, **hints):
+        if _is_shard_map(model):
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'argus':
+            return get_current_shard()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if (obj1._meta.app_label == 'argus' and
+                obj2._meta.app_label == 'argus'):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, model):
+        if _is_shard_map(model):
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardMiddleware(object):
+    """Pins each request for a group to the group's shard."""
+    def __init__(self):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        # Not unpinned in process_response: streamed responses still
+        # read from the shard after it.
+        pin(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slug = view_kwargs.get('group_slug') or view_kwargs.get('slug')
+        if slug is None:
+            return None
+        entry = get_group_shard(slug)
+        if entry is None:
+            return None
+        shard, moving = entry
+        if moving:
+            response = HttpResponse("This group is being moved to another "
+                                    "server. Please try again in a minute.",
+                                    content_type='text/plain', status=503)
+            response['Retry-After'] = '60'
+            return response
+        pin(shard)
+        return None
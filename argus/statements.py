@@ -0,0 +1,188 @@
+"""
+Bank-statement view of a party's ledger.
+
+Each line is a transaction the party took part in, with its net effect on
+the party's balance (what they paid, received and owe as a share of it)
+and the balance after it. Lines are ordered by (paid_at, id) and paged by
+keyset: a page starts after a given transaction, from the balance at that
+point. The keyset bound and the page size are applied inside each branch
+of the query, so the payer and payee branches read a page's worth of rows
+from the (party, paid_at) transaction indexes however deep the page is.
+The balance at the cursor is cached per group change version, so walking
+page by page never sums the earlier history again.
+
+Running balances are computed with a SQL window function where the
+database has them, otherwise by summing the page in Python. Amounts are
+summed as integer cents, since SQLite would sum decimals as floats.
+
+"""
+from decimal import Decimal
+import sqlite3
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Q
+
+from argus.models import Share, Transaction, get_change_version
+
+
+PAGE_SIZE = 50
+
+# Each branch is bounded and limited on its own; a transaction among the
+# first n lines is among the first n rows of every branch it appears in.
+LINES_SQL = """
+    SELECT id, paid_at, SUM(cents) AS cents FROM (
+        SELECT * FROM (
+            SELECT t.id, t.paid_at,
+                   -CAST(ROUND(t.amount * 100) AS INTEGER) AS cents
+            FROM {transaction} t WHERE t.paid_by_id = %s {bound}
+            ORDER BY t.paid_at, t.id {limit}
+        ) paid
+        UNION ALL
+        SELECT * FROM (
+            SELECT t.id, t.paid_at,
+                   CAST(ROUND(t.amount * 100) AS INTEGER) AS cents
+            FROM {transaction} t WHERE t.paid_to_id = %s {bound}
+            ORDER BY t.paid_at, t.id {limit}
+        ) received
+        UNION ALL
+        SELECT * FROM (
+            SELECT t.id, t.paid_at,
+                   CAST(ROUND(s.amount * 100) AS INTEGER) AS cents
+            FROM {share} s JOIN {transaction} t ON t.id = s.transaction_id
+            WHERE s.party_id = %s {bound}
+            ORDER BY t.paid_at, t.id {limit}
+        ) shared
+    ) effects GROUP BY id, paid_at
+"""
+
+# Lines after, or up to and including, the cursor's (paid_at, id).
+AFTER_SQL = "AND (t.paid_at > %s OR (t.paid_at = %s AND t.id > %s))"
+UP_TO_SQL = "AND (t.paid_at < %s OR (t.paid_at = %s AND t.id <= %s))"
+
+
+def _lines_sql(bound="", limit=False):
+    return LINES_SQL.format(transaction=Transaction._meta.db_table,
+                            share=Share._meta.db_table, bound=bound,
+                            limit="LIMIT %s" if limit else "")
+
+
+class InvalidCursor(ValueError):
+    """The cursor isn't one of the party's active transactions."""
+
+
+def _cents(value):
+    return Decimal(value) / 100
+
+
+def windows_supported(connection):
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 25)
+    return connection.vendor in ('postgresql', 'oracle')
+
+
+class StatementLine(object):
+    def __init__(self, transaction, effect, balance):
+        self.transaction = transaction
+        self.effect = effect
+        self.balance = balance
+
+
+class Statement(object):
+    """
+    One page of a party's statement: ``lines`` are StatementLines, and
+    ``next_cursor`` is the id to pass as ``after`` for the next page, or
+    None on the last page. Raises InvalidCursor if ``after`` isn't the id
+    of one of the party's transactions.
+
+    """
+    def __init__(self, party, after=None, page_size=PAGE_SIZE):
+        self.party = party
+        self.after = after
+        self.page_size = page_size
+        self.connection = connections[router.db_for_read(Transaction)]
+        self._version = get_change_version(party.group_id)
+        self._cursor = None
+        if after is not None:
+            paid_at = Transaction.objects.filter(
+                Q(paid_by=party) | Q(paid_to=party) | Q(shares__party=party),
+                pk=after).values_list('paid_at', flat=True)[:1]
+            if not paid_at:
+                raise InvalidCursor(after)
+            self._cursor = [paid_at[0], paid_at[0], after]
+        opening = self._opening_cents()
+        rows = self._rows(opening)
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = rows[-1][0]
+        if rows:
+            cache.set(self._cache_key(rows[-1][0]), rows[-1][2])
+        transactions = Transaction.objects.filter(
+            pk__in=[row[0] for row in rows]
+        ).select_related('paid_by__group', 'paid_to__group')
+        by_pk = dict((transaction.pk, transaction)
+                     for transaction in transactions)
+        base = party.opening_balance
+        self.opening_balance = base + _cents(opening)
+        self.lines = [StatementLine(by_pk[pk], _cents(cents),
+                                    base + _cents(balance))
+                      for pk, cents, balance in rows]
+
+    def _cache_key(self, after):
+        # Party ids are only unique within a shard; group ids are global.
+        return 'argus:statement:{}:{}:{}:{}'.format(
+            self.party.group_id, self.party.pk, self._version, after)
+
+    def _params(self, bound_params=(), limit=None):
+        params = [self.party.pk] + list(bound_params)
+        if limit is not None:
+            params.append(limit)
+        return params * 3
+
+    def _opening_cents(self):
+        """Returns the sum of the party's lines up to the cursor."""
+        if self.after is None:
+            return 0
+        key = self._cache_key(self.after)
+        cents = cache.get(key)
+        if cents is None:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT COALESCE(SUM(cents), 0) FROM (" +
+                _lines_sql(UP_TO_SQL) + ") lines",
+                self._params(self._cursor))
+            cents = cursor.fetchone()[0]
+            cache.set(key, cents)
+        return cents
+
+    def _rows(self, opening):
+        """
+        Returns up to page_size + 1 (id, cents, balance in cents) tuples
+        following the cursor.
+
+        """
+        limit = self.page_size + 1
+        if self._cursor is None:
+            lines = _lines_sql(limit=True)
+            params = self._params(limit=limit)
+        else:
+            lines = _lines_sql(AFTER_SQL, limit=True)
+            params = self._params(self._cursor, limit)
+        windows = windows_supported(self.connection)
+        running = (", SUM(cents) OVER (ORDER BY paid_at, id "
+                   "ROWS UNBOUNDED PRECEDING)" if windows else "")
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT id, cents" + running + " FROM (" + lines +
+            ") lines ORDER BY paid_at, id LIMIT %s",
+            params + [limit])
+        if windows:
+            return [(pk, cents, opening + total)
+                    for pk, cents, total in cursor.fetchall()]
+        rows = []
+        balance = opening
+        for pk, cents in cursor:
+            balance += cents
+            rows.append((pk, cents, balance))
+        return rows
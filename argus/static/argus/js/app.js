@@ -1 +1,11 @@
 $(".chosen-select").chosen({width: "100%"});
+
+// Transaction forms rendered lazily are fetched the first time they're shown.
+$(".modal").one("show.bs.modal", function () {
+	var $form = $(this).find(".transaction-form[data-form-url]");
+	if ($form.length) {
+		$form.load($form.data("form-url"), function () {
+			$form.find(".chosen-select").chosen({width: "100%"});
+		});
+	}
+});
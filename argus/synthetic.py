@@ -0,0 +1,166 @@
+"""
+Synthetic group generation for benchmarks and query budget checks.
+
+"""
+from datetime import timedelta
+from decimal import Decimal
+import random
+
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+
+from argus.models import (Group, GroupShard, GroupSummary, Party, Category,
+                          Transaction, Share, URL_SAFE_CHARS)
+from argus.sharding import atomic, current_alias, sharding_enabled
+
+
+DEFAULT_SPLIT_MIX = {
+    Transaction.SIMPLE: 1,
+    Transaction.EVEN: 5,
+    Transaction.PERCENT: 1,
+    Transaction.AMOUNT: 1,
+    Transaction.SHARES: 1,
+}
+
+
+def parse_split_mix(value):
+    """
+    Parses a split mix such as ``"even=5,simple=1"`` into a dict of split
+    weights. Raises ValueError for unknown splits or bad weights.
+
+    """
+    splits = dict(Transaction.SPLIT_CHOICES)
+    mix = {}
+    for item in value.split(','):
+        split, _, weight = item.partition('=')
+        split = split.strip()
+        if split not in splits:
+            raise ValueError(u"Unknown split: {}".format(split))
+        mix[split] = int(weight) if weight else 1
+        if mix[split] < 0:
+            raise ValueError(u"Negative weight for split: {}".format(split))
+    if not any(mix.values()):
+        raise ValueError(u"At least one split needs a positive weight.")
+    return mix
+
+
+def _partition(rng, total, count):
+    """Splits the integer ``total`` into ``count`` positive integers."""
+    if count == 1:
+        return [total]
+    cuts = sorted(rng.sample(range(1, total), count - 1))
+    return [b - a for a, b in zip([0] + cuts, cuts + [total])]
+
+
+class GroupGenerator(object):
+    """
+    Builds a group with random members, expense sources, categories and
+    transactions using bulk inserts. Passing a seeded ``random.Random`` as
+    ``rng`` makes the generated ledger reproducible.
+
+    """
+    def __init__(self, members=5, sinks=3, categories=4, transactions=100,
+                 split_mix=None, history_days=365, rng=None,
+                 batch_size=500):
+        if members < 2:
+            raise ValueError(u"Groups need at least two members.")
+        self.members = members
+        self.sinks = max(sinks, 1)
+        self.categories = max(categories, 1)
+        self.transactions = transactions
+        self.split_mix = split_mix or DEFAULT_SPLIT_MIX
+        self.history_days = history_days
+        self.rng = rng or random.Random()
+        self.batch_size = batch_size
+
+    def generate(self, slug=None):
+        with atomic():
+            return self._generate(slug)
+
+    def _generate(self, slug):
+        rng = self.rng
+        if slug is None:
+            slug = 'bench-' + get_random_string(length=8,
+                                                allowed_chars=URL_SAFE_CHARS)
+        if sharding_enabled():
+            # Registered on the shard the data is generated on.
+            entry = GroupShard.objects.create(slug=slug, shard=current_alias())
+            group = Group.objects.create(id=entry.pk, slug=slug, name=slug)
+        else:
+            group = Group.objects.create(slug=slug, name=slug)
+
+        Category.objects.bulk_create([
+            Category(group=group, name=u"Category {}".format(i))
+            for i in range(self.categories)])
+        categories = list(group.categories.order_by('pk'))
+        group.default_category = categories[0]
+        group.save(update_fields=['default_category'])
+
+        Party.objects.bulk_create(
+            [Party(group=group, name=u"Member {}".format(i),
+                   party_type=Party.MEMBER)
+             for i in range(self.members)] +
+            [Party(group=group, name=u"Source {}".format(i),
+                   party_type=Party.SINK)
+             for i in range(self.sinks)])
+        parties = list(group.parties.order_by('pk'))
+        members = [p for p in parties if p.party_type == Party.MEMBER]
+        sinks = [p for p in parties if p.party_type == Party.SINK]
+
+        splits = [split for split, weight in sorted(self.split_mix.items())
+                  for _ in range(weight)]
+        start = now()
+        history = self.history_days * 24 * 60 * 60
+        transactions = []
+        numerators = []
+        for i in range(self.transactions):
+            split = rng.choice(splits)
+            paid_by = rng.choice(members)
+            cents = rng.randint(100, 50000)
+            transaction = Transaction(
+                paid_by=paid_by,
+                memo=u"Transaction {}".format(i),
+                amount=Decimal(cents) / 100,
+                paid_at=start - timedelta(seconds=rng.randint(0, history)),
+                category=rng.choice(categories),
+                split=split)
+            if split == Transaction.SIMPLE:
+                transaction.paid_to = rng.choice(
+                    [m for m in members if m != paid_by] + sinks)
+                if transaction.paid_to.is_member():
+                    numerators.append(None)
+                else:
+                    numerators.append([(paid_by, 1)])
+            else:
+                transaction.paid_to = rng.choice(sinks)
+                # Capped so that every sharer can get at least one cent.
+                sharers = rng.sample(members,
+                                     rng.randint(1, min(len(members), 100)))
+                if split == Transaction.EVEN:
+                    weights = [1] * len(sharers)
+                elif split == Transaction.PERCENT:
+                    # Hundredths of a percent, as TransactionForm stores them.
+                    weights = _partition(rng, 10000, len(sharers))
+                elif split == Transaction.AMOUNT:
+                    weights = _partition(rng, cents, len(sharers))
+                else:
+                    weights = [rng.randint(1, 4) * 100 for _ in sharers]
+                numerators.append(list(zip(sharers, weights)))
+            transactions.append(transaction)
+
+        Transaction.objects.bulk_create(transactions,
+                                        batch_size=self.batch_size)
+        pks = Transaction.objects.filter(paid_by__group=group
+                                         ).order_by('pk'
+                                         ).values_list('pk', flat=True)
+        shares = []
+        for transaction, pk, member_numerators in zip(transactions, pks,
+                                                      numerators):
+            transaction.pk = pk
+            if member_numerators:
+                shares.extend(Share.objects.build_split(transaction,
+                                                        member_numerators))
+        Share.objects.bulk_create(shares, batch_size=self.batch_size)
+        # Bulk inserts don't send the signals that maintain the summary.
+        GroupSummary.objects.reconcile([group.pk])
+        return group
@@ -0,0 +1,132 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils.encoding import force_text
+
+from argus import audit, rebalance
+from argus.models import AuditEntry, Category, Party
+from argus.sharding import atomic
+from argus.tests.test_versioning import create_group
+
+
+class AuditActorTestCase(TestCase):
+    def setUp(self):
+        self.group = create_group()[0]
+        self.group.set_password('audit')
+        self.group.save(update_fields=['password'])
+        self.client.post(reverse('argus_group_login',
+                                 kwargs={'slug': self.group.slug}),
+                         {'password': 'audit'})
+
+    def test_member_changes__hide_address(self):
+        party = self.group.parties.members()[0]
+        self.client.post(reverse('argus_party_update', kwargs={
+            'group_slug': self.group.slug, 'pk': party.pk,
+        }), {'name': 'Alicia', 'party_type': party.party_type,
+             'opening_balance': '0.00'}, REMOTE_ADDR='203.0.113.7')
+        entry = AuditEntry.objects.filter(model='party').latest('pk')
+        self.assertEqual(entry.actor, audit.MEMBER)
+        response = self.client.get(reverse('argus_audit_log', kwargs={
+            'group_slug': self.group.slug}))
+        self.assertContains(response, 'A member')
+        self.assertNotContains(response, '203.0.113.7')
+
+    def test_migration__hides_recorded_addresses(self):
+        AuditEntry.objects.all().delete()
+        for actor in ('203.0.113.7', '2001:db8::1', 'admin', ''):
+            AuditEntry.objects.create(group=self.group, model='group',
+                                      object_id=self.group.pk,
+                                      action=audit.UPDATE, actor=actor,
+                                      payload=audit.encode({}))
+        migration = import_module('argus.migrations.0018_audit_actors')
+        migration.hide_addresses(apps, connection.schema_editor())
+        self.assertEqual(
+            sorted(AuditEntry.objects.values_list('actor', flat=True)),
+            ['', audit.MEMBER, audit.MEMBER, 'admin'])
+
+
+class AuditRequestTestCase(TestCase):
+    def setUp(self):
+        self.group = create_group()[0]
+        self.party = self.group.parties.members()[0]
+        AuditEntry.objects.all().delete()
+        self.middleware = audit.AuditMiddleware()
+        self.request = RequestFactory().post('/')
+        self.middleware.process_request(self.request)
+
+    def tearDown(self):
+        audit.stop()
+
+    def rename(self, name):
+        with atomic():
+            self.party.name = name
+            self.party.save()
+
+    def names(self):
+        return [audit.decode(payload)['name'] for payload in
+                AuditEntry.objects.filter(model='party').order_by(
+                    'pk').values_list('payload', flat=True)]
+
+    def test_exception__keeps_committed_entries(self):
+        self.rename('Alicia')
+        self.assertEqual(self.names(), [['Alice', 'Alicia']])
+        self.middleware.process_exception(self.request, ValueError())
+        self.assertEqual(self.names(), [['Alice', 'Alicia']])
+
+    def test_rolled_back_block__drops_entries(self):
+        with self.assertRaises(ValueError):
+            with atomic():
+                self.rename('Alicia')
+                raise ValueError
+        self.party = Party.objects.get(pk=self.party.pk)
+        self.rename('Bea')
+        self.middleware.process_response(self.request, None)
+        self.assertEqual(self.names(), [['Alice', 'Bea']])
+
+
+class EncodeTestCase(SimpleTestCase):
+    def test_lazy_text(self):
+        name = Category.DEFAULT_NAME
+        self.assertEqual(audit.decode(audit.encode({'name': [None, name]})),
+                         {'name': [None, force_text(name)]})
+
+
+class MoveAuditTestCase(SimpleTestCase):
+    ids = {
+        'party': {1: 11, 2: 12},
+        'category': {5: 15},
+        'transaction': {7: 17},
+    }
+
+    def remap(self, model, object_id, changes):
+        entry = AuditEntry(group_id=3, model=model, object_id=object_id,
+                           action=audit.UPDATE,
+                           payload=audit.encode(changes))
+        rebalance._remap_audit_entry(entry, self.ids)
+        return entry.object_id, audit.decode(entry.payload)
+
+    def test_transaction(self):
+        self.assertEqual(
+            self.remap('transaction', 7, {'paid_by_id': [1, 2],
+                                          'category_id': [None, 5],
+                                          'memo': ['a', 'b']}),
+            (17, {'paid_by_id': [11, 12], 'category_id': [None, 15],
+                  'memo': ['a', 'b']}))
+
+    def test_shares(self):
+        self.assertEqual(
+            self.remap('share', 7, {'1': ['5.00', None],
+                                    '2': [None, '5.00']}),
+            (17, {'11': ['5.00', None], '12': [None, '5.00']}))
+
+    def test_group(self):
+        self.assertEqual(
+            self.remap('group', 3, {'default_category_id': [None, 5]}),
+            (3, {'default_category_id': [None, 15]}))
+
+    def test_deleted_rows__keep_ids(self):
+        self.assertEqual(self.remap('party', 9, {'name': ['Gone', None]}),
+                         (9, {'name': ['Gone', None]}))
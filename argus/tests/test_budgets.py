@@ -0,0 +1,30 @@
+from django.core.management import call_command
+from django.test import TestCase
+
+from argus import budgets
+
+
+class QueryBudgetTestCase(TestCase):
+    def test_within_budget(self):
+        # Raises CommandError listing the URLs over budget.
+        call_command('check_query_budgets', verbosity=0)
+
+    def test_compare__catches_regressions(self):
+        snapshot = {'argus_group_detail': {'queries': 10,
+                                           'size_dependent': False}}
+        failures = budgets.compare(snapshot, [
+            {'argus_group_detail': (200, 10)},
+            {'argus_group_detail': (200, 12)},
+        ])
+        self.assertEqual(len(failures), 2)
+
+    def test_make_snapshot__keeps_marks_only(self):
+        measurements = [{'a': (200, 3), 'b': (200, 3)},
+                        {'a': (200, 5), 'b': (200, 4)}]
+        snapshot = budgets.make_snapshot(measurements, {
+            'a': {'queries': 4, 'size_dependent': True}})
+        self.assertEqual(snapshot, {
+            'a': {'queries': 5, 'size_dependent': True},
+            'b': {'queries': 4, 'size_dependent': False},
+        })
+        self.assertEqual(len(budgets.compare(snapshot, measurements)), 1)
@@ -0,0 +1,57 @@
+from django.contrib.messages import get_messages
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from argus.models import Transaction
+from argus.tests.test_versioning import create_group
+
+
+class TransactionBulkViewTestCase(TestCase):
+    def setUp(self):
+        self.group, self.members, _, self.transaction = create_group()
+        self.group.set_password('bulk')
+        self.group.save(update_fields=['password'])
+        self.client.post(reverse('argus_group_login',
+                                 kwargs={'slug': self.group.slug}),
+                         {'password': 'bulk'})
+        self.url = reverse('argus_transaction_bulk',
+                           kwargs={'group_slug': self.group.slug})
+
+    def test_invalid__redirects_with_message(self):
+        response = self.client.post(self.url, {'action': 'delete'})
+        self.assertRedirects(response, self.group.get_absolute_url(),
+                             fetch_redirect_response=False)
+        self.assertEqual(
+            [m.message for m in get_messages(response.wsgi_request)],
+            ["Select at least one transaction."])
+
+    def test_invalid__ajax(self):
+        response = self.client.post(self.url, {'action': 'delete'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('transactions', response.content.decode('utf-8'))
+
+    def test_delete__redirects_back(self):
+        referer = 'http://testserver' + self.members[0].get_absolute_url()
+        response = self.client.post(self.url, {
+            'action': 'delete',
+            'transactions': str(self.transaction.pk),
+        }, HTTP_REFERER=referer)
+        self.assertRedirects(response, referer,
+                             fetch_redirect_response=False)
+        self.assertFalse(Transaction.objects.filter(
+            pk=self.transaction.pk).exists())
+
+    def test_other_group__rejected(self):
+        other = create_group(slug='other')[3]
+        response = self.client.post(self.url, {
+            'action': 'delete',
+            'transactions': [self.transaction.pk, other.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [m.message for m in get_messages(response.wsgi_request)],
+            ["Some of these transactions don't exist or belong to another "
+             "group."])
+        self.assertEqual(Transaction.objects.filter(
+            pk__in=[self.transaction.pk, other.pk]).count(), 2)
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from argus.forms import TransactionForm
+from argus.models import (Transaction, deferred_changes, get_change_version,
+                          record_change)
+from argus.tests.test_versioning import create_group, form_data
+
+
+class ChangeVersionTestCase(TestCase):
+    def setUp(self):
+        self.group, self.members, _, self.transaction = create_group()
+
+    def test_deferred_changes(self):
+        version = get_change_version(self.group.pk)
+        with deferred_changes():
+            record_change(self.group.pk)
+            with deferred_changes():
+                record_change(self.group.pk)
+            self.assertEqual(get_change_version(self.group.pk), version)
+        self.assertEqual(get_change_version(self.group.pk), version + 1)
+
+    def test_form_save__bumps_version_after_writing(self):
+        seen = []
+
+        def saved(sender, instance, **kwargs):
+            seen.append(get_change_version(self.group.pk))
+        post_save.connect(saved, sender=Transaction)
+        self.addCleanup(post_save.disconnect, saved, sender=Transaction)
+
+        version = get_change_version(self.group.pk)
+        form = TransactionForm(self.group, instance=self.transaction,
+                               data=form_data(self.transaction, '20.00',
+                                              self.members, 0))
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(seen, [version])
+        self.assertGreater(get_change_version(self.group.pk), version)
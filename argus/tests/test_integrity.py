@@ -0,0 +1,139 @@
+from decimal import Decimal
+import json
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from argus import integrity
+from argus.models import Category, GroupSummary, Party, Share, Transaction
+from argus.tests.test_versioning import create_group
+
+
+def checks(problems):
+    return sorted(problem['check'] for problem in problems)
+
+
+class IntegrityTestCase(TestCase):
+    def setUp(self):
+        (self.group, self.members, self.sink,
+         self.transaction) = create_group()
+        self.shares = self.transaction.shares.order_by('pk')
+
+    def check_transactions(self, fix=False):
+        pk = self.transaction.pk
+        return integrity.check_transactions(pk, pk + 1, fix)
+
+    def check_groups(self, fix=False):
+        pk = self.group.pk
+        return integrity.check_groups(pk, pk + 1, fix)
+
+    def test_clean_ledger(self):
+        self.assertEqual(self.check_transactions(), [])
+        self.assertEqual(self.check_groups(), [])
+
+    def test_share_sum(self):
+        Share.objects.filter(pk=self.shares[0].pk).update(
+            amount=Decimal('9.99'))
+        actual = sum(share.amount for share in self.shares)
+        problems = self.check_transactions()
+        self.assertEqual(problems, [{
+            'check': integrity.SHARE_SUM, 'group': self.group.pk,
+            'fixed': False, 'transaction': self.transaction.pk,
+            'expected': '10.00', 'actual': str(actual),
+        }])
+
+    def test_share_sum__fix(self):
+        Share.objects.filter(pk=self.shares[0].pk).update(
+            amount=Decimal('9.99'))
+        problems = self.check_transactions(fix=True)
+        self.assertEqual([problem['fixed'] for problem in problems], [True])
+        self.assertEqual(sum(share.amount for share in self.shares),
+                         Decimal('10.00'))
+        self.assertEqual(self.check_transactions(), [])
+
+    def test_fractions(self):
+        # One third is missing, so the fractions add up to 2/3.
+        self.shares[2].delete()
+        problems = self.check_transactions(fix=True)
+        self.assertEqual(checks(problems),
+                         [integrity.FRACTIONS, integrity.SHARE_SUM])
+        fractions = [problem for problem in problems
+                     if problem['check'] == integrity.FRACTIONS][0]
+        self.assertEqual(fractions['numerators'], 2)
+        self.assertEqual(fractions['denominators'], [3])
+        # Which share is missing is for a person to decide.
+        self.assertFalse(any(problem['fixed'] for problem in problems))
+
+    def test_cross_group(self):
+        other_group, other_members = create_group(slug='other')[:2]
+        Share.objects.filter(pk=self.shares[0].pk).update(
+            party=other_members[0])
+        Transaction.objects.filter(pk=self.transaction.pk).update(
+            category=other_group.default_category)
+        problems = self.check_transactions()
+        self.assertEqual(checks(problems), [integrity.CATEGORY_GROUP,
+                                            integrity.SHARE_GROUP])
+
+    def test_totals(self):
+        GroupSummary.objects.filter(group=self.group).update(
+            transaction_count=5)
+        Party.objects.filter(pk=self.members[1].pk).update(
+            opening_balance=Decimal('1.00'))
+        Category.objects.filter(pk=self.group.default_category_id).update(
+            archived_total=Decimal('2.00'))
+        problems = self.check_groups()
+        self.assertEqual(checks(problems), [integrity.ARCHIVED_TOTAL,
+                                            integrity.OPENING_BALANCE,
+                                            integrity.SUMMARY])
+        summary = [problem for problem in problems
+                   if problem['check'] == integrity.SUMMARY][0]
+        self.assertEqual(summary['expected'], [1, '10.00'])
+        self.assertEqual(summary['actual'], [5, '10.00'])
+
+        problems = self.check_groups(fix=True)
+        self.assertTrue(all(problem['fixed'] for problem in problems))
+        self.assertEqual(self.check_groups(), [])
+
+    def test_check_range(self):
+        GroupSummary.objects.filter(group=self.group).delete()
+        job = ('groups', self.group.pk, self.group.pk + 1, False)
+        result_job, problems, error = integrity.check_range(job)
+        self.assertEqual(result_job, job)
+        self.assertIsNone(error)
+        self.assertEqual(problems[0]['actual'], None)
+        self.assertEqual(checks(problems), [integrity.SUMMARY])
+
+
+class CheckLedgerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.transaction = create_group()[3]
+
+    def check_ledger(self, **options):
+        with tempfile.NamedTemporaryFile(mode='r') as output:
+            try:
+                call_command('check_ledger', processes=1,
+                             output=output.name, stderr=StringIO(),
+                             **options)
+            finally:
+                self.lines = [json.loads(line) for line in output]
+        return self.lines
+
+    def test_clean_ledger(self):
+        lines = self.check_ledger()
+        self.assertEqual(lines[-1]['summary'], {})
+        self.assertEqual(lines[-1]['unfixed'], 0)
+
+    def test_corrupt_ledger(self):
+        share = self.transaction.shares.order_by('pk')[0]
+        Share.objects.filter(pk=share.pk).update(amount=Decimal('9.99'))
+        with self.assertRaises(CommandError):
+            self.check_ledger()
+        self.assertEqual(self.lines[0]['check'], integrity.SHARE_SUM)
+        self.assertEqual(self.lines[-1]['unfixed'], 1)
+        lines = self.check_ledger(fix=True)
+        self.assertEqual(lines[-1]['summary'], {integrity.SHARE_SUM: 1})
+        self.assertEqual(lines[-1]['unfixed'], 0)
+        self.assertEqual(self.check_ledger()[-1]['summary'], {})
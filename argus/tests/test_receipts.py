@@ -0,0 +1,81 @@
+from io import BytesIO
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+from PIL import Image
+
+from argus.forms import TransactionForm
+from argus.models import Receipt
+from argus.tests.test_versioning import create_group, form_data
+
+
+def image_bytes(image_format):
+    output = BytesIO()
+    Image.new('RGB', (4, 4), 'white').save(output, image_format)
+    return output.getvalue()
+
+
+# A valid GIF that is also an HTML page.
+POLYGLOT = image_bytes('GIF') + b'<script>alert(1)</script>'
+
+
+class ReceiptTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.group, self.members, _, self.transaction = create_group()
+        self.group.set_password('receipts')
+        self.group.save(update_fields=['password'])
+        self.client.post(reverse('argus_group_login',
+                                 kwargs={'slug': self.group.slug}),
+                         {'password': 'receipts'})
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def form(self, name, content):
+        return TransactionForm(
+            self.group, instance=self.transaction,
+            data=form_data(self.transaction, '10.00', self.members, 0),
+            files={'receipt': SimpleUploadedFile(name, content)})
+
+    def get(self, receipt):
+        return self.client.get(reverse('argus_receipt', kwargs={
+            'group_slug': self.group.slug, 'pk': receipt.pk,
+            'variant': 'image'}))
+
+    def test_upload__named_by_format(self):
+        form = self.form('receipt.html', POLYGLOT)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        receipt = Receipt.objects.get(transaction=self.transaction)
+        self.assertTrue(receipt.image.name.endswith('.gif'))
+        response = self.get(receipt)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_upload__other_formats_rejected(self):
+        form = self.form('receipt.svg', image_bytes('BMP'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('receipt', form.errors)
+        with self.assertRaises(ValueError):
+            Receipt.objects.create_from_upload(
+                self.transaction,
+                SimpleUploadedFile('receipt.png', image_bytes('BMP')))
+
+    def test_legacy_name__served_as_download(self):
+        name = default_storage.save('argus/receipts/ab/abc.html',
+                                    BytesIO(POLYGLOT))
+        receipt = Receipt.objects.create(transaction=self.transaction,
+                                         sha1='abc', image=name)
+        response = self.get(receipt)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
@@ -0,0 +1,40 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from argus.models import Group, get_group_route, invalidate_group_route
+from argus.tests.test_versioning import create_group
+
+
+class StaleRouteTestCase(TestCase):
+    """
+    A route cached before the group got a password (as another process's
+    copy may be) mustn't let requests through.
+
+    """
+    def setUp(self):
+        self.group = create_group()[0]
+        invalidate_group_route(self.group.slug)
+        self.assertFalse(get_group_route(self.group.slug).has_password)
+        self.group.set_password('routes')
+        Group.objects.filter(pk=self.group.pk).update(
+            password=self.group.password)
+        self.login_url = reverse('argus_group_login',
+                                 kwargs={'slug': self.group.slug})
+
+    def tearDown(self):
+        invalidate_group_route(self.group.slug)
+
+    def assertRedirectsToLogin(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(self.login_url))
+
+    def test_search(self):
+        self.assertRedirectsToLogin(
+            reverse('argus_transaction_search',
+                    kwargs={'group_slug': self.group.slug}) + '?q=lunch')
+
+    def test_archive_export(self):
+        self.assertRedirectsToLogin(
+            reverse('argus_archive_export',
+                    kwargs={'group_slug': self.group.slug}))
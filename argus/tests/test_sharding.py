@@ -0,0 +1,137 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import router
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from argus import audit
+from argus.forms import GroupCreateFormSet
+from argus.models import (AuditEntry, Group, GroupShard, Party, Share,
+                          Transaction)
+from argus.rebalance import move_group
+from argus.sharding import pin, pinned
+
+
+def create_with_formset():
+    data = {
+        'form-TOTAL_FORMS': 2,
+        'form-INITIAL_FORMS': 0,
+        'form-MIN_NUM_FORMS': 1,
+        'form-MAX_NUM_FORMS': 1000,
+        'form-0-name': 'Alice',
+        'form-1-name': 'Bob',
+    }
+    formset = GroupCreateFormSet(data, queryset=Party.objects.none())
+    assert formset.is_valid(), formset.errors
+    return formset.save()
+
+
+@override_settings(ARGUS_SHARDS=['default', 'shard1'])
+class ShardingTestCase(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        # Requests leave the thread pinned to their group's shard.
+        pin(None)
+
+    def test_router__pins_to_shard(self):
+        with pinned('shard1'):
+            self.assertEqual(router.db_for_write(Party), 'shard1')
+            self.assertEqual(router.db_for_read(Transaction), 'shard1')
+            # The shard map stays on the default database.
+            self.assertEqual(router.db_for_write(GroupShard), 'default')
+            group = Group.objects.create(slug='pinned')
+        self.assertEqual(group._state.db, 'shard1')
+        self.assertFalse(Group.objects.filter(slug='pinned').exists())
+        self.assertTrue(Group.objects.using('shard1').filter(
+            slug='pinned').exists())
+
+    def test_group_create__allocates_across_shards(self):
+        with override_settings(ARGUS_SHARDS=['default']):
+            first = create_with_formset()
+        with override_settings(ARGUS_SHARDS=['shard1']):
+            second = create_with_formset()
+        # Each shard would hand out the same id on its own.
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertNotEqual(first.slug, second.slug)
+        self.assertEqual(
+            dict(GroupShard.objects.values_list('pk', 'shard')),
+            {first.pk: 'default', second.pk: 'shard1'})
+        self.assertEqual(second._state.db, 'shard1')
+        with pinned('shard1'):
+            self.assertEqual(
+                sorted(second.parties.values_list('name', flat=True)),
+                ['Alice', 'Bob'])
+        self.assertFalse(Party.objects.filter(group=second.pk).exists())
+
+        # Requests for each group are pinned to its shard.
+        for group in (first, second):
+            response = self.client.get(reverse(
+                'argus_group_detail', kwargs={'group_slug': group.slug}))
+            self.assertContains(response, 'Alice')
+
+    def test_move_group(self):
+        # Takes the target's first ids, so that moved rows get new ones.
+        with override_settings(ARGUS_SHARDS=['shard1']):
+            create_with_formset()
+        with override_settings(ARGUS_SHARDS=['default']):
+            group = create_with_formset()
+        alice, bob = group.parties.order_by('name')
+        sink = Party.objects.create(group=group, name='Shop')
+        lunch = Transaction.objects.create_even(
+            alice, sink, Decimal('10.00'), 'Lunch',
+            category=group.default_category)
+        Transaction.objects.create(
+            paid_by=bob, paid_to=alice, amount=Decimal('4.00'),
+            memo='Settle up', category=group.default_category,
+            split=Transaction.SIMPLE)
+        shares = dict(lunch.shares.values_list('party__name', 'amount'))
+
+        move_group(group.slug, 'shard1')
+
+        self.assertEqual(GroupShard.objects.get(pk=group.pk).shard, 'shard1')
+        # The source copy is purged.
+        self.assertFalse(Group.objects.filter(pk=group.pk).exists())
+        self.assertFalse(Party.objects.filter(group=group.pk).exists())
+        self.assertFalse(Transaction.objects.filter(
+            paid_by__group=group.pk).exists())
+        self.assertFalse(AuditEntry.objects.filter(group=group.pk).exists())
+
+        with pinned('shard1'):
+            moved = Group.objects.get(pk=group.pk)
+            self.assertEqual(moved.default_category.name,
+                             group.default_category.name)
+            parties = dict(moved.parties.values_list('name', 'pk'))
+            self.assertEqual(sorted(parties), ['Alice', 'Bob', 'Shop'])
+            self.assertNotEqual(parties['Alice'], alice.pk)
+            transactions = dict(
+                (transaction.memo, transaction) for transaction in
+                Transaction.objects.filter(paid_by__group=moved))
+            moved_lunch = transactions['Lunch']
+            self.assertEqual(moved_lunch.paid_by_id, parties['Alice'])
+            self.assertEqual(dict(moved_lunch.shares.values_list(
+                'party__name', 'amount')), shares)
+            settle = transactions['Settle up']
+            self.assertEqual((settle.paid_by_id, settle.paid_to_id),
+                             (parties['Bob'], parties['Alice']))
+
+            # The audit log refers to the new ids.
+            entries = AuditEntry.objects.filter(group=moved)
+            entry = entries.get(model='transaction', object_id=settle.pk,
+                                action=audit.CREATE)
+            changes = audit.decode(entry.payload)
+            self.assertEqual(changes['paid_by_id'], [None, parties['Bob']])
+            self.assertEqual(changes['paid_to_id'], [None, parties['Alice']])
+            entry = entries.get(model='share', object_id=moved_lunch.pk)
+            self.assertEqual(sorted(audit.decode(entry.payload)),
+                             sorted(str(parties[name]) for name in shares))
+
+        response = self.client.get(reverse(
+            'argus_group_detail', kwargs={'group_slug': group.slug}))
+        self.assertContains(response, 'Settle up')
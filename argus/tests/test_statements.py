@@ -0,0 +1,64 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from argus.models import Transaction
+from argus.statements import InvalidCursor, Statement
+from argus.tests.test_versioning import create_group
+
+
+class StatementTestCase(TestCase):
+    def setUp(self):
+        self.group, self.members, self.sink, first = create_group()
+        paid_at = first.paid_at
+        # Several transactions share a paid_at, so pages split ties.
+        for i in range(7):
+            payer = self.members[i % 3]
+            Transaction.objects.create_even(
+                payer, self.sink, Decimal('{}.00'.format(i + 1)),
+                'Item {}'.format(i), category=self.group.default_category,
+                paid_at=paid_at + timedelta(days=i // 2))
+        Transaction.objects.create(
+            paid_by=self.members[1], paid_to=self.members[0],
+            amount=Decimal('4.00'), memo='Settle up',
+            category=self.group.default_category,
+            split=Transaction.SIMPLE, paid_at=paid_at + timedelta(days=1))
+
+    def lines(self, statement):
+        return [(line.transaction.pk, line.effect, line.balance)
+                for line in statement.lines]
+
+    def test_pages__match_full_statement(self):
+        party = self.members[0]
+        full = Statement(party, page_size=100)
+        self.assertIsNone(full.next_cursor)
+        pages = []
+        after = None
+        while True:
+            statement = Statement(party, after, page_size=2)
+            pages.extend(self.lines(statement))
+            after = statement.next_cursor
+            if after is None:
+                break
+        self.assertEqual(pages, self.lines(full))
+        self.assertEqual(len(pages), 9)
+
+    def test_foreign_cursor__rejected(self):
+        other_group, other_members, _, other = create_group(slug='other')
+        with self.assertRaises(InvalidCursor):
+            Statement(self.members[0], other.pk)
+        with self.assertRaises(InvalidCursor):
+            Statement(self.members[0], 0)
+
+        self.group.set_password('statement')
+        self.group.save(update_fields=['password'])
+        self.client.post(reverse('argus_group_login',
+                                 kwargs={'slug': self.group.slug}),
+                         {'password': 'statement'})
+        url = reverse('argus_party_statement', kwargs={
+            'group_slug': self.group.slug, 'pk': self.members[0].pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url, {'after': other.pk})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,49 @@
+from decimal import Decimal
+from importlib import import_module
+import random
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+
+from argus.models import GroupSummary, Party, Transaction
+from argus.synthetic import GroupGenerator
+
+
+class GroupSummaryTestCase(TestCase):
+    def setUp(self):
+        self.group = GroupGenerator(transactions=50,
+                                    rng=random.Random(1)).generate()
+        transactions = Transaction.objects.filter(paid_by__group=self.group)
+        self.count = transactions.count()
+        self.spent = sum(
+            (t.amount for t in transactions.select_related('paid_to')
+             if not (t.split == Transaction.SIMPLE and
+                     t.paid_to.party_type == Party.MEMBER)),
+            Decimal('0.00'))
+        self.last = transactions.aggregate(Max('paid_at'))['paid_at__max']
+
+    def assertSummaryCorrect(self):
+        summary = GroupSummary.objects.get(group=self.group)
+        self.assertEqual(summary.transaction_count, self.count)
+        self.assertEqual(summary.total_spent, self.spent)
+        self.assertGreaterEqual(summary.last_activity, self.last)
+
+    def test_compute(self):
+        count, spent, last = GroupSummary.objects.compute(
+            [self.group.pk])[self.group.pk]
+        self.assertEqual((count, spent, last),
+                         (self.count, self.spent, self.last))
+
+    def test_reconcile__fixes_wrong_summary(self):
+        GroupSummary.objects.filter(group=self.group).update(
+            transaction_count=0, total_spent=0)
+        self.assertEqual(GroupSummary.objects.reconcile([self.group.pk]), 1)
+        self.assertSummaryCorrect()
+
+    def test_migration__creates_summaries(self):
+        GroupSummary.objects.all().delete()
+        migration = import_module('argus.migrations.0012_groupsummary')
+        migration.create_summaries(apps, connection.schema_editor())
+        self.assertSummaryCorrect()
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from argus.models import Group
+from argus.throttle import SlidingWindow, login_throttle
+
+
+@override_settings(ARGUS_LOGIN_THROTTLE={'group': (3, 300)})
+class LoginThrottleTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group(pk=1, slug='throttled')
+
+    def test_allow__up_to_limit(self):
+        self.assertEqual([login_throttle.allow(self.group) for i in range(5)],
+                         [True, True, True, False, False])
+        self.assertEqual(login_throttle.blocked_counts()['group'], 2)
+
+    def test_blocked_attempts__not_counted(self):
+        window = SlidingWindow('group', 3, 300)
+        for i in range(5):
+            login_throttle.allow(self.group)
+        # One hit is let through once one of the three allowed ones is
+        # taken back, so the blocked ones left nothing behind.
+        window.undo(self.group.pk)
+        self.assertTrue(login_throttle.allow(self.group))
+        self.assertFalse(login_throttle.allow(self.group))
+
+    def test_hit__counts_before_judging(self):
+        # Concurrent checks each get their own count from the increment,
+        # so only ``limit`` of them can be within it.
+        window = SlidingWindow('group', 3, 300)
+        self.assertEqual([window.hit('racer') for i in range(4)],
+                         [True, True, True, False])
@@ -0,0 +1,139 @@
+from decimal import Decimal
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from argus.forms import TransactionForm
+from argus.models import (Category, Group, Party, Share, Transaction,
+                          VersionConflict)
+
+
+def create_group(slug='versions'):
+    group = Group.objects.create(slug=slug)
+    category = Category.objects.create(group=group, name='Food')
+    group.default_category = category
+    group.save(update_fields=['default_category'])
+    members = [Party.objects.create(group=group, name=name,
+                                    party_type=Party.MEMBER)
+               for name in ('Alice', 'Bob', 'Carol')]
+    sink = Party.objects.create(group=group, name='Shop')
+    transaction = Transaction.objects.create_even(
+        members[0], sink, Decimal('10.00'), 'Lunch', category=category)
+    return group, members, sink, transaction
+
+
+def form_data(transaction, amount, sharers, version):
+    data = dict(('member{}'.format(pk), 0) for pk in Party.objects.filter(
+        group=transaction.paid_by.group_id,
+        party_type=Party.MEMBER).values_list('pk', flat=True))
+    data.update({
+        'paid_by': transaction.paid_by_id,
+        'paid_to': transaction.paid_to_id,
+        'memo': transaction.memo,
+        'amount': amount,
+        'paid_at': transaction.paid_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'category': transaction.category_id,
+        'split': Transaction.EVEN,
+        'sharers': [member.pk for member in sharers],
+        'version': version,
+    })
+    return data
+
+
+def edit(group, pk, amount, sharers, version):
+    transaction = Transaction.objects.get(pk=pk)
+    form = TransactionForm(group, instance=transaction,
+                           data=form_data(transaction, amount, sharers,
+                                          version))
+    assert form.is_valid(), form.errors
+    form.save()
+    return form
+
+
+class VersionConflictTestCase(TestCase):
+    def setUp(self):
+        self.group, self.members, _, self.transaction = create_group()
+
+    def test_stale_edit__conflicts(self):
+        edit(self.group, self.transaction.pk, '20.00', self.members, 0)
+        with self.assertRaises(VersionConflict):
+            edit(self.group, self.transaction.pk, '30.00', self.members, 0)
+        transaction = Transaction.objects.get(pk=self.transaction.pk)
+        self.assertEqual(transaction.amount, Decimal('20.00'))
+        self.assertEqual(transaction.version, 1)
+
+    def test_version_conflict__points_form_at_current_version(self):
+        edit(self.group, self.transaction.pk, '20.00', self.members, 0)
+        form = TransactionForm(self.group, instance=self.transaction,
+                               data=form_data(self.transaction, '30.00',
+                                              self.members, 0))
+        self.assertTrue(form.is_valid())
+        form.version_conflict()
+        self.assertEqual(form.non_field_errors(),
+                         [TransactionForm.version_conflict_message])
+        self.assertEqual(form.data['version'], 1)
+
+    def test_version_conflict__deleted(self):
+        form = TransactionForm(self.group, instance=self.transaction,
+                               data=form_data(self.transaction, '30.00',
+                                              self.members, 0))
+        self.assertTrue(form.is_valid())
+        Transaction.objects.filter(pk=self.transaction.pk).delete()
+        with self.assertRaises(VersionConflict):
+            form.save()
+        form.version_conflict()
+        self.assertEqual(form.non_field_errors(),
+                         [TransactionForm.deleted_message])
+
+
+class ConcurrentEditTestCase(TransactionTestCase):
+    threads = 8
+    edits_per_thread = 5
+
+    def setUp(self):
+        self.group, self.members, _, self.transaction = create_group()
+
+    def test_concurrent_edits__shares_add_up(self):
+        outcomes = []
+        start = threading.Event()
+
+        def hammer(index):
+            try:
+                start.wait()
+                for i in range(self.edits_per_thread):
+                    # Every thread edits from the version it last saw,
+                    # so most edits race with another thread's.
+                    version = Transaction.objects.filter(
+                        pk=self.transaction.pk).values_list(
+                            'version', flat=True)[0]
+                    amount = '{}.{:02d}'.format(10 + index, i)
+                    sharers = self.members[:1 + (index + i) % 3]
+                    try:
+                        edit(self.group, self.transaction.pk, amount,
+                             sharers, version)
+                    except VersionConflict:
+                        outcomes.append(False)
+                    else:
+                        outcomes.append(True)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=hammer, args=(index,))
+                   for index in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(outcomes),
+                         self.threads * self.edits_per_thread)
+        transaction = Transaction.objects.get(pk=self.transaction.pk)
+        # Every successful edit bumped the version exactly once.
+        self.assertEqual(transaction.version, outcomes.count(True))
+        shares = Share.objects.filter(transaction=transaction)
+        self.assertEqual(sum(share.amount for share in shares),
+                         transaction.amount)
+        self.assertEqual(set(share.denominator for share in shares),
+                         set([shares.count()]))
@@ -0,0 +1,61 @@
+import socket
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from argus import webhooks
+from argus.forms import WebhookForm
+from argus.models import Group
+
+
+class AddressTestCase(SimpleTestCase):
+    def test_is_public_address(self):
+        for address in ('8.8.8.8', '93.184.216.34', '2606:4700::1111',
+                        '::ffff:8.8.8.8'):
+            self.assertTrue(webhooks.is_public_address(address), address)
+        for address in ('127.0.0.1', '10.1.2.3', '172.16.0.1',
+                        '172.31.255.255', '192.168.1.1', '169.254.169.254',
+                        '0.0.0.0', '100.64.0.1', '224.0.0.1',
+                        '255.255.255.255', '::1', '::', 'fe80::1%eth0',
+                        'fd00::1', 'ff02::1', '::ffff:127.0.0.1'):
+            self.assertFalse(webhooks.is_public_address(address), address)
+
+    def test_check_url(self):
+        with self.assertRaises(webhooks.UnsafeAddress):
+            webhooks.check_url('http://127.0.0.1:8000/hook')
+        with self.assertRaises(webhooks.UnsafeAddress):
+            webhooks.check_url('https://[::1]/hook')
+        with self.assertRaises(ValueError):
+            webhooks.check_url('ftp://8.8.8.8/hook')
+        webhooks.check_url('https://8.8.8.8/hook')
+
+    @override_settings(ARGUS_WEBHOOK_ALLOWED_HOSTS=['127.0.0.1'])
+    def test_check_url__allowed_host(self):
+        webhooks.check_url('http://127.0.0.1:8000/hook')
+
+    def test_form__rejects_local_url(self):
+        form = WebhookForm(Group(), data={'url': 'http://127.0.0.1/hook'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('url', form.errors)
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.url = 'http://127.0.0.1:{}/hook'.format(
+            self.server.getsockname()[1])
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_post__refuses_local_peer(self):
+        pool = webhooks.ConnectionPool(timeout=1)
+        with self.assertRaises(webhooks.UnsafeAddress):
+            pool.post(self.url, b'{}', {})
+        # Nothing was sent before the connection was dropped.
+        client, _ = self.server.accept()
+        client.settimeout(1)
+        self.assertEqual(client.recv(1024), b'')
+        client.close()
@@ -0,0 +1,122 @@
+"""
+Throttling of group password checks.
+
+Each password check runs a full password hash, so attempts are limited per
+group and per client IP before any hashing happens. Limits are set with
+``ARGUS_LOGIN_THROTTLE``, a dict mapping ``'group'`` and ``'ip'`` to
+``(attempts, seconds)`` tuples.
+
+"""
+import logging
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'group': (50, 300),
+    'ip': (20, 300),
+}
+
+
+def _incr(key, timeout):
+    """Increments a cache counter, creating it if needed; returns it."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+class SlidingWindow(object):
+    """
+    Approximate sliding window counter kept in the cache: the count is the
+    current fixed window's hits plus the previous window's hits weighted by
+    how much of it still overlaps the sliding window.
+
+    Hits are counted before they are judged, with the cache's increment,
+    so that concurrent hits each see the others. That takes a cache whose
+    increment is atomic, such as memcached.
+
+    """
+    def __init__(self, scope, limit, seconds):
+        self.scope = scope
+        self.limit = limit
+        self.seconds = seconds
+
+    def _keys(self, ident, timestamp):
+        index = int(timestamp // self.seconds)
+        key = 'argus:throttle:{}:{}:{}'
+        return (key.format(self.scope, ident, index),
+                key.format(self.scope, ident, index - 1))
+
+    def _overlap(self, timestamp):
+        return 1 - (timestamp % self.seconds) / float(self.seconds)
+
+    def hit(self, ident):
+        """Counts a hit; returns whether it is within the limit."""
+        timestamp = time()
+        current, previous = self._keys(ident, timestamp)
+        hits = _incr(current, self.seconds * 2)
+        previous_hits = cache.get(previous, 0)
+        return hits + previous_hits * self._overlap(timestamp) <= self.limit
+
+    def undo(self, ident):
+        """Takes back a hit."""
+        current = self._keys(ident, time())[0]
+        try:
+            cache.decr(current)
+        except ValueError:
+            # The window has moved on since the hit.
+            pass
+
+
+class LoginThrottle(object):
+    def _windows(self):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(getattr(settings, 'ARGUS_LOGIN_THROTTLE', {}))
+        return dict((scope, SlidingWindow(scope, *limit))
+                    for scope, limit in limits.items())
+
+    def _identities(self, group, request):
+        identities = [('group', group.pk)]
+        if request is not None and request.META.get('REMOTE_ADDR'):
+            identities.append(('ip', request.META['REMOTE_ADDR']))
+        return identities
+
+    def allow(self, group, request=None):
+        """
+        Returns whether a password check for ``group`` may go ahead, and
+        counts it if so. Blocked attempts aren't counted against the
+        windows, so a blocked client is let back in once its earlier
+        attempts age out.
+
+        """
+        windows = self._windows()
+        identities = self._identities(group, request)
+        counted = []
+        for scope, ident in identities:
+            allowed = windows[scope].hit(ident)
+            counted.append((scope, ident))
+            if not allowed:
+                for counted_scope, counted_ident in counted:
+                    windows[counted_scope].undo(counted_ident)
+                _incr('argus:throttle:blocked:{}'.format(scope), None)
+                logger.warning("Blocked password check for group %s "
+                               "(%s limit for %s)", group.pk, scope, ident)
+                return False
+        return True
+
+    def blocked_counts(self):
+        keys = dict(('argus:throttle:blocked:{}'.format(scope), scope)
+                    for scope in self._windows())
+        values = cache.get_many(keys.keys())
+        return dict((scope, values.get(key, 0))
+                    for key, scope in keys.items())
+
+
+login_throttle = LoginThrottle()
@@ -8,7 +8,12 @@ from argus.views import (PartyDetailView, GroupDetailView,
                          GroupPasswordResetConfirmView, GroupEmailConfirmView,
                          GroupLogoutView, GroupRelatedCreateView,
                          TransactionUpdateView, CategoryDetailView,
-                         GroupRelatedUpdateView)
+                         GroupRelatedUpdateView, InstrumentationStatsView,
+                         TransactionFormView, ReceiptView,
+                         TransactionSearchView, ArchiveView,
+                         ArchiveExportView, GroupDirectoryView,
+                         PartyStatementView, TransactionBulkView,
+                         AuditLogView, GroupWebhooksView)
 
 
 urlpatterns = patterns('',
@@ -18,6 +23,12 @@ urlpatterns = patterns('',
     url(r'^logout/$',
         GroupLogoutView.as_view(),
         name='argus_group_logout'),
+    url(r'^_argus/stats/$',
+        InstrumentationStatsView.as_view(),
+        name='argus_instrumentation_stats'),
+    url(r'^_argus/groups/$',
+        GroupDirectoryView.as_view(),
+        name='argus_group_directory'),
 
     url(r'^(?P<group_slug>{})/$'.format(Group.SLUG_REGEX),
         GroupDetailView.as_view(),
@@ -28,6 +39,9 @@ urlpatterns = patterns('',
     url(r'^(?P<slug>{})/edit/change_password/$'.format(Group.SLUG_REGEX),
         GroupChangePasswordView.as_view(),
         name='argus_group_change_password'),
+    url(r'^(?P<slug>{})/edit/webhooks/$'.format(Group.SLUG_REGEX),
+        GroupWebhooksView.as_view(),
+        name='argus_group_webhooks'),
     url(r'^(?P<slug>{})/login/$'.format(Group.SLUG_REGEX),
         GroupLoginView.as_view(),
         name='argus_group_login'),
@@ -54,6 +68,9 @@ urlpatterns = patterns('',
     url(r'^(?P<group_slug>{})/m/(?P<pk>\d+)/$'.format(Group.SLUG_REGEX),
         PartyDetailView.as_view(),
         name='argus_party_detail'),
+    url(r'^(?P<group_slug>{})/m/(?P<pk>\d+)/statement/$'.format(Group.SLUG_REGEX),
+        PartyStatementView.as_view(),
+        name='argus_party_statement'),
     url(r'^(?P<group_slug>{})/m/(?P<pk>\d+)/edit/$'.format(Group.SLUG_REGEX),
         GroupRelatedUpdateView.as_view(template_name="argus/party_form.html",
                                        context_object_name="party",
@@ -74,7 +91,28 @@ urlpatterns = patterns('',
                                        model=Category),
         name='argus_category_update'),
 
+    url(r'^(?P<group_slug>{})/transaction/new/$'.format(Group.SLUG_REGEX),
+        TransactionFormView.as_view(),
+        name='argus_transaction_form'),
+    url(r'^(?P<group_slug>{})/transaction/bulk/$'.format(Group.SLUG_REGEX),
+        TransactionBulkView.as_view(),
+        name='argus_transaction_bulk'),
     url(r'^(?P<group_slug>{})/transaction/(?P<pk>\d+)/$'.format(Group.SLUG_REGEX),
         TransactionUpdateView.as_view(),
         name='argus_transaction_update'),
+    url(r'^(?P<group_slug>{})/search/$'.format(Group.SLUG_REGEX),
+        TransactionSearchView.as_view(),
+        name='argus_transaction_search'),
+    url(r'^(?P<group_slug>{})/archive/$'.format(Group.SLUG_REGEX),
+        ArchiveView.as_view(),
+        name='argus_archive'),
+    url(r'^(?P<group_slug>{})/archive/export/$'.format(Group.SLUG_REGEX),
+        ArchiveExportView.as_view(),
+        name='argus_archive_export'),
+    url(r'^(?P<group_slug>{})/history/$'.format(Group.SLUG_REGEX),
+        AuditLogView.as_view(),
+        name='argus_audit_log'),
+    url(r'^(?P<group_slug>{})/receipt/(?P<pk>\d+)/(?P<variant>image|thumbnail|preview)/$'.format(Group.SLUG_REGEX),
+        ReceiptView.as_view(),
+        name='argus_receipt'),
 )
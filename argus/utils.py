@@ -1,9 +1,87 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
 from django.middleware.csrf import rotate_token
+from django.template import loader
+from django.utils.crypto import constant_time_compare
 
-from argus.models import Group
+from argus.models import Group, password_fingerprint
+
+
+AUTH_COOKIE_NAME = 'argus_groups'
+AUTH_COOKIE_SALT = 'argus.utils.auth_cookie'
+
+
+def cookie_auth_enabled():
+    """
+    With ``ARGUS_SIGNED_COOKIE_AUTH = True``, the groups a browser has
+    logged into are kept in a signed cookie instead of the session, so
+    checking them needs no database access. Each group is stored with its
+    password's fingerprint, so changing the password logs everyone out.
+    The cookie expires after ``ARGUS_AUTH_COOKIE_AGE`` seconds (default
+    SESSION_COOKIE_AGE).
+
+    """
+    return getattr(settings, 'ARGUS_SIGNED_COOKIE_AUTH', False)
+
+
+def get_auth_cookie_age():
+    return getattr(settings, 'ARGUS_AUTH_COOKIE_AGE',
+                   settings.SESSION_COOKIE_AGE)
+
+
+def get_auth_groups(request):
+    """
+    Returns a dict mapping the ids of the groups the request is logged
+    into to their password fingerprints, from the signed cookie.
+
+    """
+    if not hasattr(request, '_argus_auth_groups'):
+        groups = {}
+        value = request.get_signed_cookie(AUTH_COOKIE_NAME, default='',
+                                          salt=AUTH_COOKIE_SALT,
+                                          max_age=get_auth_cookie_age())
+        for item in value.split(','):
+            group_id, _, fingerprint = item.partition(':')
+            if group_id.isdigit() and fingerprint:
+                groups[int(group_id)] = fingerprint
+        request._argus_auth_groups = groups
+    return request._argus_auth_groups
+
+
+def is_logged_in(request, group_id, fingerprint):
+    if cookie_auth_enabled():
+        stored = get_auth_groups(request).get(group_id)
+        return (stored is not None and
+                constant_time_compare(stored, fingerprint))
+    return request.session.get(Group.SESSION_KEY) == group_id
+
+
+def save_auth_cookie(request, response):
+    """Writes changes made by login and logout to the response."""
+    if not getattr(request, '_argus_auth_changed', False):
+        return response
+    groups = get_auth_groups(request)
+    if groups:
+        value = ','.join('{}:{}'.format(group_id, fingerprint)
+                         for group_id, fingerprint in sorted(groups.items()))
+        response.set_signed_cookie(AUTH_COOKIE_NAME, value,
+                                   salt=AUTH_COOKIE_SALT,
+                                   max_age=get_auth_cookie_age(),
+                                   secure=settings.SESSION_COOKIE_SECURE,
+                                   httponly=True)
+    else:
+        response.delete_cookie(AUTH_COOKIE_NAME)
+    return response
 
 
 def login(request, group):
+    if cookie_auth_enabled():
+        # Other groups stay logged in.
+        get_auth_groups(request)[group.pk] = password_fingerprint(
+            group.password)
+        request._argus_auth_changed = True
+        rotate_token(request)
+        return
     if Group.SESSION_KEY in request.session:
         if request.session[Group.SESSION_KEY] != group.pk:
             # If someone is logged in as a different group, create a new,
@@ -16,4 +94,23 @@ def login(request, group):
 
 
 def logout(request):
+    if cookie_auth_enabled():
+        request._argus_auth_groups = {}
+        request._argus_auth_changed = True
     request.session.flush()
+
+
+def render_mail(subject_template_name, body_template_name,
+                html_email_template_name, context, to):
+    """Renders an email from templates, ready to send."""
+    subject = loader.render_to_string(subject_template_name, context)
+    # Email subject *must not* contain newlines
+    subject = ''.join(subject.splitlines())
+    body = loader.render_to_string(body_template_name, context)
+    message = EmailMultiAlternatives(subject, body,
+                                     settings.DEFAULT_FROM_EMAIL, to)
+    if html_email_template_name:
+        message.attach_alternative(
+            loader.render_to_string(html_email_template_name, context),
+            'text/html')
+    return message
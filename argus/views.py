@@ -1,34 +1,123 @@
+import csv
+from wsgiref.util import FileWrapper
+
 from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.forms import SetPasswordForm
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.db.models import Q
 from django.forms.models import modelform_factory
-from django.http import Http404, HttpResponseRedirect
+from django.http import (Http404, HttpResponseRedirect, JsonResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
-from django.template import loader
+from django.utils.encoding import force_str
+from django.utils.http import is_safe_url
+from django.utils.translation import ungettext
 from django.views.generic import (DetailView, TemplateView, RedirectView,
-                                  UpdateView, FormView, CreateView)
+                                  UpdateView, FormView, CreateView, View)
 from django.views.generic.edit import BaseUpdateView
 
 from argus.forms import (GroupForm, GroupAuthenticationForm,
                          GroupChangePasswordForm, GroupRelatedForm,
-                         TransactionForm, GroupCreateFormSet)
-from argus.models import Party, Group, Transaction, Category
+                         TransactionForm, GroupCreateFormSet,
+                         TransactionSearchForm, TransactionBulkForm,
+                         WebhookForm)
+from argus import receipts, search
+from argus.concurrency import run_concurrently
+from argus.instrumentation import InstrumentedViewMixin, registry
+from argus.models import (Party, Group, Transaction, Category, IdempotencyKey,
+                          Receipt, ArchivedTransaction, AuditEntry,
+                          GroupSummary, Share, VersionConflict,
+                          deferred_changes, get_group_route,
+                          invalidate_group_route, password_fingerprint)
+from argus.replicas import ReplicaReadMixin, choose_replica
+from argus.sharding import atomic
+from argus.statements import InvalidCursor, Statement
+from argus.throttle import login_throttle
 from argus.tokens import token_generators
-from argus.utils import login, logout
+from argus.utils import (cookie_auth_enabled, is_logged_in, login, logout,
+                         render_mail, save_auth_cookie)
+
+
+def _auth_needed(request, group_id, fingerprint):
+    if not fingerprint or is_logged_in(request, group_id, fingerprint):
+        return False
+    # Checked last, since it loads the session.
+    return not (request.user.is_authenticated() and
+                request.user.is_superuser)
 
 
 def _group_auth_needed(request, group):
-    if request.user.is_authenticated() and request.user.is_superuser:
+    return _auth_needed(request, group.pk,
+                        password_fingerprint(group.password))
+
+
+def _route_auth_needed(request, route):
+    """
+    Decides from the cached route alone, so that requests which will be
+    turned away don't have to touch the database.
+
+    """
+    return _auth_needed(request, route.group_id, route.password_fingerprint)
+
+
+def _get_route_or_404(slug):
+    route = get_group_route(slug)
+    if route is None:
+        raise Http404("Group does not exist.")
+    return route
+
+
+def _stale_route_auth_needed(request, route, group):
+    """
+    Re-checks authorization against the loaded group in case the route it
+    was first checked against was out of date.
+
+    """
+    if (group.pk == route.group_id and
+            password_fingerprint(group.password) ==
+            route.password_fingerprint):
         return False
-    if group.password:
-        auth_group_id = request.session.get(Group.SESSION_KEY)
-        if auth_group_id is None or auth_group_id != group.pk:
-            return True
-    return False
+    invalidate_group_route(route.slug)
+    return _group_auth_needed(request, group)
+
+
+def _fragment_cached(name, *vary_on):
+    return cache.get(make_template_fragment_key(name, vary_on)) is not None
+
+
+def _pk_or_blank(obj):
+    # What a cache tag's vary_on resolves to for a missing variable.
+    return obj.pk if obj is not None else ''
+
+
+def _party_totals(queryset, field):
+    return dict(queryset.values_list(field).annotate(models.Sum('amount')))
+
+
+def _set_balances(members, paid, received, shares):
+    for member in members:
+        member._balance = sum((member.opening_balance,
+                               shares.get(member.pk, 0),
+                               -paid.get(member.pk, 0),
+                               received.get(member.pk, 0)))
+
+
+def _for_transaction_log(transactions):
+    # Everything the transaction log shows, including the group of each
+    # linked party and category (for their URLs), in a fixed number of
+    # queries however many rows there are.
+    return transactions.select_related(
+        'paid_by__group', 'paid_to__group', 'category__group'
+    ).prefetch_related('shares', 'receipts')
+
+
+_SUMMARY_CACHE = Group._meta.get_field_by_name('summary')[0].get_cache_name()
 
 
 def _group_auth_redirect(group):
@@ -63,20 +152,9 @@ class TokenView(DetailView):
         return context
 
     def send_email(self, email_context):
-        from_email = settings.DEFAULT_FROM_EMAIL
-        subject = loader.render_to_string(self.subject_template_name,
-                                          email_context)
-            # Email subject *must not* contain newlines
-        subject = ''.join(subject.splitlines())
-        body = loader.render_to_string(self.body_template_name, email_context)
-
-        if self.html_email_template_name:
-            html_email = loader.render_to_string(self.html_email_template_name,
-                                                 email_context)
-        else:
-            html_email = None
-        send_mail(subject, body, from_email, [email_context['email']],
-                  html_message=html_email)
+        render_mail(self.subject_template_name, self.body_template_name,
+                    self.html_email_template_name, email_context,
+                    [email_context['email']]).send()
 
 
 class GroupPasswordResetTokenView(TokenView):
@@ -140,7 +218,7 @@ class GroupEmailConfirmView(DetailView):
         if not self.generator.check_token(self.object, self.kwargs['token']):
             raise Http404("Token invalid or expired.")
         self.object.confirmed_email = self.object.email
-        self.object.save()
+        self.object.save(update_fields=['confirmed_email'])
         context = self.get_context_data(object=self.object)
         return self.render_to_response(context)
 
@@ -152,10 +230,15 @@ class GroupLoginView(FormView):
     def get_form_kwargs(self):
         kwargs = super(GroupLoginView, self).get_form_kwargs()
 
-        qs = Group.objects.filter(slug=self.kwargs['slug'])
+        route = _get_route_or_404(self.kwargs['slug'])
+        if not route.has_password:
+            raise Http404("Group doesn't have a password")
+
+        qs = Group.objects.filter(pk=route.group_id, slug=route.slug)
         try:
             self.object = qs.get()
         except Group.DoesNotExist:
+            invalidate_group_route(route.slug)
             raise Http404("Group doesn't exist")
 
         if not self.object.password:
@@ -170,7 +253,8 @@ class GroupLoginView(FormView):
     def form_valid(self, form):
         login(self.request, form.group)
         self.object = form.group
-        return super(GroupLoginView, self).form_valid(form)
+        return save_auth_cookie(
+            self.request, super(GroupLoginView, self).form_valid(form))
 
     def get_success_url(self):
         return self.object.get_absolute_url()
@@ -184,6 +268,10 @@ class GroupLoginView(FormView):
 class GroupLogoutView(RedirectView):
     permanent = False
 
+    def get(self, request, *args, **kwargs):
+        return save_auth_cookie(request, super(GroupLogoutView, self).get(
+            request, *args, **kwargs))
+
     def get_redirect_url(self, *args, **kwargs):
         logout(self.request)
         return '/'
@@ -213,10 +301,17 @@ class GroupCreateView(CreateView):
 
 
 class TransactionFormMixin(object):
+    # If True, GET requests render without the transaction form, which is
+    # loaded from TransactionFormView when needed instead.
+    lazy_transaction_form = False
+
     def dispatch(self, request, *args, **kwargs):
         if request.method.lower() in self.http_method_names:
+            route = _get_route_or_404(self.kwargs['group_slug'])
+            if _route_auth_needed(request, route):
+                return _group_auth_redirect(route)
             self.group = self.get_group()
-            if _group_auth_needed(request, self.group):
+            if _stale_route_auth_needed(request, route, self.group):
                 return _group_auth_redirect(self.group)
         return super(TransactionFormMixin, self).dispatch(request, *args,
                                                           **kwargs)
@@ -235,26 +330,58 @@ class TransactionFormMixin(object):
         }
         if self.request.method == 'POST':
             kwargs['data'] = self.request.POST
+            kwargs['files'] = self.request.FILES
 
         return TransactionForm(**kwargs)
 
     def get_context_data(self, **kwargs):
         context = super(TransactionFormMixin, self).get_context_data(**kwargs)
-        form = self.get_transaction_form()
-        context['form'] = form
+        if self.request.method == 'POST' or not self.lazy_transaction_form:
+            context['form'] = self.get_transaction_form()
         context['group'] = self.group
         return context
 
+    def get_idempotency_key(self):
+        key = (self.request.META.get('HTTP_IDEMPOTENCY_KEY') or
+               self.request.POST.get('idempotency_key'))
+        if key and len(key) <= IdempotencyKey.KEY_LENGTH:
+            return key
+        return None
+
+    def get_success_url(self):
+        return self.group.get_absolute_url()
+
     def post(self, request, *args, **kwargs):
+        key = self.get_idempotency_key()
+        if key:
+            replay = IdempotencyKey.objects.live().filter(group=self.group,
+                                                          key=key).first()
+            if replay is not None:
+                return HttpResponseRedirect(replay.location)
         context = self.get_context_data(**kwargs)
         form = context['form']
         if form.is_valid():
-            form.save()
-            return HttpResponseRedirect(self.group.get_absolute_url())
+            try:
+                with deferred_changes(), atomic():
+                    if key:
+                        record, claimed = IdempotencyKey.objects.claim(
+                            self.group, key)
+                        if not claimed:
+                            return HttpResponseRedirect(record.location)
+                    form.save()
+                    success_url = self.get_success_url()
+                    if key:
+                        record.location = success_url
+                        record.save(update_fields=['location'])
+            except VersionConflict:
+                form.version_conflict()
+            else:
+                return HttpResponseRedirect(success_url)
         return self.render_to_response(context)
 
 
-class TransactionUpdateView(TransactionFormMixin, TemplateView):
+class TransactionUpdateView(InstrumentedViewMixin, TransactionFormMixin,
+                            TemplateView):
     template_name = 'argus/transaction_update.html'
 
     def get_transaction_form(self, pk=None):
@@ -262,25 +389,95 @@ class TransactionUpdateView(TransactionFormMixin, TemplateView):
         return super(TransactionUpdateView, self).get_transaction_form(pk)
 
 
-class TransactionListView(TransactionFormMixin, TemplateView):
+class TransactionFormView(InstrumentedViewMixin, TransactionFormMixin,
+                          TemplateView):
+    http_method_names = ['get']
+    template_name = 'argus/transaction_form.html'
+
+
+class TransactionListView(InstrumentedViewMixin, TransactionFormMixin,
+                          ReplicaReadMixin, TemplateView):
     template_name = 'argus/transaction_list.html'
 
+    @property
+    def lazy_transaction_form(self):
+        return getattr(settings, 'ARGUS_LAZY_TRANSACTION_FORM', False)
+
     def get_group(self):
         qs = Group.objects.prefetch_related('parties', 'categories')
         return get_object_or_404(qs, slug=self.kwargs['group_slug'])
 
     def get_transactions(self):
-        return Transaction.objects.filter(paid_by__group=self.group
-                                          ).order_by('-paid_at'
-                                          ).prefetch_related('shares')
+        return _for_transaction_log(Transaction.objects.filter(
+            paid_by__group=self.group).order_by('-paid_at'))
+
+    @property
+    def concurrent_reads(self):
+        return getattr(settings, 'ARGUS_CONCURRENT_READS', False)
 
     def get_context_data(self, **kwargs):
         context = super(TransactionListView, self).get_context_data(**kwargs)
         context['recent_transactions'] = self.get_transactions()
         context['members'] = [p for p in self.group.parties.all()
                               if p.party_type == Party.MEMBER]
+        if not self.concurrent_reads and not _fragment_cached(
+                'argus_group_sidebar', self.group.pk,
+                self.group.change_version, len(context['members'])):
+            # Balances for the sidebar, in three queries rather than three
+            # per member.
+            group = self.group
+            _set_balances(
+                context['members'],
+                _party_totals(Transaction.objects.filter(
+                    paid_by__group=group), 'paid_by'),
+                _party_totals(Transaction.objects.filter(
+                    paid_to__group=group), 'paid_to'),
+                _party_totals(Share.objects.filter(party__group=group),
+                              'party'))
         return context
 
+    def get_concurrent_reads(self, context):
+        """
+        Returns a dict mapping names to functions for the reads the page
+        needs, leaving out those only needed by fragments that are cached.
+
+        """
+        group = self.group
+        version = group.change_version
+        reads = {}
+        # Must match the vary_on arguments of the templates' cache tags.
+        if not _fragment_cached('argus_transaction_log', group.pk, version,
+                                _pk_or_blank(context.get('party')),
+                                _pk_or_blank(context.get('category'))):
+            transactions = self.get_transactions()
+            reads['recent_transactions'] = lambda: list(transactions[:10])
+        if not _fragment_cached('argus_group_sidebar', group.pk, version,
+                                len(context['members'])):
+            reads['paid'] = lambda: _party_totals(
+                Transaction.objects.filter(paid_by__group=group), 'paid_by')
+            reads['received'] = lambda: _party_totals(
+                Transaction.objects.filter(paid_to__group=group), 'paid_to')
+            reads['shares'] = lambda: _party_totals(
+                Share.objects.filter(party__group=group), 'party')
+            reads['summary'] = lambda: GroupSummary.objects.filter(
+                group=group).first()
+        return reads
+
+    def apply_concurrent_reads(self, context, results):
+        if 'recent_transactions' in results:
+            context['recent_transactions'] = results['recent_transactions']
+        if 'summary' in results:
+            _set_balances(context['members'], results['paid'],
+                          results['received'], results['shares'])
+            setattr(self.group, _SUMMARY_CACHE, results['summary'])
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.concurrent_reads:
+            results = run_concurrently(self.get_concurrent_reads(context))
+            self.apply_concurrent_reads(context, results)
+        return super(TransactionListView, self).render_to_response(
+            context, **response_kwargs)
+
 
 class GroupDetailView(TransactionListView):
     template_name = 'argus/group_detail.html'
@@ -299,12 +496,24 @@ class GroupRelatedDetailView(TransactionListView):
         context_object_name = getattr(self, 'context_object_name',
                                       self.model._meta.verbose_name.lower())
         context[context_object_name] = self.object
-        context['balance'] = self.get_balance()
+        if not self.concurrent_reads:
+            context['balance'] = self.get_balance()
         return context
 
     def get_balance(self):
         raise NotImplementedError
 
+    def get_concurrent_reads(self, context):
+        reads = super(GroupRelatedDetailView, self).get_concurrent_reads(
+            context)
+        reads['balance'] = self.get_balance
+        return reads
+
+    def apply_concurrent_reads(self, context, results):
+        super(GroupRelatedDetailView, self).apply_concurrent_reads(context,
+                                                                   results)
+        context['balance'] = results['balance']
+
 
 class PartyDetailView(GroupRelatedDetailView):
     model = Party
@@ -314,11 +523,39 @@ class PartyDetailView(GroupRelatedDetailView):
         return self.object.balance
 
     def get_transactions(self):
-        return Transaction.objects.filter(Q(shares__party=self.object) |
-                                          Q(paid_by=self.object) |
-                                          Q(paid_to=self.object)
-                                          ).order_by('-paid_at'
-                                          ).distinct()
+        return _for_transaction_log(Transaction.objects.filter(
+            Q(shares__party=self.object) | Q(paid_by=self.object) |
+            Q(paid_to=self.object)).order_by('-paid_at').distinct())
+
+
+class PartyStatementView(GroupRelatedDetailView):
+    """
+    A party's transactions oldest first, with the running balance after
+    each one, a page at a time.
+
+    """
+    model = Party
+    template_name = 'argus/party_statement.html'
+    http_method_names = ['get']
+    lazy_transaction_form = True
+    concurrent_reads = False
+
+    def get_balance(self):
+        return self.object.balance
+
+    def get_context_data(self, **kwargs):
+        context = super(PartyStatementView, self).get_context_data(**kwargs)
+        after = self.request.GET.get('after')
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                raise Http404
+        try:
+            context['statement'] = Statement(self.object, after)
+        except InvalidCursor:
+            raise Http404
+        return context
 
 
 class CategoryDetailView(GroupRelatedDetailView):
@@ -327,13 +564,276 @@ class CategoryDetailView(GroupRelatedDetailView):
 
     def get_balance(self):
         transactions = self.get_transactions()
-        return transactions.aggregate(models.Sum('amount'))['amount__sum']
+        total = transactions.aggregate(models.Sum('amount'))['amount__sum']
+        return (total or 0) + self.object.archived_total
 
     def get_transactions(self):
-        return self.object.transactions.order_by('-paid_at')
+        return _for_transaction_log(
+            self.object.transactions.order_by('-paid_at'))
+
+
+class ArchiveView(TransactionListView):
+    """
+    Pages through transactions moved to the archive by ledger compaction.
 
+    """
+    template_name = 'argus/archive.html'
+    http_method_names = ['get']
+    lazy_transaction_form = True
+    concurrent_reads = False
+    paginate_by = 50
 
-class GroupUpdateView(UpdateView):
+    def get_archived_transactions(self):
+        return ArchivedTransaction.objects.filter(
+            paid_by__group=self.group
+        ).order_by('-paid_at', '-pk').prefetch_related('shares')
+
+    def get_context_data(self, **kwargs):
+        context = super(ArchiveView, self).get_context_data(**kwargs)
+        paginator = Paginator(self.get_archived_transactions(),
+                              self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        # Names are looked up here rather than by looping over the group's
+        # parties for every row in the template.
+        parties = dict((party.pk, party) for party in
+                       self.group.parties.all())
+        categories = dict((category.pk, category) for category in
+                          self.group.categories.all())
+        transactions = list(page.object_list)
+        for transaction in transactions:
+            transaction.paid_by = parties[transaction.paid_by_id]
+            transaction.paid_to = parties.get(transaction.paid_to_id)
+            transaction.category = categories[transaction.category_id]
+            transaction.sharers = sorted(
+                ((parties[share.party_id], share)
+                 for share in transaction.shares.all()),
+                key=lambda sharer: sharer[0].pk)
+        context['page_obj'] = page
+        context['archived_transactions'] = transactions
+        return context
+
+
+class AuditLogView(TransactionListView):
+    """
+    The group's audit log, newest first, paged by entry id so that deep
+    pages cost the same as the first.
+
+    """
+    template_name = 'argus/audit_log.html'
+    http_method_names = ['get']
+    lazy_transaction_form = True
+    concurrent_reads = False
+    page_size = 50
+
+    def get_entries(self, before):
+        entries = AuditEntry.objects.filter(group=self.group).order_by('-pk')
+        if before is not None:
+            entries = entries.filter(pk__lt=before)
+        return list(entries[:self.page_size + 1])
+
+    def get_context_data(self, **kwargs):
+        context = super(AuditLogView, self).get_context_data(**kwargs)
+        before = self.request.GET.get('before')
+        if before is not None:
+            try:
+                before = int(before)
+            except ValueError:
+                raise Http404
+        entries = self.get_entries(before)
+        context['before'] = before
+        context['next_cursor'] = None
+        if len(entries) > self.page_size:
+            entries = entries[:self.page_size]
+            context['next_cursor'] = entries[-1].pk
+        # Share entries are keyed by party id; show names where known.
+        names = dict((str(pk), name) for pk, name in Party.objects.filter(
+            group=self.group).values_list('pk', 'name'))
+        for entry in entries:
+            entry.rows = [
+                (names.get(key, key) if entry.model == 'share' else key,
+                 before, after)
+                for key, (before, after) in entry.changes]
+        context['entries'] = entries
+        return context
+
+
+class _Echo(object):
+    def write(self, value):
+        return value
+
+
+class ArchiveExportView(View):
+    """
+    Streams the group's archived transactions as CSV, reading them in
+    batches so that large archives aren't held in memory.
+
+    """
+    batch_size = 500
+    header = ('id', 'paid_at', 'paid_by', 'paid_to', 'memo', 'amount',
+              'category', 'split', 'notes', 'shares')
+
+    def get(self, request, *args, **kwargs):
+        route = _get_route_or_404(kwargs['group_slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
+        group = get_object_or_404(Group.objects.only('slug', 'password'),
+                                  pk=route.group_id)
+        if _stale_route_auth_needed(request, route, group):
+            return _group_auth_redirect(group)
+        alias = choose_replica(request, route.group_id)
+        response = StreamingHttpResponse(self.rows(route.group_id, alias),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = (
+            'attachment; filename="{}-archive.csv"'.format(route.slug))
+        return response
+
+    def rows(self, group_id, using=None):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.header)
+        parties = dict(Party.objects.using(using).filter(
+            group=group_id).values_list('pk', 'name'))
+        categories = dict(Category.objects.using(using).filter(
+            group=group_id).values_list('pk', 'name'))
+        transactions = ArchivedTransaction.objects.using(using).filter(
+            paid_by__group=group_id).order_by('pk').prefetch_related('shares')
+        last_pk = 0
+        while True:
+            batch = list(transactions.filter(pk__gt=last_pk
+                                             )[:self.batch_size])
+            if not batch:
+                break
+            for transaction in batch:
+                shares = u";".join(
+                    u"{}:{}".format(parties[share.party_id], share.amount)
+                    for share in transaction.shares.all())
+                row = (transaction.pk, transaction.paid_at.isoformat(),
+                       parties[transaction.paid_by_id],
+                       parties.get(transaction.paid_to_id, u""),
+                       transaction.memo, transaction.amount,
+                       categories[transaction.category_id],
+                       transaction.split, transaction.notes, shares)
+                yield writer.writerow([force_str(value) for value in row])
+            last_pk = batch[-1].pk
+
+
+class ReceiptView(View):
+    """
+    Serves receipt images. Files are named by content hash and never
+    change, so they can be cached indefinitely (privately, since groups
+    may be password protected).
+
+    """
+    def get(self, request, *args, **kwargs):
+        route = _get_route_or_404(kwargs['group_slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
+        group = get_object_or_404(Group.objects.only('slug', 'password'),
+                                  pk=route.group_id)
+        if _stale_route_auth_needed(request, route, group):
+            return _group_auth_redirect(group)
+        receipt = get_object_or_404(
+            Receipt.objects.only(kwargs['variant'], 'sha1'),
+            pk=kwargs['pk'],
+            transaction__paid_by__group=route.group_id)
+        field = getattr(receipt, kwargs['variant'])
+        if not field:
+            raise Http404("Receipt is still being processed.")
+        etag = '"{}-{}"'.format(receipt.sha1, kwargs['variant'])
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            content_type = receipts.content_type(field.name)
+            response = StreamingHttpResponse(
+                FileWrapper(field.storage.open(field.name, 'rb')),
+                content_type=content_type or 'application/octet-stream')
+            if content_type is None:
+                response['Content-Disposition'] = 'attachment'
+            response['Content-Length'] = field.size
+        response['ETag'] = etag
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['Cache-Control'] = 'private, max-age=31536000'
+        return response
+
+
+class TransactionBulkView(InstrumentedViewMixin, View):
+    """
+    Applies a TransactionBulkForm action. Answers AJAX requests with JSON
+    and redirects others back to the page they came from, with the outcome
+    as a message.
+
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        route = _get_route_or_404(kwargs['group_slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
+        group = get_object_or_404(Group, pk=route.group_id)
+        if _stale_route_auth_needed(request, route, group):
+            return _group_auth_redirect(group)
+        form = TransactionBulkForm(group, request.POST)
+        if not form.is_valid():
+            if request.is_ajax():
+                return JsonResponse({'errors': form.errors}, status=400)
+            for errors in form.errors.values():
+                for error in errors:
+                    messages.error(request, error)
+            return HttpResponseRedirect(self.get_redirect_url(group))
+        count = form.save()
+        if request.is_ajax():
+            return JsonResponse({'count': count})
+        messages.success(request, ungettext(
+            "Updated {} transaction.", "Updated {} transactions.", count
+        ).format(count))
+        return HttpResponseRedirect(self.get_redirect_url(group))
+
+    def get_redirect_url(self, group):
+        referer = self.request.META.get('HTTP_REFERER')
+        if is_safe_url(referer, host=self.request.get_host()):
+            return referer
+        return group.get_absolute_url()
+
+
+class TransactionSearchView(InstrumentedViewMixin, View):
+    def get(self, request, *args, **kwargs):
+        route = _get_route_or_404(kwargs['group_slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
+        group = get_object_or_404(Group.objects.only('slug', 'password'),
+                                  pk=route.group_id)
+        if _stale_route_auth_needed(request, route, group):
+            return _group_auth_redirect(group)
+        form = TransactionSearchForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        cd = form.cleaned_data
+        transactions = search.search(route.group_id, cd['q'],
+                                     party=cd['party'],
+                                     category=cd['category'],
+                                     start=cd['start'], end=cd['end'],
+                                     limit=cd['limit'] or 50)
+        return JsonResponse({'results': [{
+            'id': transaction.pk,
+            'memo': transaction.memo,
+            'notes': transaction.notes,
+            'amount': str(transaction.amount),
+            'paid_at': transaction.paid_at.isoformat(),
+            'paid_by': transaction.paid_by.name,
+            'paid_to': (transaction.paid_to.name
+                        if transaction.paid_to else None),
+            'category': transaction.category.name,
+            'url': reverse('argus_transaction_update',
+                           kwargs={'group_slug': route.slug,
+                                   'pk': transaction.pk}),
+        } for transaction in transactions]})
+
+
+class GroupUpdateView(InstrumentedViewMixin, UpdateView):
     model = Group
     form_class = GroupForm
     template_name = 'argus/group_update.html'
@@ -344,11 +844,21 @@ class GroupUpdateView(UpdateView):
         return kwargs
 
     def get(self, request, *args, **kwargs):
+        route = _get_route_or_404(self.kwargs['slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
         self.object = self.get_object()
-        if _group_auth_needed(request, self.object):
+        if _stale_route_auth_needed(request, route, self.object):
             return _group_auth_redirect(self.object)
         return super(BaseUpdateView, self).get(request, *args, **kwargs)
 
+    def form_valid(self, form):
+        try:
+            return super(GroupUpdateView, self).form_valid(form)
+        except VersionConflict:
+            form.version_conflict()
+            return self.form_invalid(form)
+
     def get_success_url(self):
         return reverse('argus_group_update', kwargs={'slug': self.object.slug})
 
@@ -358,20 +868,74 @@ class GroupChangePasswordView(UpdateView):
     form_class = GroupChangePasswordForm
     template_name = 'argus/group_password_change.html'
 
+    def get_form_kwargs(self):
+        kwargs = super(GroupChangePasswordView, self).get_form_kwargs()
+        kwargs['request'] = self.request
+        return kwargs
+
+    def form_valid(self, form):
+        response = super(GroupChangePasswordView, self).form_valid(form)
+        if cookie_auth_enabled():
+            # The new password logs everyone else out.
+            login(self.request, self.object)
+        return save_auth_cookie(self.request, response)
+
     def get_success_url(self):
         return reverse("argus_group_update", kwargs={'slug': self.object.slug})
 
 
+class GroupWebhooksView(InstrumentedViewMixin, TemplateView):
+    """Lists the group's webhook subscriptions, and adds and removes them."""
+    template_name = 'argus/group_webhooks.html'
+    http_method_names = ['get', 'post']
+
+    def dispatch(self, request, *args, **kwargs):
+        route = _get_route_or_404(kwargs['slug'])
+        if _route_auth_needed(request, route):
+            return _group_auth_redirect(route)
+        self.group = get_object_or_404(Group, slug=kwargs['slug'])
+        if _stale_route_auth_needed(request, route, self.group):
+            return _group_auth_redirect(self.group)
+        return super(GroupWebhooksView, self).dispatch(request, *args,
+                                                       **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(GroupWebhooksView, self).get_context_data(**kwargs)
+        context['group'] = self.group
+        context['webhooks'] = self.group.webhooks.order_by('pk')
+        if 'form' not in context:
+            context['form'] = WebhookForm(self.group)
+        return context
+
+    def post(self, request, *args, **kwargs):
+        if 'delete' in request.POST:
+            try:
+                pk = int(request.POST['delete'])
+            except ValueError:
+                raise Http404
+            webhook = get_object_or_404(self.group.webhooks, pk=pk)
+            webhook.delete()
+            return HttpResponseRedirect(request.path)
+        form = WebhookForm(self.group, request.POST)
+        if form.is_valid():
+            form.save()
+            return HttpResponseRedirect(request.path)
+        return self.render_to_response(self.get_context_data(form=form))
+
+
 class GroupRelatedFormMixin(object):
     form_class = GroupRelatedForm
 
     def dispatch(self, request, *args, **kwargs):
         if request.method.lower() in self.http_method_names:
+            route = _get_route_or_404(kwargs['group_slug'])
+            if _route_auth_needed(request, route):
+                return _group_auth_redirect(route)
             try:
                 self.group = Group.objects.get(slug=kwargs['group_slug'])
             except Group.DoesNotExist:
                 raise Http404("Group does not exist.")
-            if _group_auth_needed(request, self.group):
+            if _stale_route_auth_needed(request, route, self.group):
                 return _group_auth_redirect(self.group)
         return super(GroupRelatedFormMixin, self).dispatch(request,
                                                            *args,
@@ -392,11 +956,64 @@ class GroupRelatedFormMixin(object):
         return context
 
 
-class GroupRelatedCreateView(GroupRelatedFormMixin, CreateView):
+class GroupRelatedCreateView(InstrumentedViewMixin, GroupRelatedFormMixin,
+                             CreateView):
     def get_success_url(self):
         return self.object.group.get_absolute_url()
 
 
-class GroupRelatedUpdateView(GroupRelatedFormMixin, UpdateView):
+class GroupRelatedUpdateView(InstrumentedViewMixin, GroupRelatedFormMixin,
+                             UpdateView):
     def get_success_url(self):
         return self.object.get_absolute_url()
+
+
+class InstrumentationStatsView(View):
+    def get(self, request, *args, **kwargs):
+        if not (request.user.is_authenticated() and request.user.is_staff):
+            raise Http404
+        return JsonResponse({
+            'views': registry.as_dict(),
+            'blocked_password_checks': login_throttle.blocked_counts(),
+        })
+
+
+class GroupDirectoryView(View):
+    """
+    Lists groups with their activity counters for staff, most recently
+    active first, in a single query.
+
+    """
+    orderings = {
+        'activity': '-last_activity',
+        'transactions': '-transaction_count',
+        'spent': '-total_spent',
+    }
+    max_limit = 10000
+
+    def get(self, request, *args, **kwargs):
+        if not (request.user.is_authenticated() and request.user.is_staff):
+            raise Http404
+        ordering = self.orderings.get(request.GET.get('order'),
+                                      '-last_activity')
+        try:
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            limit = min(max(int(request.GET.get('limit', 1000)), 1),
+                        self.max_limit)
+        except ValueError:
+            return JsonResponse({'errors': 'Invalid offset or limit.'},
+                                status=400)
+        rows = GroupSummary.objects.using(choose_replica(request)
+                                          ).order_by(ordering, 'group'
+                                          ).values_list(
+            'group__slug', 'group__name', 'group__created',
+            'transaction_count', 'total_spent', 'last_activity'
+        )[offset:offset + limit]
+        return JsonResponse({'groups': [{
+            'slug': slug,
+            'name': name,
+            'created': created,
+            'transactions': count,
+            'total_spent': spent,
+            'last_activity': last_activity,
+        } for slug, name, created, count, spent, last_activity in rows]})
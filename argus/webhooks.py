@@ -0,0 +1,309 @@
+"""
+Outbound webhooks.
+
+A group can subscribe URLs to changes in its ledger. A change only marks
+the group's subscriptions as pending; the ``deliver_webhooks`` worker
+POSTs the notification once the first pending change is
+``ARGUS_WEBHOOK_COALESCE`` seconds (default 5) old, so a burst of edits
+becomes one delivery per subscription. Receivers fetch whatever they need
+from there. Connections are kept open and reused between deliveries to the
+same host. Failed deliveries are retried with exponential backoff, and
+given up after ``MAX_ATTEMPTS``; the next change starts over.
+
+Each delivery is signed: ``X-Argus-Signature`` is the hex HMAC of the
+``X-Argus-Timestamp`` header, a dot and the body, keyed with the
+subscription's secret (see ``signature``).
+
+Deliveries are only made to public addresses: a connection whose peer is
+loopback, private, link-local, multicast or otherwise reserved is closed
+before anything is sent, so a subscription can't be used to reach the
+server's own network, whatever its host resolves to at the time. Hosts
+listed in ``ARGUS_WEBHOOK_ALLOWED_HOSTS`` are exempt, for receivers that
+really are internal.
+
+"""
+import binascii
+from datetime import timedelta
+import json
+import socket
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.timezone import now
+
+try:
+    from http.client import HTTPConnection, HTTPException, HTTPSConnection
+    from urllib.parse import urlsplit
+except ImportError:
+    from httplib import HTTPConnection, HTTPException, HTTPSConnection
+    from urlparse import urlsplit
+
+
+KEY_SALT = "argus.webhooks.signature"
+EVENT = 'ledger.changed'
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 60 * 60
+MAX_ATTEMPTS = 8
+TIMEOUT = 10
+
+BLOCKED_NETWORKS = (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8',
+    '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24', '192.168.0.0/16',
+    '198.18.0.0/15', '224.0.0.0/4', '240.0.0.0/4',
+    '::/127', 'fc00::/7', 'fe80::/10', 'ff00::/8',
+)
+
+
+class UnsafeAddress(IOError):
+    pass
+
+
+def get_allowed_hosts():
+    return getattr(settings, 'ARGUS_WEBHOOK_ALLOWED_HOSTS', ())
+
+
+def _parse_address(address):
+    """Returns an IP address as (family, integer value, width in bits)."""
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    # Drop any IPv6 zone index ("fe80::1%eth0").
+    packed = socket.inet_pton(family, address.split('%')[0])
+    value = int(binascii.hexlify(packed), 16)
+    if family == socket.AF_INET6 and value >> 32 == 0xffff:
+        # IPv4-mapped; judged as the IPv4 address it stands for.
+        return socket.AF_INET, value & 0xffffffff, 32
+    return family, value, len(packed) * 8
+
+
+def _parse_network(cidr):
+    address, bits = cidr.split('/')
+    family, value, width = _parse_address(address)
+    return family, value >> (width - int(bits)), width - int(bits)
+
+
+_blocked = [_parse_network(cidr) for cidr in BLOCKED_NETWORKS]
+
+
+def is_public_address(address):
+    family, value, _ = _parse_address(address)
+    return not any(family == blocked_family and value >> shift == prefix
+                   for blocked_family, prefix, shift in _blocked)
+
+
+def check_host(host, port=None):
+    """
+    Resolves ``host`` and raises UnsafeAddress unless it is allowed or all
+    of its addresses are public. Raises socket.gaierror (an IOError) if it
+    doesn't resolve.
+
+    """
+    if host in get_allowed_hosts():
+        return
+    for info in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        address = info[4][0]
+        if not is_public_address(address):
+            raise UnsafeAddress("{} resolves to {}, which is not a public "
+                                "address".format(host, address))
+
+
+def check_url(url):
+    """
+    Checks a subscription URL when it is entered. Raises ValueError for
+    schemes other than HTTP(S), and otherwise as ``check_host``. Delivery
+    checks again, as the host may since resolve elsewhere.
+
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError("Webhooks are delivered over HTTP(S) only.")
+    check_host(parts.hostname, parts.port)
+
+
+def _check_peer(connection):
+    # Checked on the connected socket rather than by resolving again, so
+    # that the host can't resolve to something else in between.
+    if connection.host in get_allowed_hosts():
+        return
+    address = connection.sock.getpeername()[0]
+    if not is_public_address(address):
+        connection.close()
+        raise UnsafeAddress("{} connected to {}, which is not a public "
+                            "address".format(connection.host, address))
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    def connect(self):
+        HTTPConnection.connect(self)
+        _check_peer(self)
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        HTTPSConnection.connect(self)
+        _check_peer(self)
+
+
+def get_coalesce_delay():
+    return getattr(settings, 'ARGUS_WEBHOOK_COALESCE', 5)
+
+
+def signature(secret, timestamp, body):
+    value = u"{}.{}".format(timestamp, body.decode('utf-8'))
+    return salted_hmac(KEY_SALT, value, secret).hexdigest()
+
+
+def check_signature(secret, timestamp, body, signature_header):
+    """For receivers: checks a delivery's signature header."""
+    return constant_time_compare(signature(secret, timestamp, body),
+                                 signature_header)
+
+
+def _cache_key(group_id):
+    return 'argus:group-webhooks:{}'.format(group_id)
+
+
+def has_webhooks(group_id):
+    from argus.models import WebhookSubscription
+    subscribed = cache.get(_cache_key(group_id))
+    if subscribed is None:
+        subscribed = WebhookSubscription.objects.filter(
+            group=group_id).exists()
+        cache.set(_cache_key(group_id), subscribed)
+    return subscribed
+
+
+def invalidate_webhooks(group_id):
+    cache.delete(_cache_key(group_id))
+
+
+def note_ledger_change(group_id):
+    """Marks the group's subscriptions as pending delivery."""
+    from argus.models import WebhookSubscription
+    if has_webhooks(group_id):
+        WebhookSubscription.objects.filter(
+            group=group_id, pending_since__isnull=True
+        ).update(pending_since=now())
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+class ConnectionPool(object):
+    """
+    Keeps one open connection per host, reused across requests. Only
+    connects to public addresses; see the module docstring.
+
+    """
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self._connections = {}
+
+    def _connect(self, scheme, netloc):
+        cls = (_PublicHTTPSConnection if scheme == 'https' else
+               _PublicHTTPConnection)
+        return cls(netloc, timeout=self.timeout)
+
+    def post(self, url, body, headers):
+        """Returns the response status; raises IOError or HTTPException."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        while True:
+            connection = self._connections.pop(key, None)
+            reused = connection is not None
+            if not reused:
+                connection = self._connect(*key)
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (IOError, HTTPException):
+                connection.close()
+                if reused:
+                    # The server closed the idle connection; try a new one.
+                    continue
+                raise
+            if response.getheader('connection', '').lower() == 'close':
+                connection.close()
+            else:
+                self._connections[key] = connection
+            return response.status
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+def due(at=None):
+    from argus.models import WebhookSubscription
+    at = at or now()
+    return WebhookSubscription.objects.filter(
+        pending_since__lte=at - timedelta(seconds=get_coalesce_delay())
+    ).filter(
+        Q(retry_at__isnull=True) | Q(retry_at__lte=at)
+    ).select_related('group').order_by('pending_since')
+
+
+def build_payload(subscription, changed_since):
+    from argus.models import get_change_version
+    group = subscription.group
+    return json.dumps({
+        'event': EVENT,
+        'group': group.slug,
+        'group_id': group.pk,
+        'changed_since': changed_since.isoformat(),
+        'version': get_change_version(group.pk),
+    }, sort_keys=True).encode('utf-8')
+
+
+def deliver(subscription, pool):
+    """
+    Sends the subscription's pending notification. Returns True if it was
+    delivered, False if it failed and None if another worker took it.
+
+    """
+    from argus.models import WebhookSubscription
+    subscriptions = WebhookSubscription.objects.filter(pk=subscription.pk)
+    changed_since = subscription.pending_since
+    # Changes made from here on are left for the next delivery.
+    if not subscriptions.filter(pending_since=changed_since).update(
+            pending_since=None):
+        return None
+    body = build_payload(subscription, changed_since)
+    timestamp = str(int(time()))
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'argus-webhooks',
+        'X-Argus-Event': EVENT,
+        'X-Argus-Timestamp': timestamp,
+        'X-Argus-Signature': signature(subscription.secret, timestamp, body),
+    }
+    try:
+        status = pool.post(subscription.url, body, headers)
+        error = None if 200 <= status < 300 else "HTTP {}".format(status)
+    except (IOError, HTTPException) as e:
+        error = str(e) or e.__class__.__name__
+
+    if error is None:
+        subscriptions.update(attempts=0, retry_at=None, last_delivered=now(),
+                             last_error='')
+        return True
+    attempts = subscription.attempts + 1
+    if attempts >= MAX_ATTEMPTS:
+        subscriptions.update(attempts=0, retry_at=None,
+                             last_error=error[:255])
+        return False
+    # Put the notification back, unless a newer change already did.
+    subscriptions.filter(pending_since__isnull=True).update(
+        pending_since=changed_since)
+    subscriptions.update(
+        attempts=attempts,
+        retry_at=now() + timedelta(seconds=retry_delay(attempts)),
+        last_error=error[:255])
+    return False
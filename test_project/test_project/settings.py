@@ -48,6 +48,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'argus.audit.AuditMiddleware',
 )
 
 ROOT_URLCONF = 'test_project.urls'
@@ -63,9 +64,47 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Some tests write from several threads, which each need to see
+        # the same database; an in-memory one is private to a connection.
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# To try read-replica routing, copy db.sqlite3 and set ARGUS_REPLICA_DB to
+# the copy's path.
+if os.environ.get('ARGUS_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['ARGUS_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['argus.replicas.ReplicaRouter']
+    MIDDLEWARE_CLASSES += ('argus.replicas.ReplicaMiddleware',)
+    ARGUS_READ_REPLICAS = ['replica']
+
+# To try sharding, set ARGUS_SHARD_DBS to a comma-separated list of SQLite
+# paths, migrate each one (ARGUS_SHARD=shard1 manage.py migrate
+# --database=shard1, ...) and run rebalance_shards --register.
+if os.environ.get('ARGUS_SHARD_DBS'):
+    ARGUS_SHARDS = ['default']
+    for i, path in enumerate(os.environ['ARGUS_SHARD_DBS'].split(','), 1):
+        alias = 'shard{}'.format(i)
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': path,
+        }
+        ARGUS_SHARDS.append(alias)
+else:
+    # For argus.tests.test_sharding, which turns sharding on by overriding
+    # ARGUS_SHARDS. Until then the router and middleware stand aside.
+    DATABASES['shard1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard1.sqlite3'),
+    }
+DATABASE_ROUTERS = (['argus.sharding.ShardRouter'] +
+                    globals().get('DATABASE_ROUTERS', []))
+MIDDLEWARE_CLASSES += ('argus.sharding.ShardMiddleware',)
+
 # Internationalization
 # https://docs.djangoproject.com/en/dev/topics/i18n/
 